@@ -0,0 +1,105 @@
+
+# Consolidated report over many people's timesheet files. Each file is parsed
+# and reduced to a few totals in a worker process, so the work spreads over
+# all cores and only the small summaries travel back to be merged.
+
+import os
+import csv
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from archive import archived_count
+from core import format_time
+from store import read_data_file
+
+AGGREGATE_FIELDNAMES = ['Person', 'Project Name', 'Sessions', 'Total Seconds', 'Total Time (h:m:s)']
+
+def collect_paths(sources):
+    # Directories contribute their *.json files, anything else is a file name
+    # or a glob pattern
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(glob.glob(os.path.join(source, '*.json'))))
+        elif glob.has_magic(source):
+            paths.extend(sorted(glob.glob(source, recursive=True)))
+        else:
+            paths.append(source)
+    return list(dict.fromkeys(paths))
+
+def person_name(path):
+    # alice.json -> alice; alice/timesheet.json -> alice
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if stem == 'timesheet':
+        return os.path.basename(os.path.dirname(os.path.abspath(path))) or stem
+    return stem
+
+def summarize_file(path):
+    # (path, {project name: (sessions, seconds)}, error message or None).
+    # Runs in a worker process; a bad file is reported, never raised, and
+    # never salvaged: the report only reads, it writes nothing beside its inputs.
+    try:
+        data = read_data_file(path, salvage=False)
+        totals = {}
+        for project_name, project in data['projects'].items():
+            totals[project_name] = (len(project['sessions']) + archived_count(project), float(project['total_time']))
+        return path, totals, None
+    except json.JSONDecodeError as e:
+        return path, {}, f"not valid JSON ({e})"
+    except (OSError, UnicodeDecodeError) as e:
+        return path, {}, str(e)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return path, {}, f"not a timesheet file ({e!r})"
+
+def aggregate(paths, workers=None):
+    # ([(person, project name, sessions, seconds)], [(path, error message)])
+    workers = workers or os.cpu_count() or 1
+    # A few chunks per worker keeps the processes busy without paying
+    # one round trip per file
+    chunksize = max(1, len(paths) // (workers * 4))
+    rows = {}
+    errors = []
+    if workers == 1:
+        summaries = map(summarize_file, paths)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        summaries = executor.map(summarize_file, paths, chunksize=chunksize)
+    try:
+        for path, totals, error in summaries:
+            if error is not None:
+                errors.append((path, error))
+                continue
+            person = person_name(path)
+            for project_name, (sessions, seconds) in totals.items():
+                old_sessions, old_seconds = rows.get((person, project_name), (0, 0.0))
+                rows[(person, project_name)] = (old_sessions + sessions, old_seconds + seconds)
+    finally:
+        if workers != 1:
+            executor.shutdown()
+    return [(person, project_name, sessions, seconds)
+            for (person, project_name), (sessions, seconds) in sorted(rows.items())], errors
+
+def totals_by(rows, field):
+    # [(name, seconds)] summed over person (field 0) or project (field 1)
+    totals = {}
+    for row in rows:
+        totals[row[field]] = totals.get(row[field], 0.0) + row[3]
+    return sorted(totals.items())
+
+def aggregate_text(rows):
+    text = "Total time per project:\n"
+    for project_name, seconds in totals_by(rows, 1):
+        text += f" - {project_name}: {format_time(seconds)}\n"
+    text += "\nTotal time per person:\n"
+    for person, seconds in totals_by(rows, 0):
+        text += f" - {person}: {format_time(seconds)}\n"
+    text += f"\nTotal time on all projects: {format_time(sum(row[3] for row in rows))}"
+    return text
+
+def write_aggregate_csv(file_path, rows):
+    with open(file_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(AGGREGATE_FIELDNAMES)
+        writer.writerows([person, project_name, sessions, round(seconds, 3), format_time(seconds)]
+                         for person, project_name, sessions, seconds in rows)
@@ -0,0 +1,441 @@
+
+# How work is spread out, beyond the totals of the report: the median and
+# 90th percentile session length and the share of time spent paused per
+# project, and the time worked in each hour of the week.
+#
+# Every session and pause of every project, archived ones included, is
+# loaded once into flat arrays (SessionTable): one row per session, with
+# the project as an index into the list of names. The store keeps the table
+# up to date with its own commits (apply), like the timeline index, and
+# builds a new one after anything else. A query picks the sessions starting
+# in a time range and reduces them with NumPy when it is installed, sorting
+# once per table for the percentiles; otherwise the same figures come out
+# of plain Python loops over the arrays, which is slower but needs nothing.
+
+import os
+import time
+from array import array
+from functools import lru_cache
+from itertools import repeat
+
+from core import format_time
+from session_columns import NAN, SessionColumns, to_float
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# TIMESHEET_NUMPY=0 uses the pure-Python code even with NumPy installed
+USE_NUMPY = np is not None and os.environ.get('TIMESHEET_NUMPY', '1') != '0'
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+# 1 January 1970, day 0 of the epoch, was a Thursday
+EPOCH_WEEKDAY = 3
+
+class SessionTable:
+    def __init__(self):
+        self.names = []  # project names; a session's project is an index into this
+        self.codes = {}  # {project name: index in names}
+        self.projects = array('I')
+        self.starts = array('d')
+        self.ends = array('d')  # NaN while the session is open
+        self.laps = array('d')
+        self.paused = array('d')
+        self.pause_sessions = array('I')  # row of the session each pause belongs to
+        self.pause_starts = array('d')
+        self.pause_ends = array('d')  # NaN while the pause is open
+        self.open_sessions = {}  # {project name: row of its open session}
+        self.open_pauses = {}  # {project name: row of its open pause}
+        self.generation = None
+        self._cache = {}  # NumPy copies of the arrays and sort orders
+
+    def code(self, project_name):
+        code = self.codes.get(project_name)
+        if code is None:
+            code = self.codes[project_name] = len(self.names)
+            self.names.append(project_name)
+        return code
+
+    def add_sessions(self, project_name, sessions, lo, hi):
+        # Sessions lo:hi of a list of dicts or of SessionColumns
+        code = self.code(project_name)
+        first_row = len(self.starts)
+        if isinstance(sessions, SessionColumns):
+            self.projects.extend(repeat(code, hi - lo))
+            self.starts.extend(sessions.starts[lo:hi])
+            self.ends.extend(sessions.ends[lo:hi])
+            self.laps.extend(sessions.laps[lo:hi])
+            self.paused.extend(sessions.paused[lo:hi])
+            offsets = sessions.pause_offsets
+            for idx in range(lo, hi):
+                count = offsets[idx + 1] - offsets[idx]
+                if count:
+                    self.pause_sessions.extend(repeat(first_row + idx - lo, count))
+            self.pause_starts.extend(sessions.pause_starts[offsets[lo]:offsets[hi]])
+            self.pause_ends.extend(sessions.pause_ends[offsets[lo]:offsets[hi]])
+        else:
+            for idx in range(lo, hi):
+                session = sessions[idx]
+                row = len(self.starts)
+                self.projects.append(code)
+                self.starts.append(session['start_time'])
+                self.ends.append(to_float(session['end_time']))
+                self.laps.append(session['lap_time'])
+                self.paused.append(session.get('total_paused_time', 0))
+                for pause in session.get('pauses', ()):
+                    self.pause_sessions.append(row)
+                    self.pause_starts.append(pause['pause_start'])
+                    self.pause_ends.append(to_float(pause.get('pause_end')))
+        # Only the last session of a project can be open
+        last_row = len(self.starts) - 1
+        if last_row >= first_row and self.ends[last_row] != self.ends[last_row]:
+            self.open_sessions[project_name] = last_row
+            if self.pause_sessions and self.pause_sessions[-1] == last_row and self.pause_ends[-1] != self.pause_ends[-1]:
+                self.open_pauses[project_name] = len(self.pause_starts) - 1
+        self._cache.clear()
+
+    def _close_pause(self, project_name, row, end_time):
+        pause = self.open_pauses.pop(project_name, None)
+        if pause is not None:
+            self.pause_ends[pause] = end_time
+            self.paused[row] += end_time - self.pause_starts[pause]
+
+    def apply(self, records):
+        # Follows records that were just applied to the data; False for one
+        # it can't follow, and the table has to be rebuilt
+        self._cache.clear()
+        for record in records:
+            op = record['op']
+            project_name = record.get('project')
+            if op in ('start', 'resume'):
+                self.projects.append(self.code(project_name))
+                self.starts.append(record['time'])
+                self.ends.append(NAN)
+                self.laps.append(0)
+                self.paused.append(0)
+                self.open_sessions[project_name] = len(self.starts) - 1
+            elif op == 'pause':
+                self.pause_sessions.append(self.open_sessions[project_name])
+                self.pause_starts.append(record['time'])
+                self.pause_ends.append(NAN)
+                self.open_pauses[project_name] = len(self.pause_starts) - 1
+            elif op == 'resume_paused':
+                self._close_pause(project_name, self.open_sessions[project_name], record['time'])
+            elif op == 'stop':
+                row = self.open_sessions.pop(project_name)
+                self._close_pause(project_name, row, record['time'])
+                self.ends[row] = record['time']
+                self.laps[row] = record['time'] - self.starts[row] - self.paused[row]
+            elif op == 'rename':
+                if project_name not in self.codes:
+                    return False
+                new_name = record['new_name']
+                code = self.codes[new_name] = self.codes.pop(project_name)
+                self.names[code] = new_name
+                for rows in (self.open_sessions, self.open_pauses):
+                    if project_name in rows:
+                        rows[new_name] = rows.pop(project_name)
+            elif op == 'import':
+                for import_name, sessions in record['sessions'].items():
+                    self.add_sessions(import_name, sessions, 0, len(sessions))
+            else:
+                return False
+        return True
+
+    def numpy_arrays(self):
+        # Copies rather than views: a view would stop the arrays from growing
+        arrays = self._cache.get('numpy')
+        if arrays is None:
+            arrays = self._cache['numpy'] = {
+                'projects': np.array(self.projects, dtype=np.intp),
+                'starts': np.array(self.starts),
+                'ends': np.array(self.ends),
+                'laps': np.array(self.laps),
+                'paused': np.array(self.paused),
+                'pause_sessions': np.array(self.pause_sessions, dtype=np.intp),
+                'pause_starts': np.array(self.pause_starts),
+                'pause_ends': np.array(self.pause_ends),
+            }
+        return arrays
+
+    def sort_order(self, key):
+        # Rows by session length ('length'), or by project and then length
+        # ('project'); any selection of rows taken in this order is sorted too
+        order = self._cache.get(key)
+        if order is None:
+            arrays = self.numpy_arrays()
+            if key == 'project':
+                # A stable sort of the length order by project; NumPy
+                # radix-sorts 16-bit codes, several times faster than lexsort
+                order = self.sort_order('length')
+                codes = arrays['projects'][order].astype(np.uint16 if len(self.names) <= 1 << 16 else np.int32)
+                order = order[np.argsort(codes, kind='stable')]
+            else:
+                order = np.argsort(arrays['laps'])
+            self._cache[key] = order
+        return order
+
+    def hour_spans(self):
+        # numpy_hour_spans of every session and then every pause; the open
+        # ones end where they start here and are added up to now per query
+        spans = self._cache.get('hours')
+        if spans is None:
+            arrays = self.numpy_arrays()
+            starts = np.concatenate((arrays['starts'], arrays['pause_starts']))
+            ends = np.concatenate((arrays['ends'], arrays['pause_ends']))
+            spans = self._cache['hours'] = numpy_hour_spans(starts, np.where(np.isnan(ends), starts, ends))
+        return spans
+
+def build_table(data, project_sessions):
+    # project_sessions(name) is the store's, archived sessions included
+    table = SessionTable()
+    for project_name in data['projects']:
+        for sessions, lo, hi in project_sessions(project_name).blocks():
+            table.add_sessions(project_name, sessions, lo, hi)
+    return table
+
+@lru_cache(maxsize=None)
+def day_offset(day):
+    # Seconds local time is ahead of UTC on day (days since the epoch),
+    # taken at noon; on the day the clocks change, the hours before the
+    # change are an hour off
+    return time.localtime(day * DAY + DAY // 2).tm_gmtoff
+
+def quantile(values, fraction):
+    # Linear interpolation between the closest ranks of sorted values, as
+    # numpy.quantile does by default
+    if not values:
+        return None
+    position = fraction * (len(values) - 1)
+    lo = int(position)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (position - lo)
+
+def pause_ratio(paused, worked):
+    return paused / (paused + worked) if paused + worked > 0 else 0.0
+
+def analyze(table, start=None, end=None, now=None):
+    # Figures for the sessions starting in [start, end):
+    #   rows      [(project name, sessions, worked seconds, median, 90th
+    #             percentile, paused share)] of every project with finished
+    #             sessions, by name; lengths are worked time, pauses left out
+    #   overall   (sessions, worked seconds, median, 90th percentile, paused
+    #             share) over all projects
+    #   heatmap   7 lists (Monday first) of 24 worked seconds per local hour,
+    #             open sessions counted until now
+    now = time.time() if now is None else now
+    if USE_NUMPY:
+        rows, overall, heatmap = _numpy_analyze(table, start, end, now)
+    else:
+        rows, overall, heatmap = _python_analyze(table, start, end, now)
+    rows.sort(key=lambda row: (row[0].casefold(), row[0]))
+    return rows, overall, heatmap
+
+def _python_analyze(table, start, end, now):
+    lengths = {}  # {project code: [session length]}
+    paused = {}  # {project code: paused seconds}
+    intervals = []  # (start, end, +1 for work or -1 for a pause)
+    selected = bytearray(len(table.starts))
+    for row, (code, session_start, session_end, lap_time, paused_time) in enumerate(
+            zip(table.projects, table.starts, table.ends, table.laps, table.paused)):
+        if (start is not None and session_start < start) or (end is not None and session_start >= end):
+            continue
+        selected[row] = 1
+        if session_end != session_end:
+            intervals.append((session_start, now, 1))
+            continue
+        intervals.append((session_start, session_end, 1))
+        lengths.setdefault(code, []).append(lap_time)
+        paused[code] = paused.get(code, 0.0) + paused_time
+    for row, pause_start, pause_end in zip(table.pause_sessions, table.pause_starts, table.pause_ends):
+        if selected[row]:
+            intervals.append((pause_start, now if pause_end != pause_end else pause_end, -1))
+
+    rows = []
+    every_length = []
+    for code, values in lengths.items():
+        values.sort()
+        every_length.extend(values)
+        worked = sum(values)
+        rows.append((table.names[code], len(values), worked, quantile(values, 0.5), quantile(values, 0.9),
+                     pause_ratio(paused[code], worked)))
+    every_length.sort()
+    worked = sum(every_length)
+    overall = (len(every_length), worked, quantile(every_length, 0.5), quantile(every_length, 0.9),
+               pause_ratio(sum(paused.values()), worked))
+    return rows, overall, _python_heatmap(intervals)
+
+def _python_heatmap(intervals):
+    # Same method as _numpy_heatmap, one interval at a time
+    seconds = {}  # {local hour since the epoch: seconds}
+    whole = {}  # {local hour: change in the number of whole hours worked}
+    for interval_start, interval_end, weight in intervals:
+        local_start = interval_start + day_offset(int(interval_start // DAY))
+        local_end = max(local_start, interval_end + day_offset(int(interval_end // DAY)))
+        first_hour = int(local_start // HOUR)
+        last_hour = int(local_end // HOUR)
+        if first_hour == last_hour:
+            seconds[first_hour] = seconds.get(first_hour, 0.0) + weight * (local_end - local_start)
+            continue
+        seconds[first_hour] = seconds.get(first_hour, 0.0) + weight * ((first_hour + 1) * HOUR - local_start)
+        seconds[last_hour] = seconds.get(last_hour, 0.0) + weight * (local_end - last_hour * HOUR)
+        whole[first_hour + 1] = whole.get(first_hour + 1, 0) + weight
+        whole[last_hour] = whole.get(last_hour, 0) - weight
+    heatmap = [[0.0] * 24 for _ in range(7)]
+    if seconds:
+        covered = 0
+        for hour in range(min(seconds), max(seconds) + 1):
+            covered += whole.get(hour, 0)
+            worked = seconds.get(hour, 0.0) + covered * HOUR
+            if worked:
+                days, hour_of_day = divmod(hour, 24)
+                heatmap[(days + EPOCH_WEEKDAY) % 7][hour_of_day] += worked
+    # Pauses are subtracted from the hours they fell in; keep the rounding
+    # of that from showing as negative time
+    return [[max(0.0, worked) for worked in day] for day in heatmap]
+
+def _numpy_quantiles(values, firsts, counts, fraction):
+    # quantile of each group values[first:first + count] of sorted values;
+    # NaN for an empty group
+    last = np.maximum(counts - 1, 0)
+    positions = fraction * last
+    lo = np.floor(positions).astype(np.intp)
+    hi = np.minimum(lo + 1, last)
+    result = np.full(len(counts), np.nan)
+    present = counts > 0
+    lo_values = values[(firsts + lo)[present]]
+    hi_values = values[(firsts + hi)[present]]
+    result[present] = lo_values + (hi_values - lo_values) * (positions - lo)[present]
+    return result
+
+def _numpy_analyze(table, start, end, now):
+    arrays = table.numpy_arrays()
+    starts, ends, laps = arrays['starts'], arrays['ends'], arrays['laps']
+    selected = np.ones(len(starts), dtype=bool)
+    if start is not None:
+        selected &= starts >= start
+    if end is not None:
+        selected &= starts < end
+    is_open = np.isnan(ends)
+    finished = selected & ~is_open
+
+    projects = arrays['projects'][finished]
+    count = len(table.names)
+    sessions = np.bincount(projects, minlength=count)
+    worked = np.bincount(projects, weights=laps[finished], minlength=count)
+    paused = np.bincount(projects, weights=arrays['paused'][finished], minlength=count)
+    # The table's sort order, narrowed to the finished sessions in range,
+    # leaves each project's lengths sorted and next to each other
+    order = table.sort_order('project')
+    lengths = laps[order[finished[order]]]
+    firsts = np.cumsum(sessions) - sessions
+    medians = _numpy_quantiles(lengths, firsts, sessions, 0.5)
+    p90s = _numpy_quantiles(lengths, firsts, sessions, 0.9)
+    ratios = np.divide(paused, paused + worked, out=np.zeros(count), where=paused + worked > 0)
+    rows = [(table.names[code], int(sessions[code]), float(worked[code]), float(medians[code]),
+             float(p90s[code]), float(ratios[code])) for code in np.flatnonzero(sessions).tolist()]
+
+    order = table.sort_order('length')
+    lengths = laps[order[finished[order]]]
+    total_sessions = np.array([len(lengths)])
+    overall_median = _numpy_quantiles(lengths, np.zeros(1, dtype=np.intp), total_sessions, 0.5)[0]
+    overall_p90 = _numpy_quantiles(lengths, np.zeros(1, dtype=np.intp), total_sessions, 0.9)[0]
+    total_worked = float(worked.sum())
+    overall = (len(lengths), total_worked, None if np.isnan(overall_median) else float(overall_median),
+               None if np.isnan(overall_p90) else float(overall_p90), pause_ratio(float(paused.sum()), total_worked))
+
+    # Work counts for its hours and the pauses in it against them. The
+    # finished ones are in the table's hour spans already; open ones run
+    # until now.
+    pauses = selected[arrays['pause_sessions']]
+    open_pauses = np.isnan(arrays['pause_ends'])
+    weights = np.concatenate((finished, pauses & ~open_pauses)).astype(np.float64)
+    weights[len(starts):] *= -1
+    heatmap = _numpy_week(table.hour_spans(), weights)
+    open_starts = np.concatenate((starts[selected & is_open], arrays['pause_starts'][pauses & open_pauses]))
+    if len(open_starts):
+        open_weights = np.ones(len(open_starts))
+        open_weights[int((selected & is_open).sum()):] = -1
+        heatmap += _numpy_week(numpy_hour_spans(open_starts, np.full(len(open_starts), max(now, open_starts.max()))),
+                               open_weights)
+    return rows, overall, np.maximum(heatmap, 0.0).reshape(7, 24).tolist()
+
+def numpy_hour_spans(starts, ends):
+    # (first hour, last hour, seconds in the first, seconds in the last) of
+    # each interval in local time, hours counted from the epoch, with one
+    # UTC offset per day the intervals touch; the seconds in the last hour
+    # are 0 where it is the first
+    if not len(starts):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    start_days = np.floor(starts / DAY).astype(np.int64)
+    end_days = np.floor(ends / DAY).astype(np.int64)
+    first_day = int(start_days.min())
+    offsets = np.array([day_offset(day) for day in range(first_day, int(max(start_days.max(), end_days.max())) + 1)],
+                       dtype=np.float64)
+    starts = starts + offsets[start_days - first_day]
+    ends = np.maximum(starts, ends + offsets[end_days - first_day])
+    first_hours = np.floor(starts / HOUR).astype(np.int64)
+    last_hours = np.floor(ends / HOUR).astype(np.int64)
+    same = first_hours == last_hours
+    head = np.where(same, ends, (first_hours + 1) * HOUR) - starts
+    tail = np.where(same, 0.0, ends - last_hours * HOUR)
+    return first_hours, last_hours, head, tail
+
+def _numpy_week(spans, weights):
+    # Weighted seconds in each of the 7 * 24 hours of the week (Monday
+    # first). Seconds of every hour from the first to the last one touched:
+    # the partial hours at either end of each interval go straight into
+    # their hours, the whole hours in between come from a running sum of
+    # +1 where they begin and -1 where they end.
+    first_hours, last_hours, head, tail = spans
+    if not len(first_hours):
+        return np.zeros(7 * 24)
+    base = int(first_hours.min())
+    length = int(last_hours.max()) - base + 1
+    first_hours = first_hours - base
+    last_hours = last_hours - base
+    seconds = np.bincount(first_hours, weights=weights * head, minlength=length)
+    seconds += np.bincount(last_hours, weights=weights * tail, minlength=length)
+    spanning = np.where(last_hours > first_hours, weights, 0.0)
+    whole = np.bincount(first_hours + 1, weights=spanning, minlength=length + 1)
+    whole -= np.bincount(last_hours, weights=spanning, minlength=length + 1)
+    seconds += np.cumsum(whole)[:length] * HOUR
+    hours = np.arange(base, base + length)
+    return np.bincount((hours // 24 + EPOCH_WEEKDAY) % 7 * 24 + hours % 24, weights=seconds, minlength=7 * 24)
+
+# Shades of the text heatmap, from no time to the busiest hour
+SHADES = ' .:-=+*#%@'
+
+def analytics_text(result):
+    rows, overall, heatmap = result
+    if not overall[0]:
+        return "No finished sessions in this period."
+    text = "Session lengths (finished sessions, pauses left out):\n"
+    for project_name, sessions, worked, median, p90, paused in rows:
+        text += (f" - {project_name}: {sessions} session(s), total {format_time(worked)}, median {format_time(median)},"
+                 f" 90% under {format_time(p90)}, paused {paused:.0%}\n")
+    sessions, worked, median, p90, paused = overall
+    text += (f"\nAll projects: {sessions} session(s), total {format_time(worked)}, median {format_time(median)},"
+             f" 90% under {format_time(p90)}, paused {paused:.0%}\n")
+
+    busiest = max(max(day) for day in heatmap)
+    if not busiest:
+        return text
+    text += "\nTime worked by hour of the week:\n"
+    text += "    " + "".join(f"{hour:3}" for hour in range(24)) + "\n"
+    for weekday, day in zip(WEEKDAYS, heatmap):
+        text += f" {weekday} " + "".join(" " + shade(seconds / busiest) * 2 for seconds in day).rstrip() + "\n"
+    weekday, hour = max(((weekday, hour) for weekday in range(7) for hour in range(24)),
+                        key=lambda slot: heatmap[slot[0]][slot[1]])
+    text += (f"\nBusiest hour: {WEEKDAYS[weekday]} {hour:02d}:00-{hour + 1:02d}:00, {format_time(busiest)} in total"
+             f" (shown as '{SHADES[-1]}', no time as ' ')")
+    return text
+
+def shade(fraction):
+    # Character for a fraction of the busiest hour's time
+    if fraction <= 0:
+        return SHADES[0]
+    return SHADES[min(len(SHADES) - 1, 1 + int(fraction * (len(SHADES) - 1)))]
@@ -0,0 +1,146 @@
+
+import tkinter as tk
+from tkinter import ttk
+from tkinter import messagebox
+
+import core
+from analytics import WEEKDAYS
+from core import format_time
+from sessions_window import parse_date
+from virtual_tree import VirtualTreeview
+
+# Analytics window column -> position in an analytics row
+SORT_COLUMNS = {
+    'Project Name': 0,
+    'Sessions': 1,
+    'Total Time': 2,
+    'Median': 3,
+    '90th Percentile': 4,
+    'Paused': 5,
+}
+
+# Heatmap cell size and the space for the day and hour labels
+CELL_WIDTH = 26
+CELL_HEIGHT = 22
+LEFT_MARGIN = 40
+TOP_MARGIN = 18
+
+def heat_color(fraction):
+    # White for no time to dark blue for the busiest hour
+    low, high = (255, 255, 255), (31, 95, 168)
+    return '#' + ''.join(f"{round(a + (b - a) * fraction):02x}" for a, b in zip(low, high))
+
+class AnalyticsWindow:
+    # How the time is spread: session length percentiles and paused share
+    # per project, and a heatmap of the hours of the week worked. The figures
+    # come from the store's session table, so changing the dates recomputes
+    # them without going back to the sessions.
+    def __init__(self, root):
+        self.rows = []
+        self.heatmap = None
+        self.sort_column = 'Project Name'
+        self.descending = False
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Analytics")
+
+        controls = ttk.Frame(self.window, padding=(5, 5))
+        controls.pack(fill='x')
+        ttk.Label(controls, text="From (YYYY-MM-DD):").pack(side='left')
+        self.from_entry = ttk.Entry(controls, width=12)
+        self.from_entry.pack(side='left', padx=(2, 10))
+        ttk.Label(controls, text="To:").pack(side='left')
+        self.to_entry = ttk.Entry(controls, width=12)
+        self.to_entry.pack(side='left', padx=(2, 10))
+        ttk.Button(controls, text="Show", command=self.refresh).pack(side='left', padx=2)
+        ttk.Button(controls, text="All Time", command=self.clear_dates).pack(side='left', padx=2)
+        self.from_entry.bind('<Return>', lambda event: self.refresh())
+        self.to_entry.bind('<Return>', lambda event: self.refresh())
+
+        columns = tuple(SORT_COLUMNS)
+        self.view = VirtualTreeview(self.window, columns, self.fetch_rows, height=12)
+        for column in columns:
+            self.view.tree.heading(column, text=column, command=lambda column=column: self.sort_by(column))
+            self.view.tree.column(column, width=90)
+        self.view.tree.column('Project Name', width=200)
+        self.view.pack(fill='both', expand=True)
+
+        self.summary_label = ttk.Label(self.window, padding=(5, 5))
+        self.summary_label.pack(fill='x')
+
+        self.canvas = tk.Canvas(self.window, width=LEFT_MARGIN + 24 * CELL_WIDTH + 5,
+                                height=TOP_MARGIN + 7 * CELL_HEIGHT + 5, background='white', highlightthickness=0)
+        self.canvas.pack(padx=5)
+        self.canvas.bind('<Motion>', self.on_hover)
+        self.hover_label = ttk.Label(self.window, padding=(5, 5))
+        self.hover_label.pack(fill='x')
+
+        self.refresh()
+
+    def refresh(self):
+        try:
+            start = parse_date(self.from_entry.get())
+            # The "To" day is included
+            end = parse_date(self.to_entry.get(), days=1)
+        except ValueError:
+            messagebox.showerror("Invalid Date", "Please enter dates as YYYY-MM-DD.", parent=self.window)
+            return
+        self.rows, overall, self.heatmap = core.analytics(start, end)
+        sessions, worked, median, p90, paused = overall
+        if sessions:
+            self.summary_label.config(text=f"All projects: {sessions} sessions, {format_time(worked)} worked, "
+                                           f"median {format_time(median)}, 90% under {format_time(p90)}, "
+                                           f"paused {paused:.0%}")
+        else:
+            self.summary_label.config(text="No finished sessions in this period.")
+        self.sort_rows()
+        self.draw_heatmap()
+
+    def clear_dates(self):
+        self.from_entry.delete(0, 'end')
+        self.to_entry.delete(0, 'end')
+        self.refresh()
+
+    def sort_rows(self):
+        position = SORT_COLUMNS[self.sort_column]
+        if position == 0:
+            self.rows.sort(key=lambda row: (row[0].casefold(), row[0]), reverse=self.descending)
+        else:
+            self.rows.sort(key=lambda row: row[position], reverse=self.descending)
+        self.view.set_row_count(len(self.rows))
+
+    def sort_by(self, column):
+        if column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            # Names A to Z, figures largest first
+            self.descending = column != 'Project Name'
+        self.sort_column = column
+        self.sort_rows()
+
+    def fetch_rows(self, start, stop):
+        return [(project_name, sessions, format_time(worked), format_time(median), format_time(p90), f"{paused:.0%}")
+                for project_name, sessions, worked, median, p90, paused in self.rows[start:stop]]
+
+    def draw_heatmap(self):
+        canvas = self.canvas
+        canvas.delete('all')
+        for hour in range(0, 24, 3):
+            canvas.create_text(LEFT_MARGIN + hour * CELL_WIDTH + 2, TOP_MARGIN // 2, text=f"{hour:02d}", anchor='w')
+        busiest = max(max(day) for day in self.heatmap)
+        for weekday, day in enumerate(self.heatmap):
+            y = TOP_MARGIN + weekday * CELL_HEIGHT
+            canvas.create_text(5, y + CELL_HEIGHT // 2, text=WEEKDAYS[weekday], anchor='w')
+            for hour, seconds in enumerate(day):
+                x = LEFT_MARGIN + hour * CELL_WIDTH
+                canvas.create_rectangle(x, y, x + CELL_WIDTH, y + CELL_HEIGHT, outline='#dddddd',
+                                        fill=heat_color(seconds / busiest if busiest else 0))
+
+    def on_hover(self, event):
+        hour = (event.x - LEFT_MARGIN) // CELL_WIDTH
+        weekday = (event.y - TOP_MARGIN) // CELL_HEIGHT
+        if self.heatmap is None or not (0 <= hour < 24 and 0 <= weekday < 7):
+            self.hover_label.config(text="")
+            return
+        self.hover_label.config(text=f"{WEEKDAYS[weekday]} {hour:02d}:00-{hour + 1:02d}:00: "
+                                     f"{format_time(self.heatmap[weekday][hour])} worked")
@@ -1,98 +1,43 @@
-import os
-import sys
-import json
+
 import time
-import csv
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 from tkinter import simpledialog, filedialog
-from pathlib import Path
 
-# Adjust data file path to be in the user's home directory
-DATA_FILE = os.path.join(Path.home(), 'timesheet.json')
+import core
+import importer
+from core import format_time, load_data
+from breakdown_window import BreakdownWindow
+from debug_window import DebugWindow
+from export_window import ExportWindow
+from instrument import timed
+from sessions_window import SessionsWindow
+from timeline_window import TimelineWindow
+from transitions import TransitionError
+from virtual_tree import VirtualTreeview
 
-def load_data():
-    data_defaults = {
-        "projects": {}  # {project_name: project_data}
-    }
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                messagebox.showerror("Data Error", "Failed to read data file. It may be corrupted.")
-                data = data_defaults
-            # Ensure all necessary keys are present
-            for key, default_value in data_defaults.items():
-                if key not in data:
-                    data[key] = default_value
-    else:
-        data = data_defaults
-    return data
+# The GUI is a thin layer over core: it asks for input, runs the operation
+# and reports the outcome in a dialog.
 
-def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f)
+def show_data_error(message):
+    messagebox.showerror("Data Error", message)
 
 def start_project(project_name):
-    data = load_data()
-    if project_name in data['projects']:
-        messagebox.showinfo("Project Exists", f"Project '{project_name}' already exists.")
+    try:
+        core.start_project(project_name)
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
         return
-    project = {
-        'status': 'Stopped',
-        'sessions': [],
-        'total_time': 0
-    }
-
-    # Start a new session
-    project['status'] = 'Running'
-    project['sessions'].append({
-        'start_time': time.time(),
-        'end_time': None,
-        'lap_time': 0,
-        'pauses': [],
-        'total_paused_time': 0
-    })
-
-    data['projects'][project_name] = project
-    save_data(data)
-    messagebox.showinfo("Project Started", f"Started working on project '{project_name}'")
+    messagebox.showinfo("Project Started", f"Started working on project '{project_name}'{core.overlap_note(project_name)}")
     app.update_tree()
 
 def stop_project(project_name):
-    data = load_data()
-    project = data['projects'].get(project_name)
-
-    if not project:
-        messagebox.showinfo("Project Not Found", f"Project '{project_name}' does not exist.")
-        return
-
-    if project['status'] not in ['Running', 'Paused']:
-        messagebox.showinfo("Project Not Active", f"Project '{project_name}' is not currently running or paused.")
+    try:
+        elapsed_time = core.stop_project(project_name)
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
         return
-
-    # Stop the current session
-    current_session = project['sessions'][-1]
-
-    if project['status'] == 'Paused':
-        # End the current pause
-        pause = current_session['pauses'][-1]
-        pause_end_time = time.time()
-        pause['pause_end'] = pause_end_time
-        paused_duration = pause_end_time - pause['pause_start']
-        current_session['total_paused_time'] += paused_duration
-
-    current_session['end_time'] = time.time()
-    elapsed_time = (current_session['end_time'] - current_session['start_time']) - current_session.get('total_paused_time', 0)
-    current_session['lap_time'] = elapsed_time
-
-    project['total_time'] += elapsed_time
-    project['status'] = 'Stopped'
-
-    data['projects'][project_name] = project
-    save_data(data)
     messagebox.showinfo(
         "Project Stopped",
         f"Stopped working on project '{project_name}'\nTime spent this session: {format_time(elapsed_time)}"
@@ -100,198 +45,148 @@ def stop_project(project_name):
     app.update_tree()
 
 def pause_project(project_name):
-    data = load_data()
-    project = data['projects'].get(project_name)
-    
-    if not project or project['status'] != 'Running':
-        messagebox.showinfo("Cannot Pause", f"Project '{project_name}' is not running.")
+    try:
+        core.pause_project(project_name)
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
         return
-
-    # Get the current session
-    current_session = project['sessions'][-1]
-    # Start a new pause
-    pause_start_time = time.time()
-    current_session['pauses'].append({'pause_start': pause_start_time, 'pause_end': None})
-    # Update status
-    project['status'] = 'Paused'
-
-    data['projects'][project_name] = project
-    save_data(data)
     messagebox.showinfo("Project Paused", f"Paused project '{project_name}'")
     app.update_tree()
 
 def resume_paused_project(project_name):
-    data = load_data()
-    project = data['projects'].get(project_name)
-    
-    if not project or project['status'] != 'Paused':
-        messagebox.showinfo("Cannot Resume", f"Project '{project_name}' is not paused.")
+    try:
+        core.resume_paused_project(project_name)
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
         return
-
-    # Get the current session
-    current_session = project['sessions'][-1]
-    # End the current pause
-    pause = current_session['pauses'][-1]
-    pause_end_time = time.time()
-    pause['pause_end'] = pause_end_time
-    # Calculate paused duration
-    paused_duration = pause_end_time - pause['pause_start']
-    current_session['total_paused_time'] += paused_duration
-    # Update status
-    project['status'] = 'Running'
-
-    data['projects'][project_name] = project
-    save_data(data)
-    messagebox.showinfo("Project Resumed", f"Resumed project '{project_name}' from pause")
+    messagebox.showinfo("Project Resumed", f"Resumed project '{project_name}' from pause{core.overlap_note(project_name)}")
     app.update_tree()
 
 def resume_project(project_name):
-    data = load_data()
-    project = data['projects'].get(project_name)
-
-    if not project:
-        messagebox.showinfo("Project Not Found", f"Project '{project_name}' does not exist.")
+    try:
+        core.resume_project(project_name)
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
         return
-
-    if project['status'] != 'Stopped':
-        messagebox.showinfo("Cannot Resume Project", f"Project '{project_name}' is not stopped.")
-        return
-
-    # Start a new session
-    project['status'] = 'Running'
-    project['sessions'].append({
-        'start_time': time.time(),
-        'end_time': None,
-        'lap_time': 0,
-        'pauses': [],
-        'total_paused_time': 0
-    })
-
-    data['projects'][project_name] = project
-    save_data(data)
-    messagebox.showinfo("Project Resumed", f"Resumed working on project '{project_name}'")
+    messagebox.showinfo("Project Resumed", f"Resumed working on project '{project_name}'{core.overlap_note(project_name)}")
     app.update_tree()
 
 def delete_project(project_name):
-    data = load_data()
-    if project_name in data['projects']:
+    if core.project_exists(project_name):
         confirm = messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete project '{project_name}'?")
         if confirm:
-            del data['projects'][project_name]
-            save_data(data)
+            try:
+                core.delete_project(project_name)
+            except TransitionError as e:
+                messagebox.showinfo(e.title, e.message)
+                return
             messagebox.showinfo("Project Deleted", f"Project '{project_name}' has been deleted.")
             app.update_tree()
     else:
         messagebox.showinfo("Project Not Found", f"Project '{project_name}' does not exist.")
 
 def edit_project_name(old_project_name, new_project_name):
-    data = load_data()
-    if old_project_name not in data['projects']:
-        messagebox.showinfo("Project Not Found", f"Project '{old_project_name}' does not exist.")
+    try:
+        core.edit_project_name(old_project_name, new_project_name)
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
         return
-    if new_project_name in data['projects']:
-        messagebox.showinfo("Name Conflict", f"A project named '{new_project_name}' already exists.")
-        return
-    # Rename the project
-    data['projects'][new_project_name] = data['projects'].pop(old_project_name)
-    save_data(data)
     messagebox.showinfo("Project Renamed", f"Project '{old_project_name}' has been renamed to '{new_project_name}'.")
+    if app.selected_name == old_project_name:
+        # Keep it selected under the new name
+        app.selected_name = new_project_name
     app.update_tree()
 
 def status():
-    data = load_data()
-    running_projects = [name for name, proj in data['projects'].items() if proj['status'] == 'Running']
-    paused_projects = [name for name, proj in data['projects'].items() if proj['status'] == 'Paused']
-    if not running_projects and not paused_projects:
-        messagebox.showinfo("Status", "No projects are currently running or paused.")
-    else:
-        status_text = ""
-        if running_projects:
-            status_text += "Currently running projects:\n"
-            for project_name in running_projects:
-                project = data['projects'][project_name]
-                current_session = project['sessions'][-1]
-                elapsed_time = (time.time() - current_session['start_time']) - current_session.get('total_paused_time', 0)
-                status_text += f" - {project_name}: {format_time(elapsed_time)}\n"
-        if paused_projects:
-            status_text += "\nCurrently paused projects:\n"
-            for project_name in paused_projects:
-                project = data['projects'][project_name]
-                current_session = project['sessions'][-1]
-                elapsed_time = (current_session['pauses'][-1]['pause_start'] - current_session['start_time']) - current_session.get('total_paused_time', 0)
-                status_text += f" - {project_name}: {format_time(elapsed_time)} (Paused)\n"
-        messagebox.showinfo("Status", status_text)
+    messagebox.showinfo("Status", core.status_text(core.status()))
+
+def show_analytics():
+    # Imported on first use, so starting the app doesn't load NumPy
+    from analytics_window import AnalyticsWindow
+    AnalyticsWindow(app.root)
 
 def report():
-    data = load_data()
-    if not data['projects']:
+    totals = core.report()
+    if not totals:
         messagebox.showinfo("Report", "No time recorded yet.")
         return
 
-    report_text = "Total time spent on projects:\n"
-    total_all_projects = 0
-    for project_name, project in data['projects'].items():
-        total_seconds = project['total_time']
-        report_text += f" - {project_name}: {format_time(total_seconds)}\n"
-        total_all_projects += total_seconds
-    report_text += f"\nTotal time spent on all projects: {format_time(total_all_projects)}"
-
     # Show the report with an option to export detailed report to a CSV file
-    response = messagebox.askyesno("Report", f"{report_text}\n\nDo you want to export detailed report to a CSV file?")
+    response = messagebox.askyesno("Report", f"{core.report_text(totals)}\n\nDo you want to export detailed report to a CSV file?")
     if response:
-        export_report_to_csv(data)
+        export_report_to_csv()
 
-def export_report_to_csv(data):
+def export_report_to_csv():
     # Open file dialog to select where to save the CSV file
     file_path = filedialog.asksaveasfilename(defaultextension='.csv', filetypes=[('CSV files', '*.csv')])
     if file_path:
-        try:
-            with open(file_path, 'w', newline='') as csvfile:
-                fieldnames = ['Project Name', 'Session', 'Start Time', 'End Time', 'Lap Time (h:m:s)', 'Total Time (h:m:s)', 'Pauses']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                for project_name, project in data['projects'].items():
-                    total_time_formatted = format_time(project['total_time'])
-                    for idx, session in enumerate(project['sessions'], start=1):
-                        start_time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(session['start_time']))
-                        end_time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(session['end_time'])) if session['end_time'] else 'Running'
-                        lap_time_formatted = format_time(session['lap_time']) if session['lap_time'] else 'Running'
-                        pauses_info = ''
-                        for pause in session.get('pauses', []):
-                            pause_start = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(pause['pause_start']))
-                            pause_end = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(pause['pause_end'])) if pause.get('pause_end') else 'Ongoing'
-                            pauses_info += f"Start: {pause_start}, End: {pause_end}; "
-                        writer.writerow({
-                            'Project Name': project_name,
-                            'Session': idx,
-                            'Start Time': start_time_str,
-                            'End Time': end_time_str,
-                            'Lap Time (h:m:s)': lap_time_formatted,
-                            'Total Time (h:m:s)': total_time_formatted,
-                            'Pauses': pauses_info
-                        })
-            messagebox.showinfo("Export Successful", f"Report exported to {file_path}")
-        except Exception as e:
-            messagebox.showerror("Export Failed", f"An error occurred while exporting the report:\n{e}")
+        # The export runs in the background with its own progress window
+        ExportWindow(app.root, file_path)
+
+def import_sessions():
+    file_paths = filedialog.askopenfilenames(
+        filetypes=[('CSV or JSONL files', '*.csv *.jsonl *.ndjson'), ('All files', '*')])
+    if not file_paths:
+        return
+    try:
+        result = importer.import_files(file_paths)
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
+        return
+    except OSError as e:
+        messagebox.showerror("Import Failed", str(e))
+        return
+    messagebox.showinfo("Import", importer.import_text(result))
+    app.update_tree()
+
+def undo():
+    try:
+        label = core.undo()
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
+        return
+    if label is None:
+        messagebox.showinfo("Undo", "Nothing to undo.")
+        return
+    messagebox.showinfo("Undo", f"Undid: {label}")
+    app.update_tree()
+
+def redo():
+    try:
+        label = core.redo()
+    except TransitionError as e:
+        messagebox.showinfo(e.title, e.message)
+        return
+    if label is None:
+        messagebox.showinfo("Redo", "Nothing to redo.")
+        return
+    messagebox.showinfo("Redo", f"Redid: {label}")
+    app.update_tree()
 
 def clear_all_data():
-    confirm = messagebox.askyesno("Confirm Clear All", "Are you sure you want to clear all data? This action cannot be undone.")
+    confirm = messagebox.askyesno("Confirm Clear All", "Are you sure you want to clear all data? You can bring it back with Undo.")
     if confirm:
         # Reset the data
-        data = {"projects": {}}
-        save_data(data)
+        try:
+            core.clear_all_data()
+        except TransitionError as e:
+            messagebox.showinfo(e.title, e.message)
+            return
         messagebox.showinfo("Data Cleared", "All data has been cleared.")
         # Update the GUI
         app.update_tree()
     else:
         messagebox.showinfo("Cancelled", "Clear all data operation cancelled.")
 
-def format_time(seconds):
-    seconds = int(seconds)
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    seconds = seconds % 60
-    return f"{hours}h {minutes}m {seconds}s"
+# How often to look for changes from other processes while nothing is running
+IDLE_CHECK_MS = 5000
+
+# Main list column -> order it sorts by (see core.find_projects)
+SORT_KEYS = {
+    'Project Name': 'name',
+    'Time Spent': 'total',
+    'Status': 'status',
+}
 
 # GUI Implementation
 class TimeTrackerApp:
@@ -326,19 +221,36 @@ class TimeTrackerApp:
         project_list_label = ttk.Label(main_frame, text="Projects:", font=("Arial", 14))
         project_list_label.pack(pady=(0, 5))
 
-        # Project List Treeview
+        # Search box; the list shows the projects whose name contains it
+        search_frame = ttk.Frame(main_frame)
+        search_frame.pack(fill='x', pady=(0, 5))
+        ttk.Label(search_frame, text="Search:").pack(side='left')
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', lambda *args: self.update_rows(keep_position=False))
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side='left', fill='x', expand=True, padx=(5, 5))
+        self.count_label = ttk.Label(search_frame)
+        self.count_label.pack(side='right')
+        root.bind('<Control-f>', lambda event: search_entry.focus_set())
+
+        # Project list; only the rows on screen exist in Tk
         columns = ('Project Name', 'Time Spent', 'Status')
-        self.tree = ttk.Treeview(main_frame, columns=columns, show='headings', selectmode='browse')
-        self.tree.heading('Project Name', text='Project Name')
-        self.tree.heading('Time Spent', text='Total Time')
-        self.tree.heading('Status', text='Status')
-        self.tree.column('Project Name', width=200)
-        self.tree.column('Time Spent', width=100)
-        self.tree.column('Status', width=80)
-        self.tree.pack(fill='both', expand=True)
+        self.view = VirtualTreeview(main_frame, columns, self.fetch_rows)
+        project_tree = self.view.tree
+        for column, text in zip(columns, ['Project Name', 'Total Time', 'Status']):
+            project_tree.heading(column, text=text, command=lambda column=column: self.sort_by(SORT_KEYS[column]))
+        project_tree.column('Project Name', width=200)
+        project_tree.column('Time Spent', width=100)
+        project_tree.column('Status', width=80)
+        self.view.pack(fill='both', expand=True)
 
         # Bind selection event to update buttons
-        self.tree.bind('<<TreeviewSelect>>', lambda event: self.update_buttons())
+        self.view.bind('<<VirtualSelect>>', lambda event: self.on_select())
+
+        # Hidden debug window with operation timings
+        root.bind('<Control-D>', lambda event: DebugWindow(root))
+        root.bind('<Control-z>', lambda event: undo())
+        root.bind('<Control-y>', lambda event: redo())
 
         # Buttons Frame
         buttons_frame = ttk.Frame(main_frame)
@@ -355,6 +267,12 @@ class TimeTrackerApp:
         self.view_sessions_button = ttk.Button(buttons_frame, text="View Sessions", command=self.view_sessions)
         self.status_button = ttk.Button(buttons_frame, text="Status", command=status)
         self.report_button = ttk.Button(buttons_frame, text="Report", command=report)
+        self.breakdown_button = ttk.Button(buttons_frame, text="Breakdown", command=lambda: BreakdownWindow(root))
+        self.timeline_button = ttk.Button(buttons_frame, text="Timeline", command=lambda: TimelineWindow(root))
+        self.analytics_button = ttk.Button(buttons_frame, text="Analytics", command=show_analytics)
+        self.import_button = ttk.Button(buttons_frame, text="Import", command=import_sessions)
+        self.undo_button = ttk.Button(buttons_frame, text="Undo", command=undo)
+        self.redo_button = ttk.Button(buttons_frame, text="Redo", command=redo)
         self.clear_button = ttk.Button(buttons_frame, text="Clear All", command=clear_all_data)
         self.exit_button = ttk.Button(buttons_frame, text="Exit", command=root.quit)
 
@@ -369,6 +287,12 @@ class TimeTrackerApp:
         self.view_sessions_button.pack(side='left', expand=True, fill='x', padx=2)
         self.status_button.pack(side='left', expand=True, fill='x', padx=2)
         self.report_button.pack(side='left', expand=True, fill='x', padx=2)
+        self.breakdown_button.pack(side='left', expand=True, fill='x', padx=2)
+        self.timeline_button.pack(side='left', expand=True, fill='x', padx=2)
+        self.analytics_button.pack(side='left', expand=True, fill='x', padx=2)
+        self.import_button.pack(side='left', expand=True, fill='x', padx=2)
+        self.undo_button.pack(side='left', expand=True, fill='x', padx=2)
+        self.redo_button.pack(side='left', expand=True, fill='x', padx=2)
         self.clear_button.pack(side='left', expand=True, fill='x', padx=2)
         self.exit_button.pack(side='left', expand=True, fill='x', padx=2)
 
@@ -381,6 +305,16 @@ class TimeTrackerApp:
         self.edit_button.config(state='disabled')
         self.view_sessions_button.config(state='disabled')
 
+        # Names of the listed projects, in list order
+        self.row_names = []
+        self.selected_name = None
+        self.sort_key = 'name'
+        self.sort_descending = False
+        self.running_projects = set()
+        self.rendered_generation = None
+        self.timer_id = None
+        self.timer_delay = None
+
         # Initialize timer update
         self.update_timer()
 
@@ -390,162 +324,160 @@ class TimeTrackerApp:
             start_project(project_name)
 
     def stop_project(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
+        project_name = self.selected_name
+        if project_name is None:
             messagebox.showinfo("No Selection", "Please select a project to stop.")
             return
-        selected_item = selected_items[0]
-        project_name = self.tree.item(selected_item)['values'][0]
         stop_project(project_name)
 
     def pause_project(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
+        project_name = self.selected_name
+        if project_name is None:
             messagebox.showinfo("No Selection", "Please select a project to pause.")
             return
-        selected_item = selected_items[0]
-        project_name = self.tree.item(selected_item)['values'][0]
         pause_project(project_name)
 
     def resume_paused_project(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
+        project_name = self.selected_name
+        if project_name is None:
             messagebox.showinfo("No Selection", "Please select a project to resume from pause.")
             return
-        selected_item = selected_items[0]
-        project_name = self.tree.item(selected_item)['values'][0]
         resume_paused_project(project_name)
 
     def resume_project(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
+        project_name = self.selected_name
+        if project_name is None:
             messagebox.showinfo("No Selection", "Please select a project to resume.")
             return
-        selected_item = selected_items[0]
-        project_name = self.tree.item(selected_item)['values'][0]
         resume_project(project_name)
 
     def delete_project(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
+        project_name = self.selected_name
+        if project_name is None:
             messagebox.showinfo("No Selection", "Please select a project to delete.")
             return
-        selected_item = selected_items[0]
-        project_name = self.tree.item(selected_item)['values'][0]
         delete_project(project_name)
 
     def edit_project(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
+        old_project_name = self.selected_name
+        if old_project_name is None:
             messagebox.showinfo("No Selection", "Please select a project to edit.")
             return
-        selected_item = selected_items[0]
-        old_project_name = self.tree.item(selected_item)['values'][0]
         new_project_name = simpledialog.askstring("Edit Project", f"Enter new name for project '{old_project_name}':")
         if new_project_name:
             edit_project_name(old_project_name, new_project_name)
 
     def view_sessions(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
+        project_name = self.selected_name
+        if project_name is None:
             messagebox.showinfo("No Selection", "Please select a project to view sessions.")
             return
-        selected_item = selected_items[0]
-        project_name = self.tree.item(selected_item)['values'][0]
-        data = load_data()
-        project = data['projects'].get(project_name)
-        if not project:
+        load_data()
+        if core.get_data_store().count_sessions(project_name) is None:
             messagebox.showinfo("No Data", f"No data found for project '{project_name}'.")
             return
 
         # Create a new window to display sessions
-        sessions_window = tk.Toplevel(self.root)
-        sessions_window.title(f"Sessions for {project_name}")
-
-        # Sessions Treeview
-        columns = ('Session', 'Start Time', 'End Time', 'Lap Time', 'Paused Time')
-        sessions_tree = ttk.Treeview(sessions_window, columns=columns, show='headings')
-        sessions_tree.heading('Session', text='Session')
-        sessions_tree.heading('Start Time', text='Start Time')
-        sessions_tree.heading('End Time', text='End Time')
-        sessions_tree.heading('Lap Time', text='Lap Time')
-        sessions_tree.heading('Paused Time', text='Paused Time')
-        sessions_tree.column('Session', width=80)
-        sessions_tree.column('Start Time', width=150)
-        sessions_tree.column('End Time', width=150)
-        sessions_tree.column('Lap Time', width=100)
-        sessions_tree.column('Paused Time', width=100)
-        sessions_tree.pack(fill='both', expand=True)
-
-        # Insert session data
-        for idx, session in enumerate(project['sessions'], start=1):
-            start_time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(session['start_time']))
-            end_time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(session['end_time'])) if session['end_time'] else 'Running'
-            lap_time_formatted = format_time(session['lap_time']) if session['lap_time'] else 'Running'
-            paused_time_formatted = format_time(session.get('total_paused_time', 0))
-            sessions_tree.insert('', 'end', values=(f"Session {idx}", start_time_str, end_time_str, lap_time_formatted, paused_time_formatted))
+        SessionsWindow(self.root, project_name)
 
     def update_timer(self):
+        self.timer_id = None
+        for title, message in core.get_data_store().take_errors():
+            messagebox.showwarning(title, message)
         self.update_tree()
-        self.root.after(1000, self.update_timer)
 
+    def schedule_tick(self):
+        # Tick every second while something is running. Otherwise the tick is
+        # suspended and only a slow check for changes made by other processes
+        # remains (the background writer polls the file and swaps them in);
+        # the next state change here wakes the fast tick again through
+        # update_tree.
+        delay = 1000 if self.running_projects else IDLE_CHECK_MS
+        if self.timer_id is not None:
+            if delay == self.timer_delay:
+                return
+            self.root.after_cancel(self.timer_id)
+        self.timer_id = self.root.after(delay, self.update_timer)
+        self.timer_delay = delay
+
+    @timed('update_tree')
     def update_tree(self):
-        data = load_data()
-
-        # Save the currently selected project names
-        selected_items = self.tree.selection()
-        selected_projects = []
-        for item_id in selected_items:
-            project_name = self.tree.item(item_id)['values'][0]
-            selected_projects.append(project_name)
-
-        # Get all existing items
-        existing_items = {self.tree.item(item)['values'][0]: item for item in self.tree.get_children()}
-
-        # Update existing items and add new ones
-        for project_name, project in data['projects'].items():
-            total_time = project['total_time']
-            if project['status'] in ['Running', 'Paused']:
-                # Add elapsed time from current session, subtracting paused time
-                current_session = project['sessions'][-1]
-                if project['status'] == 'Paused':
-                    elapsed_time = (current_session['pauses'][-1]['pause_start'] - current_session['start_time']) - current_session.get('total_paused_time', 0)
-                else:
-                    elapsed_time = (time.time() - current_session['start_time']) - current_session.get('total_paused_time', 0)
-                display_time = format_time(total_time + elapsed_time)
-            else:
-                display_time = format_time(total_time)
+        load_data()
+        data_store = core.get_data_store()
+
+        if data_store.generation != self.rendered_generation:
+            self.running_projects = {row[0] for row in data_store.active_projects() if row[1] == 'Running'}
+            self.update_rows()
+            self.rendered_generation = data_store.generation
+        elif self.running_projects:
+            # Nothing changed on disk: only the clocks of running projects
+            # move, so the rows on screen are read again
+            self.view.refresh_rows()
+
+        self.schedule_tick()
+
+    def update_rows(self, keep_position=True):
+        # Lists the projects matching the search box in the chosen order; the
+        # selected project stays selected while it is listed
+        self.row_names = core.find_projects(self.search_var.get(), self.sort_key, self.sort_descending)
+        row = None
+        if self.selected_name is not None:
+            try:
+                row = self.row_names.index(self.selected_name)
+            except ValueError:
+                self.selected_name = None
+        self.view.selected_row = row
+        if not keep_position:
+            self.view.offset = 0
+        self.view.set_row_count(len(self.row_names), keep_position=True)
+        if row is not None and not keep_position:
+            self.view.scroll_to(row)
+        self.count_label.config(text=f"{len(self.row_names)} of {len(load_data()['projects'])} projects")
+        self.update_buttons()
 
-            if project_name in existing_items:
-                # Update existing item
-                item_id = existing_items[project_name]
-                self.tree.item(item_id, values=(project_name, display_time, project['status']))
+    def fetch_rows(self, start, stop):
+        projects = load_data()['projects']
+        return [self.project_values(project_name, projects.get(project_name)) for project_name in self.row_names[start:stop]]
+
+    def project_values(self, project_name, project):
+        if project is None:
+            # Gone since the list was made; the next update drops the row
+            return (project_name, '', '')
+        total_time = project['total_time']
+        if project['status'] in ['Running', 'Paused']:
+            # Add elapsed time from current session, subtracting paused time
+            current_session = project['sessions'][-1]
+            if project['status'] == 'Paused':
+                elapsed_time = (current_session['pauses'][-1]['pause_start'] - current_session['start_time']) - current_session.get('total_paused_time', 0)
             else:
-                # Insert new item
-                item_id = self.tree.insert('', 'end', values=(project_name, display_time, project['status']))
-                existing_items[project_name] = item_id  # Update existing_items
-
-        # Remove items that are no longer in data
-        for project_name in list(existing_items.keys()):
-            if project_name not in data['projects']:
-                self.tree.delete(existing_items[project_name])
-                del existing_items[project_name]
-
-        # Restore the selection
-        new_selected_items = []
-        for project_name in selected_projects:
-            item_id = existing_items.get(project_name)
-            if item_id:
-                new_selected_items.append(item_id)
-        self.tree.selection_set(new_selected_items)
-
-        # Update button states
+                elapsed_time = (time.time() - current_session['start_time']) - current_session.get('total_paused_time', 0)
+            display_time = format_time(total_time + elapsed_time)
+        else:
+            display_time = format_time(total_time)
+        return (project_name, display_time, project['status'])
+
+    def sort_by(self, sort_key):
+        # Clicking the same heading again reverses the order; time starts
+        # with the largest
+        if sort_key == self.sort_key:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_key = sort_key
+            self.sort_descending = sort_key == 'total'
+        self.update_rows(keep_position=False)
+
+    def on_select(self):
+        row = self.view.selected_row
+        self.selected_name = None if row is None else self.row_names[row]
         self.update_buttons()
 
+    @timed('update_buttons')
     def update_buttons(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
-            # Disable buttons that require selection
+        project_name = self.selected_name
+        project = None if project_name is None else load_data()['projects'].get(project_name)
+        if project is None:
+            # Disable buttons that require selection; the selected project
+            # may also be gone, undone or deleted by another process
             self.stop_button.config(state='disabled')
             self.pause_button.config(state='disabled')
             self.resume_pause_button.config(state='disabled')
@@ -554,10 +486,6 @@ class TimeTrackerApp:
             self.edit_button.config(state='disabled')
             self.view_sessions_button.config(state='disabled')
         else:
-            selected_item = selected_items[0]
-            project_name = self.tree.item(selected_item)['values'][0]
-            data = load_data()
-            project = data['projects'].get(project_name)
             status = project['status']
             self.delete_button.config(state='normal')
             self.edit_button.config(state='normal')
@@ -641,9 +569,14 @@ class TimeTrackerApp:
 
 def main():
     global app
+    core.on_data_error = show_data_error
+    core.start_background_writer()
     root = tk.Tk()
     app = TimeTrackerApp(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        core.stop_background_writer()
 
 if __name__ == "__main__":
     main()
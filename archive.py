@@ -0,0 +1,286 @@
+
+# Hot/cold tiering for the JSON timesheet. Closed sessions older than
+# TIMESHEET_ARCHIVE_DAYS (default 365, 0 turns it off), all but the newest
+# of each project, move out of the data file into one compressed file per
+# month next to it:
+#   timesheet.json.archive/2023-04.json.gz = {archive key: [session, ...]}
+# The data file keeps the recent sessions, each project's total_time and
+# per-day rollups, plus what is needed to find the rest:
+#   project['archived'] = {'key': archive key, 'periods': {'2023-04': sessions}}
+#   data['archive_files'] = {'2023-04': '2023-04.json.gz'}
+#   data['archive_ends'] = {'2023-04': end of the latest session in that month}
+# The key is the project's name when it was first archived, so a rename
+# doesn't have to touch the archives. Period files are only opened when a
+# sessions view or an export reaches into that month.
+
+import os
+import gzip
+import json
+import lzma
+import time
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+
+from rollups import ensure_rollups
+from session_columns import SessionColumns, json_default
+
+ARCHIVE_DAYS = int(os.environ.get('TIMESHEET_ARCHIVE_DAYS', '365'))
+COMPRESSION = os.environ.get('TIMESHEET_ARCHIVE_COMPRESSION', 'gzip')
+
+COMPRESSORS = {
+    'gzip': ('.json.gz', gzip),
+    'lzma': ('.json.xz', lzma),
+}
+
+# Decompressed period files kept in memory
+CACHED_PERIODS = 12
+
+def period_of(timestamp):
+    return time.strftime('%Y-%m', time.localtime(timestamp))
+
+def period_bounds(period):
+    # (first, last) second of a 'YYYY-MM' period in local time
+    year, month = int(period[:4]), int(period[5:7])
+    start = datetime(year, month, 1).timestamp()
+    end = datetime(year + month // 12, month % 12 + 1, 1).timestamp()
+    return start, end
+
+class Archive:
+    def __init__(self, path):
+        self.directory = path + '.archive'
+        self._cache = OrderedDict()  # {(filename, signature): {key: [session, ...]}}
+        self._lock = threading.Lock()
+
+    def read_bytes(self, filename):
+        with open(os.path.join(self.directory, filename), 'rb') as f:
+            return f.read()
+
+    def signature(self, filename):
+        st = os.stat(os.path.join(self.directory, filename))
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def read(self, filename):
+        # The export reads on a worker thread while the GUI may open a view
+        with self._lock:
+            cache_key = (filename, self.signature(filename))
+            content = self._cache.get(cache_key)
+            if content is None:
+                module = gzip if filename.endswith('.gz') else lzma
+                content = json.loads(module.decompress(self.read_bytes(filename)))
+                self._cache[cache_key] = content
+                if len(self._cache) > CACHED_PERIODS:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(cache_key)
+            return content
+
+    def write(self, period, content):
+        # Written next to the old file and swapped in, like the data file
+        extension, module = COMPRESSORS[COMPRESSION]
+        filename = period + extension
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(module.compress(json.dumps(content, default=json_default).encode()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return filename
+
+    def period_sessions(self, filename, key, count):
+        # Anything past the recorded count is left over from an interrupted run
+        return self.read(filename).get(key, [])[:count]
+
+def archive_due(data, cutoff):
+    # Cheap check run on every write: sessions are in start order, so only
+    # the first one of each project needs looking at. The newest session of
+    # a project is never archived: it may be the one the write just closed.
+    for project in data['projects'].values():
+        sessions = project['sessions']
+        if len(sessions) > 1 and sessions[0]['end_time'] is not None and sessions[0]['start_time'] < cutoff:
+            return True
+    return False
+
+def _unique_key(data, project_name):
+    keys = {project['archived']['key'] for project in data['projects'].values() if 'archived' in project}
+    key = project_name
+    n = 1
+    while key in keys:
+        n += 1
+        key = f"{project_name}#{n}"
+    return key
+
+def archive_sessions(data, archive, cutoff):
+    # Moves closed sessions that started before cutoff into the period files.
+    # The caller holds the file lock and writes data afterwards; returns the
+    # number of sessions moved.
+    if not archive_due(data, cutoff):
+        return 0
+    # The per-day totals have to include the sessions before they leave
+    ensure_rollups(data)
+    archive_files = data.setdefault('archive_files', {})
+    archive_ends = data.setdefault('archive_ends', {})
+
+    moved = {}  # {period: {project name: [session, ...]}}
+    counts = {}  # {project name: sessions moved}
+    for project_name, project in data['projects'].items():
+        sessions = project['sessions']
+        count = 0
+        # Everything but the newest session, which stays in the data file
+        while count < len(sessions) - 1 and sessions[count]['end_time'] is not None and sessions[count]['start_time'] < cutoff:
+            count += 1
+        if not count:
+            continue
+        counts[project_name] = count
+        if 'archived' not in project:
+            project['archived'] = {'key': _unique_key(data, project_name), 'periods': {}}
+        for session in sessions[:count]:
+            moved.setdefault(period_of(session['start_time']), {}).setdefault(project_name, []).append(session)
+
+    for period, by_project in sorted(moved.items()):
+        # Rebuild the period from what the data file accounts for, which also
+        # drops the sessions of projects deleted since
+        content = {}
+        if period in archive_files:
+            old_content = archive.read(archive_files[period])
+            for project in data['projects'].values():
+                count = project.get('archived', {}).get('periods', {}).get(period, 0)
+                if count:
+                    content[project['archived']['key']] = old_content.get(project['archived']['key'], [])[:count]
+        for project_name, sessions in by_project.items():
+            key = data['projects'][project_name]['archived']['key']
+            merged = content.get(key, []) + sessions
+            merged.sort(key=lambda session: session['start_time'])
+            content[key] = merged
+        # Lets a time range query skip months whose sessions all ended before
+        # it; a month archived before this was recorded stays unknown
+        latest_end = max(session['end_time'] for sessions in by_project.values() for session in sessions)
+        if period not in archive_files or period in archive_ends:
+            archive_ends[period] = max(archive_ends.get(period, 0), latest_end)
+        archive_files[period] = archive.write(period, content)
+        for project_name, sessions in by_project.items():
+            periods = data['projects'][project_name]['archived']['periods']
+            periods[period] = periods.get(period, 0) + len(sessions)
+
+    for project_name, count in counts.items():
+        # A new list rather than deleting in place: an export running on
+        # another thread may still be walking the old one
+        project = data['projects'][project_name]
+        project['sessions'] = project['sessions'][count:]
+    return sum(counts.values())
+
+def restore_archived(data, archive):
+    # Puts every archived session back into its project, for converting to
+    # a format without tiering
+    archive_files = data.pop('archive_files', {})
+    data.pop('archive_ends', None)
+    for project in data['projects'].values():
+        archived = project.pop('archived', None)
+        if archived:
+            sessions = []
+            for period, count in sorted(archived['periods'].items()):
+                sessions.extend(archive.period_sessions(archive_files[period], archived['key'], count))
+            project['sessions'] = sessions + project['sessions']
+    return data
+
+def session_start_time(session):
+    return session['start_time']
+
+def session_bounds(sessions, start=None, end=None):
+    # Index range of the sessions starting in [start, end); sessions are
+    # appended in start order, so this is a binary search
+    if isinstance(sessions, SessionColumns):
+        return sessions.bounds(start, end)
+    lo = 0 if start is None else bisect_left(sessions, start, key=session_start_time)
+    hi = len(sessions) if end is None else bisect_left(sessions, end, key=session_start_time)
+    return lo, max(lo, hi)
+
+def archived_count(project):
+    return sum(project.get('archived', {}).get('periods', {}).values())
+
+class ProjectSessions:
+    # Read-only sequence of a project's sessions starting in [start, end):
+    # archived months first, then the ones in the data file. Months that lie
+    # entirely inside the range are counted from the data file and only
+    # decompressed when one of their sessions is actually accessed. Everything
+    # it needs is captured up front, so it stays valid while the data changes.
+    def __init__(self, archive, data, project, start=None, end=None):
+        self.segments = []  # [seq of the first session, loader, lo, hi]
+        seq = 1
+        archived = project.get('archived', {'periods': {}})
+        for period, count in sorted(archived['periods'].items()):
+            period_start, period_end = period_bounds(period)
+            if (end is not None and period_start >= end) or (start is not None and period_end <= start):
+                seq += count
+                continue
+            def loader(filename=data['archive_files'][period], key=archived['key'], count=count):
+                return archive.period_sessions(filename, key, count)
+            if (start is None or period_start >= start) and (end is None or period_end <= end):
+                self.segments.append([seq, loader, 0, count])
+            else:
+                lo, hi = session_bounds(loader(), start, end)
+                if hi > lo:
+                    self.segments.append([seq, loader, lo, hi])
+            seq += count
+        sessions = project['sessions']
+        lo, hi = session_bounds(sessions, start, end)
+        if hi > lo:
+            self.segments.append([seq, lambda: sessions, lo, hi])
+        self.offsets = []
+        total = 0
+        for segment in self.segments:
+            self.offsets.append(total)
+            total += segment[3] - segment[2]
+        self.length = total
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for seq, loader, lo, hi in self.segments:
+            sessions = loader()
+            for idx in range(lo, hi):
+                yield sessions[idx]
+
+    def _locate(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        position = bisect_left(self.offsets, index + 1) - 1
+        return self.segments[position], index - self.offsets[position]
+
+    def __getitem__(self, index):
+        (seq, loader, lo, hi), offset = self._locate(index)
+        return loader()[lo + offset]
+
+    def blocks(self):
+        # (sessions, lo, hi) of each stretch of sessions as it is held: a
+        # list of dicts or SessionColumns
+        for seq, loader, lo, hi in self.segments:
+            yield loader(), lo, hi
+
+    def column(self, key):
+        # One field of every session in the range, read straight from the
+        # arrays where the sessions are held as SessionColumns
+        values = []
+        for seq, loader, lo, hi in self.segments:
+            sessions = loader()
+            if isinstance(sessions, SessionColumns):
+                values.extend(sessions.column(key, lo, hi))
+            else:
+                values.extend(session.get(key) for session in sessions[lo:hi])
+        return values
+
+    def seq(self, index):
+        # Session number as shown to the user, counting archived sessions
+        (seq, loader, lo, hi), offset = self._locate(index)
+        return seq + lo + offset
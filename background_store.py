@@ -0,0 +1,313 @@
+
+# Write-behind persistence for the GUI. The home directory may be slow or on
+# the network, and the Tk thread must never wait for it, so the GUI works on
+# an in-memory copy of the timesheet:
+#   commit() applies the record to that copy at once (a transition that is
+#   not allowed still raises TransitionError right there) and queues it;
+#   a writer thread hands the queued records to the real storage engine, a
+#   second store for the same file, as one commit_many per burst and at most
+#   FLUSH_DELAY after the first of them, through commit_batch, which also
+#   writes the undo history and the sync log (core.commit_recorded);
+#   between writes the same thread looks for changes by other processes every
+#   POLL_INTERVAL and, if there are any, swaps in a fresh copy with the
+#   records still queued applied on top.
+# The queries an engine answers itself (SQL for SQLite) go to a third store
+# for the same file whenever nothing is waiting to be written; while
+# something is, only the in-memory copy has it all and answers them.
+# close() writes out whatever is queued; the app calls it on the way out.
+
+import sys
+import copy
+import json
+import time
+import threading
+
+from store import DataStore, create_store
+from transitions import TransitionError, apply_record, try_apply
+
+# Longest a change waits in memory before it is written
+FLUSH_DELAY = 0.5
+# How often the writer looks for changes made by other processes
+POLL_INTERVAL = 2.0
+
+# Queries a storage engine may answer without the whole document (see store.py)
+QUERIES = ['project_totals', 'active_projects', 'count_sessions', 'session_page', 'day_totals',
+           'open_sessions', 'count_all_sessions', 'iter_export_rows']
+
+class BackgroundStore(DataStore):
+    writes_behind = True
+
+    def __init__(self, path, storage=None):
+        super().__init__(path)
+        self.storage = storage
+        self.disk = create_store(path, storage)
+        self.archive = self.disk.archive
+        # The GUI thread's store for the queries the engine answers itself
+        self._engine_queries = [name for name in QUERIES
+                                if getattr(type(self.disk), name) is not getattr(DataStore, name)]
+        self.reader = create_store(path, storage) if self._engine_queries else None
+        # Called on the writer thread as commit_batch(disk store, [(record,
+        # undo label or None)]) for each batch; returns the errors
+        self.commit_batch = None
+        self._condition = threading.Condition()
+        self._pending = []  # (record, label) applied in memory, not yet written
+        self._batch = []  # the ones being written
+        self._waiting = []  # records commit_and_wait is waiting for
+        self._turned_down = {}  # id of such a record: its TransitionError
+        self._first_pending = None  # time.monotonic() when the oldest of them arrived
+        self._writing = False
+        self._closing = False
+        self._errors = []  # (title, message)
+        self._failing = False  # the last write failed; reported once until one succeeds
+        self._disk_reads = None
+        self._thread = threading.Thread(target=self._run, name='timesheet-writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _read_fresh(self):
+        # A separate store reads the file, so the copy shares nothing with
+        # the one the writer applies records to
+        return create_store(self.path, self.storage).load()
+
+    def load(self):
+        # Never touches the disk once the first copy is in memory
+        if self._data is None:
+            fresh = create_store(self.path, self.storage)
+            try:
+                data = fresh.load()
+            except json.JSONDecodeError:
+                # What the store kept of a damaged file
+                self._data = fresh.load()
+                self.generation += 1
+                raise
+            self._data = data
+            self.generation += 1
+        return self._data
+
+    def commit(self, record, label=None):
+        with self._condition:
+            data = self.load()
+            generation = self.generation
+            try:
+                apply_record(data, record)
+            except TransitionError:
+                raise
+            except BaseException:
+                self._start_over()
+                raise
+            self.generation += 1
+            self._index_records(generation, [record])
+            self._queue([(record, label)])
+        return data
+
+    def commit_and_wait(self, record):
+        # commit that returns once the record is written, and raises the
+        # TransitionError if the disk store turned it down
+        with self._condition:
+            self._waiting.append(record)
+        try:
+            self.commit(record)
+            self.flush()
+        finally:
+            with self._condition:
+                self._waiting.remove(record)
+                error = self._turned_down.pop(id(record), None)
+        if error is not None:
+            raise error
+
+    def commit_many(self, records):
+        with self._condition:
+            data = self.load()
+            generation = self.generation
+            try:
+                errors = [try_apply(data, record) for record in records]
+            except BaseException:
+                self._start_over()
+                raise
+            applied = [record for record, error in zip(records, errors) if error is None]
+            if applied:
+                self.generation += 1
+                self._index_records(generation, applied)
+                self._queue([(record, None) for record in applied])
+        return errors
+
+    def _start_over(self):
+        # Callers hold the condition. A record failed other than by
+        # TransitionError and may have changed the copy in part: it is read
+        # again, with the records still queued on top.
+        data = self._read_fresh()
+        for record, _ in self._pending:
+            try_apply(data, record)
+        self._data = data
+        self.generation += 1
+
+    def _queue(self, entries):
+        # Callers hold the condition
+        if not self._pending:
+            self._first_pending = time.monotonic()
+            self._condition.notify_all()
+        self._pending.extend(entries)
+
+    def queued_label(self):
+        # Undo label of the newest change not yet in the history, or None
+        with self._condition:
+            for _, label in reversed(self._batch + self._pending):
+                if label is not None:
+                    return label
+        return None
+
+    def save(self, data):
+        # A whole-document save is rare (the GUI never does one); it waits
+        # for the queue and then goes to the disk store directly
+        self.flush()
+        with self._condition:
+            self._data = data
+            self.generation += 1
+            self._writing = True
+        try:
+            self.disk.save(copy.deepcopy(data))
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+    def invalidate(self):
+        # Queued records must survive, so only the next poll refreshes
+        with self._condition:
+            self._disk_reads = None
+            self._condition.notify_all()
+
+    def flush(self):
+        # Blocks until everything committed so far is written
+        with self._condition:
+            self._first_pending = 0
+            self._condition.notify_all()
+            while self._pending or self._writing:
+                self._condition.wait()
+
+    def close(self):
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self.reader is not None:
+            self.reader.close()
+
+    def _query(self, name, *args):
+        with self._condition:
+            written = not self._pending and not self._writing
+        if written and name in self._engine_queries:
+            return getattr(self.reader, name)(*args)
+        return getattr(DataStore, name)(self, *args)
+
+    def project_totals(self):
+        return self._query('project_totals')
+
+    def active_projects(self):
+        return self._query('active_projects')
+
+    def count_sessions(self, project_name, start=None, end=None):
+        return self._query('count_sessions', project_name, start, end)
+
+    def session_page(self, project_name, offset, limit, order='seq', descending=False, start=None, end=None):
+        return self._query('session_page', project_name, offset, limit, order, descending, start, end)
+
+    def day_totals(self, start_day, end_day):
+        return self._query('day_totals', start_day, end_day)
+
+    def open_sessions(self):
+        return self._query('open_sessions')
+
+    def count_all_sessions(self):
+        return self._query('count_all_sessions')
+
+    def iter_export_rows(self):
+        return self._query('iter_export_rows')
+
+    def take_errors(self):
+        with self._condition:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending and not self._closing:
+                    self._condition.wait(POLL_INTERVAL)
+                while self._pending and not self._closing:
+                    # Let a burst of changes gather, but not for longer
+                    # than FLUSH_DELAY
+                    remaining = self._first_pending + FLUSH_DELAY - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch, self._pending = self._pending, []
+                self._batch = batch
+                self._writing = True
+                closing = self._closing
+            try:
+                if not self._write(batch) and closing:
+                    return
+            finally:
+                with self._condition:
+                    self._batch = []
+                    self._writing = False
+                    self._condition.notify_all()
+            if closing and not self._pending:
+                return
+
+    def _write(self, batch):
+        # Runs on the writer thread, the only one that touches the disk
+        # store. False if the batch could not be written; it is then put back
+        # to be retried.
+        try:
+            if batch and self.commit_batch is not None:
+                errors = self.commit_batch(self.disk, batch)
+            elif batch:
+                errors = self.disk.commit_many([record for record, _ in batch])
+            else:
+                self.disk.load()
+                errors = []
+        except Exception as e:
+            # Whatever the engine raised (an OSError, a database error, a
+            # damaged file): the batch is kept and the writer carries on
+            with self._condition:
+                self._pending[:0] = batch
+                if batch and not self._failing:
+                    self._errors.append(("Save Failed", f"Could not save {len(batch)} change(s): {e}"))
+                if self._closing:
+                    print(f"Could not save {len(self._pending)} change(s): {e}", file=sys.stderr)
+                    return False
+                self._first_pending = time.monotonic() + POLL_INTERVAL
+                self._failing = True
+            return False
+        self._failing = False
+
+        rejected = []
+        with self._condition:
+            for (record, _), error in zip(batch, errors):
+                if error is None:
+                    continue
+                if any(record is waited for waited in self._waiting):
+                    # commit_and_wait raises it
+                    self._turned_down[id(record)] = error
+                else:
+                    rejected.append(error)
+        if rejected or self._turned_down or self.disk.reads != self._disk_reads:
+            # Someone else changed the data, or a change made here turned out
+            # not to fit what they did: start again from what is stored
+            try:
+                data = self._read_fresh()
+            except (OSError, json.JSONDecodeError, TransitionError):
+                return True
+            with self._condition:
+                for error in rejected:
+                    self._errors.append((error.title, f"{error.message}\nThis change was not saved."))
+                for record, _ in self._pending:
+                    try_apply(data, record)
+                self._data = data
+                self.generation += 1
+                self._disk_reads = self.disk.reads
+        return True
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+
+# Benchmarks for the core timesheet operations on synthetic data.
+#
+#   python benchmark.py generate --sessions 100000 -o big.json
+#   python benchmark.py run --sizes 1000,10000,100000 -o results.json
+#   python benchmark.py compare before.json after.json
+#   python benchmark.py stress --processes 8 --cycles 200
+#   python benchmark.py formats --sizes 10000,100000 -o formats.json
+#
+# Everything runs headless. update_tree uses the real Tk window when a display
+# is available (e.g. under xvfb-run) and a stand-in Treeview otherwise.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing
+from datetime import date
+
+import core
+import store
+
+DAY = 24 * 3600
+
+def generate_timesheet(projects=100, sessions_per_project=100, pauses_per_session=2,
+                       running_ratio=0.05, paused_ratio=0.05, seed=0, end_time=None):
+    # A deterministic timesheet: each project's sessions follow each other
+    # back in time from end_time, with working-hours-like lengths and gaps
+    rng = random.Random(seed)
+    end_time = end_time if end_time is not None else 1700000000.0
+    data = {'projects': {}}
+    for project_index in range(projects):
+        sessions = []
+        cursor = end_time - rng.uniform(0, DAY)
+        for _ in range(sessions_per_project):
+            duration = rng.uniform(15 * 60, 4 * 3600)
+            start_time = cursor - duration
+            pauses = []
+            total_paused_time = 0
+            if pauses_per_session:
+                # Pauses spread evenly through the session, none overlapping
+                slot = duration / (pauses_per_session + 1)
+                for pause_index in range(rng.randint(0, pauses_per_session)):
+                    pause_start = start_time + slot * (pause_index + 1)
+                    pause_end = pause_start + rng.uniform(0, slot / 2)
+                    pauses.append({'pause_start': pause_start, 'pause_end': pause_end})
+                    total_paused_time += pause_end - pause_start
+            sessions.append({
+                'start_time': start_time,
+                'end_time': cursor,
+                'lap_time': duration - total_paused_time,
+                'pauses': pauses,
+                'total_paused_time': total_paused_time
+            })
+            cursor = start_time - rng.uniform(10 * 60, 2 * DAY)
+        sessions.reverse()
+
+        status = 'Stopped'
+        roll = rng.random()
+        if sessions and roll < running_ratio + paused_ratio:
+            # Reopen the latest session
+            current_session = sessions[-1]
+            current_session['end_time'] = None
+            current_session['lap_time'] = 0
+            status = 'Running'
+            if roll >= running_ratio:
+                current_session['pauses'].append({'pause_start': end_time - 60, 'pause_end': None})
+                status = 'Paused'
+        total_time = sum(session['lap_time'] for session in sessions)
+        data['projects'][f"Project {project_index:06d}"] = {
+            'status': status,
+            'sessions': sessions,
+            'total_time': total_time
+        }
+    return data
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def measure(func, repeat):
+    # Latency percentiles over repeat calls, then one more call under
+    # tracemalloc for the peak memory it allocates
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'n': repeat,
+        'mean': sum(timings) / len(timings),
+        'p50': percentile(timings, 0.50),
+        'p90': percentile(timings, 0.90),
+        'p99': percentile(timings, 0.99),
+        'max': timings[-1],
+        'peak_bytes': peak,
+    }
+
+class StubView:
+    # Just enough of VirtualTreeview for TimeTrackerApp.update_tree without a
+    # display: the rows a window would show are fetched and formatted
+    def __init__(self, fetch_rows, visible_rows=30):
+        self.fetch_rows = fetch_rows
+        self.visible_rows = visible_rows
+        self.row_count = 0
+        self.offset = 0
+        self.selected_row = None
+        self.rows = []
+
+    def set_row_count(self, row_count, keep_position=False):
+        self.row_count = row_count
+        if not keep_position:
+            self.offset = 0
+            self.selected_row = None
+        self.refresh_rows()
+
+    def refresh_rows(self):
+        self.offset = max(0, min(self.offset, self.row_count - self.visible_rows))
+        self.rows = self.fetch_rows(self.offset, min(self.offset + self.visible_rows, self.row_count))
+
+    def scroll_to(self, row):
+        self.offset = row
+        self.refresh_rows()
+
+class StubWidget:
+    def config(self, **options):
+        pass
+
+    def after(self, delay, func):
+        return 'after#0'
+
+    def after_cancel(self, timer_id):
+        pass
+
+class StubVar:
+    def __init__(self, value=''):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+def make_app():
+    # The real window if Tk can open a display, otherwise the same update
+    # logic on stand-in widgets
+    import app
+    try:
+        root = app.tk.Tk()
+        root.withdraw()
+        return app.TimeTrackerApp(root)
+    except app.tk.TclError:
+        pass
+
+    gui = object.__new__(app.TimeTrackerApp)
+    gui.root = StubWidget()
+    gui.view = StubView(gui.fetch_rows)
+    gui.search_var = StubVar()
+    for name in ['stop_button', 'pause_button', 'resume_pause_button', 'resume_button',
+                 'delete_button', 'edit_button', 'view_sessions_button', 'count_label']:
+        setattr(gui, name, StubWidget())
+    gui.row_names = []
+    gui.selected_name = None
+    gui.sort_key = 'name'
+    gui.sort_descending = False
+    gui.running_projects = set()
+    gui.rendered_generation = None
+    gui.timer_id = None
+    gui.timer_delay = None
+    return gui
+
+def use_data_file(path, storage):
+    core.DATA_FILE = path
+    store._stores.clear()
+    store._stores[path] = store.create_store(path, storage)
+    return store._stores[path]
+
+def benchmark_size(sessions, projects, pauses_per_session, storage, repeat, workdir):
+    sessions_per_project = max(1, sessions // projects)
+    data = generate_timesheet(projects, sessions_per_project, pauses_per_session)
+    path = os.path.join(workdir, f"timesheet-{sessions}-{storage}.json")
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    data_store = use_data_file(path, storage)
+    data_store.load()
+    project_name = next(iter(data['projects']))
+    csv_path = os.path.join(workdir, 'export.csv')
+
+    def cold_load():
+        data_store.invalidate()
+        data_store.load()
+
+    def transition():
+        # A pause/resume pair on a running project, or a stop/resume pair
+        status = data_store.load()['projects'][project_name]['status']
+        if status == 'Running':
+            core.pause_project(project_name)
+            core.resume_paused_project(project_name)
+        elif status == 'Paused':
+            core.resume_paused_project(project_name)
+        else:
+            core.resume_project(project_name)
+
+    gui = make_app()
+
+    def update_tree_refresh():
+        gui.rendered_generation = None
+        gui.update_tree()
+
+    def view_sessions():
+        count = data_store.count_sessions(project_name)
+        rows = data_store.session_page(project_name, 0, 100)
+        [(core.format_timestamp(row[1]), core.format_time(row[3])) for row in rows]
+        return count
+
+    def report():
+        core.report_text(core.report())
+
+    def search_projects():
+        # Typing a project's name into the search box, one key at a time
+        data_store.project_index().cache.clear()
+        for length in range(1, len(project_name) + 1):
+            core.find_projects(project_name[:length])
+
+    today = date.fromtimestamp(time.time())
+    operations = [
+        ('load_data (cold)', cold_load, max(1, repeat // 10)),
+        ('load_data (cached)', core.load_data, repeat),
+        ('save_data', lambda: core.save_data(core.load_data()), max(1, repeat // 10)),
+        ('transition', transition, repeat),
+        ('update_tree (refresh)', update_tree_refresh, max(1, repeat // 10)),
+        ('update_tree (tick)', gui.update_tree, repeat),
+        ('view_sessions', view_sessions, repeat),
+        ('search projects (typing)', search_projects, max(1, repeat // 10)),
+        ('sort projects by total', lambda: core.find_projects('', 'total', True), max(1, repeat // 10)),
+        ('report', report, repeat),
+        ('timeline (day)', lambda: core.timeline(1700000000 - DAY, 1700000000), repeat),
+        ('breakdown (year by week)', lambda: core.breakdown(today.replace(year=today.year - 1), today, 'week'), repeat),
+        ('analytics', core.analytics, max(1, repeat // 10)),
+        ('analytics (30 days)', lambda: core.analytics(1700000000 - 30 * DAY, 1700000000), max(1, repeat // 10)),
+        ('export_report_to_csv', lambda: core.export_report_to_csv(csv_path), max(1, repeat // 10)),
+    ]
+
+    results = []
+    for name, func, operation_repeat in operations:
+        result = measure(func, operation_repeat)
+        result.update({'operation': name, 'sessions': sessions, 'projects': projects, 'storage': storage})
+        results.append(result)
+        print(f"{storage:8} {sessions:>9} {name:26} p50 {result['p50'] * 1000:10.3f} ms"
+              f"  p99 {result['p99'] * 1000:10.3f} ms  peak {result['peak_bytes'] / 1e6:8.1f} MB", flush=True)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def stress_worker(path, storage, worker, cycles):
+    # One process hammering transitions on its own project
+    use_data_file(path, storage)
+    project_name = f"Worker {worker:03d}"
+    core.start_project(project_name)
+    for _ in range(cycles):
+        core.pause_project(project_name)
+        core.resume_paused_project(project_name)
+        core.stop_project(project_name)
+        core.resume_project(project_name)
+    core.stop_project(project_name)
+
+def cmd_stress(args):
+    # N processes write to one data file at once; every transition of every
+    # process must be in the file afterwards
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'timesheet.json')
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            pool.starmap(stress_worker, [(path, args.storage, worker, args.cycles) for worker in range(args.processes)])
+        elapsed = time.perf_counter() - start
+
+        data = use_data_file(path, args.storage).load()
+        lost = 0
+        for worker in range(args.processes):
+            project = data['projects'].get(f"Worker {worker:03d}")
+            if project is None:
+                lost += 4 * args.cycles + 2
+                continue
+            sessions = project['sessions']
+            pauses = sum(len(session['pauses']) for session in sessions)
+            # start + stop per session, pause + resume per pause
+            lost += (4 * args.cycles + 2) - (2 * len(sessions) + 2 * pauses)
+            if project['status'] != 'Stopped':
+                lost += 1
+        events = args.processes * (4 * args.cycles + 2)
+        print(f"{args.storage}: {events} transitions from {args.processes} processes in {elapsed:.2f} s, {lost} lost")
+        return 1 if lost else 0
+
+def cmd_formats(args):
+    # File size and save/load time of the JSON and binary data file formats
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for sessions in [int(size) for size in args.sizes.split(',')]:
+            projects = min(args.projects, sessions)
+            data = generate_timesheet(projects, max(1, sessions // projects), args.pauses)
+            for file_format in ['json', 'binary']:
+                path = os.path.join(workdir, f"timesheet-{sessions}.{file_format}")
+                operations = [
+                    ('save', lambda: store.write_data_file(path, data, file_format)),
+                    ('load', lambda: store.load_data_file(path)),
+                ]
+                for name, func in operations:
+                    result = measure(func, args.repeat)
+                    result.update({'operation': name, 'sessions': sessions, 'projects': projects,
+                                   'storage': file_format, 'file_bytes': os.path.getsize(path)})
+                    results.append(result)
+                    print(f"{file_format:8} {sessions:>9} {name:6} p50 {result['p50'] * 1000:10.3f} ms"
+                          f"  size {result['file_bytes'] / 1e6:8.2f} MB  peak {result['peak_bytes'] / 1e6:8.1f} MB",
+                          flush=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': git_commit(), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'created': time.time(), 'results': results}, f, indent=1)
+        print(f"Wrote {args.output}")
+
+def cmd_generate(args):
+    data = generate_timesheet(args.projects, max(1, args.sessions // args.projects), args.pauses,
+                              args.running, args.paused, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(data, f)
+    print(f"Wrote {args.output}")
+
+def cmd_run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for storage in args.storage.split(','):
+            for sessions in [int(size) for size in args.sizes.split(',')]:
+                projects = min(args.projects, sessions)
+                results.extend(benchmark_size(sessions, projects, args.pauses, storage, args.repeat, workdir))
+    output = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.time(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=1)
+        print(f"Wrote {args.output}")
+
+def cmd_compare(args):
+    # p50 of every operation in the second run relative to the first
+    with open(args.before) as f:
+        before = {(r['storage'], r['sessions'], r['operation']): r for r in json.load(f)['results']}
+    with open(args.after) as f:
+        after = json.load(f)['results']
+    for result in after:
+        key = (result['storage'], result['sessions'], result['operation'])
+        if key in before and before[key]['p50']:
+            ratio = result['p50'] / before[key]['p50']
+            flag = '  <-- slower' if ratio > 1 + args.threshold else ''
+            print(f"{key[0]:8} {key[1]:>9} {key[2]:26} {ratio:6.2f}x{flag}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Timesheet benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    command = subparsers.add_parser('generate', help="write a synthetic timesheet.json")
+    command.add_argument('--sessions', type=int, default=100000, help="total number of sessions")
+    command.add_argument('--projects', type=int, default=100)
+    command.add_argument('--pauses', type=int, default=2, help="maximum pauses per session")
+    command.add_argument('--running', type=float, default=0.05, help="share of running projects")
+    command.add_argument('--paused', type=float, default=0.05, help="share of paused projects")
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('-o', '--output', default='timesheet-bench.json')
+    command.set_defaults(func=cmd_generate)
+
+    command = subparsers.add_parser('run', help="time the core operations over several data sizes")
+    command.add_argument('--sizes', default='1000,10000,100000', help="comma separated session counts, up to 1000000")
+    command.add_argument('--projects', type=int, default=100)
+    command.add_argument('--pauses', type=int, default=2)
+    command.add_argument('--storage', default='json', help="comma separated storage engines")
+    command.add_argument('--repeat', type=int, default=20)
+    command.add_argument('-o', '--output', help="write the results as JSON")
+    command.set_defaults(func=cmd_run)
+
+    command = subparsers.add_parser('compare', help="compare two result files")
+    command.add_argument('before')
+    command.add_argument('after')
+    command.add_argument('--threshold', type=float, default=0.10)
+    command.set_defaults(func=cmd_compare)
+
+    command = subparsers.add_parser('stress', help="concurrent writers on one data file")
+    command.add_argument('--processes', type=int, default=8)
+    command.add_argument('--cycles', type=int, default=100, help="pause/resume/stop/resume cycles per process")
+    command.add_argument('--storage', default='json')
+    command.set_defaults(func=cmd_stress)
+
+    command = subparsers.add_parser('formats', help="compare the JSON and binary file formats")
+    command.add_argument('--sizes', default='10000,100000', help="comma separated session counts")
+    command.add_argument('--projects', type=int, default=100)
+    command.add_argument('--pauses', type=int, default=2)
+    command.add_argument('--repeat', type=int, default=5)
+    command.add_argument('-o', '--output', help="write the results as JSON")
+    command.set_defaults(func=cmd_formats)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+# Compact binary form of the timesheet document. Instead of one JSON object
+# per session with the same five keys spelled out every time, every field is
+# stored as a column of fixed-width numbers:
+#
+#   'TSHB', version                         header
+#   string table                            project names and statuses, once each
+#   project columns                         name, status, total_time, session count
+#   session columns                         start, end, lap, paused, pause count
+#   pause columns                           start, end
+#   rollup columns                          project, day ordinal, seconds
+#   JSON of everything else                 (archive index, journal_seq, ...)
+#
+# None is stored as NaN. read_data_file recognizes the header, so a binary
+# file loads like a JSON one and keeps its format when written back.
+#   python binary_format.py [--to binary|json] [FILE]    converts in place
+
+import sys
+import json
+import struct
+import argparse
+from array import array
+from datetime import date
+from itertools import accumulate, islice
+
+from session_columns import SessionColumns
+
+MAGIC = b'TSHB'
+VERSION = 1
+HEADER = struct.Struct('<4sH')
+COUNT = struct.Struct('<I')
+
+NAN = float('nan')
+
+# Project keys held in the columns; any others go into the JSON part
+PROJECT_KEYS = ['status', 'sessions', 'total_time']
+
+# Typecodes of the columns, in file order
+COLUMNS = [
+    ('project_names', 'I'), ('project_statuses', 'I'), ('project_totals', 'd'), ('session_counts', 'I'),
+    ('starts', 'd'), ('ends', 'd'), ('laps', 'd'), ('paused', 'd'), ('pause_counts', 'I'),
+    ('pause_starts', 'd'), ('pause_ends', 'd'),
+    ('rollup_names', 'I'), ('rollup_days', 'I'), ('rollup_seconds', 'd'),
+]
+
+class FormatError(json.JSONDecodeError):
+    # A damaged binary file is reported exactly like damaged JSON
+    def __init__(self, message):
+        super().__init__(message, '', 0)
+
+def is_binary(raw):
+    return raw[:len(MAGIC)] == MAGIC
+
+def encode(data):
+    strings = {}
+    def intern(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    extras = {'data': {key: value for key, value in data.items() if key not in ('projects', 'rollups')},
+              'projects': {}}
+    for project_name, project in data['projects'].items():
+        columns['project_names'].append(intern(project_name))
+        columns['project_statuses'].append(intern(project['status']))
+        columns['project_totals'].append(project['total_time'])
+        columns['session_counts'].append(len(project['sessions']))
+        project_extras = {key: value for key, value in project.items() if key not in PROJECT_KEYS}
+        if project_extras:
+            extras['projects'][project_name] = project_extras
+        sessions = project['sessions']
+        if isinstance(sessions, SessionColumns):
+            # Already the same columns, NaN for None included
+            for name in ['starts', 'ends', 'laps', 'paused', 'pause_starts', 'pause_ends']:
+                columns[name].extend(getattr(sessions, name))
+            offsets = sessions.pause_offsets
+            columns['pause_counts'].extend(array('I', [b - a for a, b in zip(offsets, offsets[1:])]))
+            continue
+        for session in sessions:
+            end_time = session['end_time']
+            pauses = session.get('pauses', [])
+            columns['starts'].append(session['start_time'])
+            columns['ends'].append(NAN if end_time is None else end_time)
+            columns['laps'].append(session['lap_time'])
+            columns['paused'].append(session.get('total_paused_time', 0))
+            columns['pause_counts'].append(len(pauses))
+            for pause in pauses:
+                pause_end = pause.get('pause_end')
+                columns['pause_starts'].append(pause['pause_start'])
+                columns['pause_ends'].append(NAN if pause_end is None else pause_end)
+
+    has_rollups = 'rollups' in data
+    for project_name, project_rollups in data.get('rollups', {}).items():
+        name_index = intern(project_name)
+        for day, seconds in project_rollups.items():
+            columns['rollup_names'].append(name_index)
+            columns['rollup_days'].append(date.fromisoformat(day).toordinal())
+            columns['rollup_seconds'].append(seconds)
+    extras['rollups'] = has_rollups
+
+    parts = [HEADER.pack(MAGIC, VERSION), COUNT.pack(len(strings))]
+    for text in strings:
+        encoded = text.encode()
+        parts.append(COUNT.pack(len(encoded)))
+        parts.append(encoded)
+    for name, typecode in COLUMNS:
+        column = columns[name]
+        if sys.byteorder == 'big':
+            column.byteswap()
+        parts.append(COUNT.pack(len(column)))
+        parts.append(column.tobytes())
+    encoded = json.dumps(extras).encode()
+    parts.append(COUNT.pack(len(encoded)))
+    parts.append(encoded)
+    return b''.join(parts)
+
+def decode(raw, columnar=False):
+    # With columnar the sessions come back as SessionColumns over slices of
+    # the file's arrays instead of dicts
+    try:
+        return _decode(raw, columnar)
+    except FormatError:
+        raise
+    except (struct.error, ValueError, IndexError, KeyError) as e:
+        raise FormatError(f"Damaged binary timesheet: {e}")
+
+def _decode(raw, columnar):
+    view = memoryview(raw)
+    magic, version = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise FormatError("Not a binary timesheet")
+    if version != VERSION:
+        raise FormatError(f"Unsupported binary timesheet version {version}")
+    pos = HEADER.size
+
+    def read_count():
+        nonlocal pos
+        count, = COUNT.unpack_from(view, pos)
+        pos += COUNT.size
+        return count
+
+    strings = []
+    for _ in range(read_count()):
+        length = read_count()
+        strings.append(str(view[pos:pos + length], 'utf-8'))
+        pos += length
+
+    columns = {}
+    for name, typecode in COLUMNS:
+        column = array(typecode)
+        size = read_count() * column.itemsize
+        if pos + size > len(view):
+            raise FormatError("Binary timesheet is truncated")
+        column.frombytes(view[pos:pos + size])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns[name] = column
+        pos += size
+    length = read_count()
+    extras = json.loads(str(view[pos:pos + length], 'utf-8'))
+
+    data = extras['data']
+    projects = data['projects'] = {}
+    project_sessions = _column_sessions(columns) if columnar else _dict_sessions(columns)
+    for name_index, status_index, total_time, sessions in zip(
+            columns['project_names'], columns['project_statuses'], columns['project_totals'], project_sessions):
+        project_name = strings[name_index]
+        project = {'status': strings[status_index], 'sessions': sessions, 'total_time': total_time}
+        project.update(extras['projects'].get(project_name, {}))
+        projects[project_name] = project
+
+    if extras['rollups']:
+        rollups = data['rollups'] = {}
+        for name_index, day, seconds in zip(columns['rollup_names'], columns['rollup_days'], columns['rollup_seconds']):
+            rollups.setdefault(strings[name_index], {})[date.fromordinal(day).isoformat()] = seconds
+    return data
+
+def _dict_sessions(columns):
+    # Each project's sessions as a list of dicts
+    sessions_iter = zip(columns['starts'], columns['ends'], columns['laps'], columns['paused'], columns['pause_counts'])
+    pauses_iter = zip(columns['pause_starts'], columns['pause_ends'])
+    for session_count in columns['session_counts']:
+        sessions = []
+        for start_time, end_time, lap_time, paused_time, pause_count in islice(sessions_iter, session_count):
+            pauses = [{'pause_start': pause_start, 'pause_end': None if pause_end != pause_end else pause_end}
+                      for pause_start, pause_end in islice(pauses_iter, pause_count)] if pause_count else []
+            sessions.append({
+                'start_time': start_time,
+                # NaN is the only value not equal to itself
+                'end_time': None if end_time != end_time else end_time,
+                'lap_time': lap_time,
+                'pauses': pauses,
+                'total_paused_time': paused_time
+            })
+        yield sessions
+
+def _column_sessions(columns):
+    # Each project's sessions as SessionColumns over slices of the arrays
+    pause_offsets = array('I', [0])
+    pause_offsets.extend(accumulate(columns['pause_counts']))
+    if len(pause_offsets) != len(columns['starts']) + 1 or pause_offsets[-1] != len(columns['pause_starts']):
+        raise FormatError("Binary timesheet is inconsistent")
+    lo = 0
+    for session_count in columns['session_counts']:
+        hi = lo + session_count
+        first, last = pause_offsets[lo], pause_offsets[hi]
+        yield SessionColumns.from_arrays(
+            columns['starts'][lo:hi], columns['ends'][lo:hi], columns['laps'][lo:hi], columns['paused'][lo:hi],
+            array('I', [offset - first for offset in pause_offsets[lo:hi + 1]]),
+            columns['pause_starts'][first:last], columns['pause_ends'][first:last])
+        lo = hi
+
+def convert(path, to_format):
+    # Rewrites the data file in place, under the same lock as every writer
+    from store import file_lock, read_data_file, write_data_file
+    with file_lock(path):
+        data = read_data_file(path)
+        write_data_file(path, data, to_format)
+
+def main(argv=None):
+    from core import DATA_FILE
+    parser = argparse.ArgumentParser(description="Convert a timesheet between JSON and the binary format")
+    parser.add_argument('--to', choices=['binary', 'json'], default='binary')
+    parser.add_argument('path', nargs='?', default=DATA_FILE)
+    args = parser.parse_args(argv)
+    convert(args.path, args.to)
+    print(f"Converted {args.path} to {args.to}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+
+import tkinter as tk
+from tkinter import ttk
+from tkinter import messagebox
+from datetime import date
+
+import core
+from core import format_time
+from rollups import GRANULARITIES
+
+class BreakdownWindow:
+    # Time per project per day, week or month over a date range, read from
+    # the per-day rollups rather than the sessions
+    def __init__(self, root):
+        self.window = tk.Toplevel(root)
+        self.window.title("Time Breakdown")
+
+        today = date.today()
+        controls = ttk.Frame(self.window, padding=(5, 5))
+        controls.pack(fill='x')
+        ttk.Label(controls, text="From (YYYY-MM-DD):").pack(side='left')
+        self.from_entry = ttk.Entry(controls, width=12)
+        self.from_entry.insert(0, today.replace(day=1).isoformat())
+        self.from_entry.pack(side='left', padx=(2, 10))
+        ttk.Label(controls, text="To:").pack(side='left')
+        self.to_entry = ttk.Entry(controls, width=12)
+        self.to_entry.insert(0, today.isoformat())
+        self.to_entry.pack(side='left', padx=(2, 10))
+        ttk.Label(controls, text="By:").pack(side='left')
+        self.granularity_var = tk.StringVar(value='day')
+        ttk.Combobox(controls, textvariable=self.granularity_var, values=GRANULARITIES,
+                     state='readonly', width=8).pack(side='left', padx=(2, 10))
+        ttk.Button(controls, text="Show", command=self.refresh).pack(side='left')
+
+        columns = ('Period', 'Project Name', 'Time Spent')
+        self.tree = ttk.Treeview(self.window, columns=columns, show='headings')
+        self.tree.heading('Period', text='Period')
+        self.tree.heading('Project Name', text='Project Name')
+        self.tree.heading('Time Spent', text='Time Spent')
+        self.tree.column('Period', width=100)
+        self.tree.column('Project Name', width=200)
+        self.tree.column('Time Spent', width=100)
+        self.tree.pack(fill='both', expand=True)
+
+        self.refresh()
+
+    def refresh(self):
+        try:
+            start_day = date.fromisoformat(self.from_entry.get().strip())
+            end_day = date.fromisoformat(self.to_entry.get().strip())
+        except ValueError:
+            messagebox.showerror("Invalid Date", "Please enter dates as YYYY-MM-DD.", parent=self.window)
+            return
+        self.tree.delete(*self.tree.get_children())
+        for period, project_name, seconds in core.breakdown(start_day, end_day, self.granularity_var.get()):
+            self.tree.insert('', 'end', values=(period, project_name, format_time(seconds)))
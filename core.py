@@ -0,0 +1,457 @@
+
+# UI-free timesheet operations. Nothing here imports tkinter: the functions
+# return results or raise TransitionError, and both the GUI (app.py) and the
+# command line (timesheet.py) are thin layers on top.
+
+import os
+import sys
+import csv
+import json
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+from history import get_history
+from instrument import record_bytes, timed
+from rollups import group_totals
+from store import get_store, set_store
+from stream_loader import DamagedDataFile
+from sync import changed_keys, get_sync_log
+from timeline import find_overlaps
+from transitions import TransitionError, inverse_record
+
+# Adjust data file path to be in the user's home directory
+DATA_FILE = os.path.join(Path.home(), 'timesheet.json')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def report_data_error(message):
+    print(message, file=sys.stderr)
+
+# Called with a message when the data file cannot be read; the GUI replaces
+# this with an error dialog
+on_data_error = report_data_error
+
+def get_data_store():
+    return get_store(DATA_FILE)
+
+def start_background_writer():
+    # From here on changes are applied in memory and written by a separate
+    # thread (see background_store.py); the GUI uses this so it never waits
+    # for the disk
+    from background_store import BackgroundStore
+    data_store = BackgroundStore(DATA_FILE)
+    # The undo history and the sync log are written on the writer thread too
+    data_store.commit_batch = commit_recorded
+    set_store(DATA_FILE, data_store)
+    data_store.start()
+
+def stop_background_writer():
+    # Writes out whatever is still queued
+    get_data_store().close()
+
+@timed('load_data')
+def load_data():
+    # Served from memory unless the file changed on disk since the last read
+    store = get_data_store()
+    try:
+        return store.load()
+    except DamagedDataFile as e:
+        on_data_error(e.report)
+        return store.load()
+    except json.JSONDecodeError:
+        on_data_error("Failed to read data file. It may be corrupted.")
+        return store.load()
+
+@timed('save_data')
+def save_data(data):
+    get_data_store().save(data)
+
+@timed('commit')
+def commit(record, label=None):
+    # Apply a transition record through the configured storage engine. With
+    # a label the change goes into the undo history under that name.
+    data = load_data()
+    store = get_data_store()
+    if store.writes_behind:
+        # Queued with its label; the writer thread passes it on to
+        # commit_recorded, so nothing here waits for a file
+        return store.commit(record, label)
+    history = local_history()
+    undo_record = None
+    if label is not None and history is not None:
+        undo_record = inverse_record(data, record, all_sessions)
+    with get_sync_log(DATA_FILE).recording(store, record, all_sessions):
+        data = store.commit(record)
+    if undo_record is not None:
+        history.push(label, undo_record, record)
+    return data
+
+def commit_recorded(store, entries):
+    # store.commit_many of [(record, undo label or None)] that also writes
+    # the undo history and the sync log for the records that were applied,
+    # as commit does for one; returns the errors. The background writer
+    # commits with this, on its own thread and against its own store.
+    records = [record for record, _ in entries]
+    if local_history(store) is None:
+        return store.commit_many(records)
+    def store_sessions(project_name):
+        return list(store.project_sessions(project_name))
+    with get_sync_log(DATA_FILE).recording_many(store, store_sessions) as sync_keys:
+        # What each record changes, worked out just before it is applied
+        undo_records = []
+        changed = []
+        def before(data, record):
+            label = entries[len(undo_records)][1]
+            undo_records.append(None if label is None else inverse_record(data, record, store_sessions))
+            changed.append([] if sync_keys is None else changed_keys(data, record, store_sessions))
+        errors = store.commit_many(records, before)
+        if sync_keys is not None:
+            for keys, error in zip(changed, errors):
+                if error is None:
+                    sync_keys.extend(keys)
+    history = get_history(DATA_FILE)
+    for (record, label), undo_record, error in zip(entries, undo_records, errors):
+        if error is None and undo_record is not None:
+            try:
+                history.push(label, undo_record, record)
+            except OSError:
+                # The change is saved; only the way back is lost
+                pass
+    return errors
+
+def local_history(store=None):
+    # The undo history of the data file, or None for a timesheet server's
+    # data: others change it too, and their changes aren't in a history
+    # kept here
+    from remote_store import RemoteStore
+    if store is None:
+        store = get_data_store()
+    if isinstance(getattr(store, 'disk', store), RemoteStore):
+        return None
+    return get_history(DATA_FILE)
+
+def all_sessions(project_name):
+    # Every session of a project, archived ones included
+    return list(get_data_store().project_sessions(project_name))
+
+def sync(server=None):
+    # Exchanges changes with the sync server (sync.py); returns (changes
+    # sent, changes received)
+    from remote_store import RemoteStore
+    data_store = get_data_store()
+    if isinstance(getattr(data_store, 'disk', data_store), RemoteStore):
+        raise TransitionError("Sync Not Possible", "The timesheet server's data is shared already; sync is for local data files.")
+    # Changes still queued are written down for the sync log first
+    data_store.flush()
+    return get_sync_log(DATA_FILE).sync(data_store, all_sessions, server)
+
+def start_project(project_name):
+    data = commit({'op': 'start', 'project': project_name, 'time': time.time()}, f"Start '{project_name}'")
+    return data['projects'][project_name]
+
+def stop_project(project_name):
+    # Returns the time spent in the session that was just closed
+    record = {'op': 'stop', 'project': project_name, 'time': time.time()}
+    data = commit(record, f"Stop '{project_name}'")
+    # The session the record closed, known by its end time
+    for session in reversed(data['projects'][project_name]['sessions']):
+        if session['end_time'] == record['time']:
+            return session['lap_time']
+    raise TransitionError("Project Not Active", f"Project '{project_name}' was not stopped.")
+
+def pause_project(project_name):
+    data = commit({'op': 'pause', 'project': project_name, 'time': time.time()}, f"Pause '{project_name}'")
+    return data['projects'][project_name]
+
+def resume_paused_project(project_name):
+    data = commit({'op': 'resume_paused', 'project': project_name, 'time': time.time()}, f"Resume '{project_name}' from pause")
+    return data['projects'][project_name]
+
+def resume_project(project_name):
+    data = commit({'op': 'resume', 'project': project_name, 'time': time.time()}, f"Resume '{project_name}'")
+    return data['projects'][project_name]
+
+def delete_project(project_name):
+    commit({'op': 'delete', 'project': project_name}, f"Delete '{project_name}'")
+
+def edit_project_name(old_project_name, new_project_name):
+    data = commit({'op': 'rename', 'project': old_project_name, 'new_name': new_project_name},
+                  f"Rename '{old_project_name}' to '{new_project_name}'")
+    return data['projects'][new_project_name]
+
+def clear_all_data():
+    commit({'op': 'clear'}, "Clear all data")
+
+def undo():
+    # Label of the change that was undone, or None if there was none
+    return undo_history().step('undo', commit_now)
+
+def redo():
+    return undo_history().step('redo', commit_now)
+
+def undo_history():
+    history = local_history()
+    if history is None:
+        raise TransitionError("Undo Not Possible", "Changes to the timesheet server's shared data can't be undone or redone.")
+    # Changes still queued go into the history first, so the entry undone
+    # is the newest
+    get_data_store().flush()
+    return history
+
+def commit_now(record):
+    # commit that has been written when it returns, or raised the
+    # TransitionError the storage engine turned the record down with; undo
+    # and redo move their entry only then
+    store = get_data_store()
+    if store.writes_behind:
+        store.commit_and_wait(record)
+    else:
+        commit(record)
+
+def undo_labels():
+    # (next change to undo, next change to redo), None where there is none
+    history = local_history()
+    if history is None:
+        return None, None
+    queued = get_data_store().queued_label()
+    if queued is not None:
+        # Not in the history yet, but the next change to undo once written
+        return queued, None
+    return history.labels()
+
+# Main list orders; within a status the projects stay in name order
+PROJECT_SORTS = ['name', 'total', 'status']
+STATUS_ORDER = {'Running': 0, 'Paused': 1, 'Stopped': 2}
+
+@timed('find_projects')
+def find_projects(query='', sort='name', descending=False):
+    # Names of the projects whose name contains query, ignoring case
+    projects = load_data()['projects']
+    names = get_data_store().project_index().search(query)
+    if sort == 'total':
+        names.sort(key=lambda project_name: projects[project_name]['total_time'], reverse=descending)
+    elif sort == 'status':
+        names.sort(key=lambda project_name: STATUS_ORDER.get(projects[project_name]['status'], 3), reverse=descending)
+    elif descending:
+        names.reverse()
+    return names
+
+def project_exists(project_name):
+    return project_name in load_data()['projects']
+
+@timed('status')
+def status():
+    # [(project name, status, elapsed time in the current session)]
+    load_data()
+    now = time.time()
+    result = []
+    for project_name, project_status, start_time, total_paused_time, pause_start in get_data_store().active_projects():
+        end = pause_start if project_status == 'Paused' else now
+        result.append((project_name, project_status, (end - start_time) - total_paused_time))
+    return result
+
+def status_text(active):
+    running_projects = [row for row in active if row[1] == 'Running']
+    paused_projects = [row for row in active if row[1] == 'Paused']
+    if not running_projects and not paused_projects:
+        return "No projects are currently running or paused."
+    text = ""
+    if running_projects:
+        text += "Currently running projects:\n"
+        for project_name, _, elapsed_time in running_projects:
+            text += f" - {project_name}: {format_time(elapsed_time)}\n"
+    if paused_projects:
+        text += "\nCurrently paused projects:\n"
+        for project_name, _, elapsed_time in paused_projects:
+            text += f" - {project_name}: {format_time(elapsed_time)} (Paused)\n"
+    return text
+
+@timed('report')
+def report():
+    # [(project name, total time)]
+    load_data()
+    return get_data_store().project_totals()
+
+def report_text(totals):
+    text = "Total time spent on projects:\n"
+    total_all_projects = 0
+    for project_name, total_seconds in totals:
+        text += f" - {project_name}: {format_time(total_seconds)}\n"
+        total_all_projects += total_seconds
+    text += f"\nTotal time spent on all projects: {format_time(total_all_projects)}"
+    return text
+
+@timed('breakdown')
+def breakdown(start_day, end_day, granularity='day'):
+    # [(period, project name, seconds)] for the dates start_day..end_day,
+    # answered from the per-day rollups of closed sessions
+    load_data()
+    return group_totals(get_data_store().day_totals(start_day, end_day), granularity)
+
+def breakdown_text(rows):
+    if not rows:
+        return "No time recorded in this period."
+    text = ""
+    current_period = None
+    for period, project_name, seconds in rows:
+        if period != current_period:
+            if current_period is not None:
+                text += "\n"
+            text += f"{period}:\n"
+            current_period = period
+        text += f" - {project_name}: {format_time(seconds)}\n"
+    return text
+
+@timed('analytics')
+def analytics(start=None, end=None):
+    # Session length percentiles, paused share and the hours of the week
+    # worked, for the sessions starting in [start, end) (see analytics.py)
+    load_data()
+    from analytics import analyze
+    return analyze(get_data_store().session_table(), start, end)
+
+@timed('timeline')
+def timeline(start, end):
+    # [(start, end or None, project name)] of the sessions with any part in
+    # [start, end), ordered by start, answered from the interval index
+    load_data()
+    return get_data_store().sessions_between(start, end)
+
+def running_alongside(project_name):
+    # Other running projects, whose sessions overlap the one just opened
+    projects = load_data()['projects']
+    return sorted(other for other in get_data_store().open_sessions()
+                  if other != project_name and projects.get(other, {}).get('status') == 'Running')
+
+def overlap_note(project_name):
+    others = running_alongside(project_name)
+    if not others:
+        return ""
+    return f"\nAlso running: {', '.join(others)}"
+
+def timeline_rows(rows, start, end):
+    # [(day, start, end, project name, [projects it overlaps with], open)]
+    # with sessions cut to [start, end) and at local midnight; open sessions
+    # run until now
+    now = time.time()
+    overlapping = {}
+    for earlier, later in find_overlaps(rows):
+        overlapping.setdefault(earlier, set()).add(later[2])
+        overlapping.setdefault(later, set()).add(earlier[2])
+    result = []
+    for row in rows:
+        piece_start = max(row[0], start)
+        session_end = min(now if row[1] is None else row[1], end)
+        others = sorted(overlapping.get(row, ()))
+        while piece_start < session_end:
+            day = datetime.fromtimestamp(piece_start).date()
+            next_midnight = datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+            piece_end = min(session_end, next_midnight)
+            result.append((day, piece_start, piece_end, row[2], others, row[1] is None and piece_end == session_end))
+            piece_start = piece_end
+    result.sort(key=lambda piece: (piece[1], piece[3]))
+    return result
+
+def format_clock(timestamp, day):
+    # Time of day; the midnight that ends day is 24:00:00
+    moment = datetime.fromtimestamp(timestamp)
+    return moment.strftime('%H:%M:%S') if moment.date() == day else '24:00:00'
+
+def timeline_text(pieces):
+    if not pieces:
+        return "No sessions in this period."
+    text = ""
+    current_day = None
+    for day, start, end, project_name, others, is_open in pieces:
+        if day != current_day:
+            if current_day is not None:
+                text += "\n"
+            text += f"{day.isoformat()} ({day.strftime('%A')}):\n"
+            current_day = day
+        end_text = 'now' if is_open else format_clock(end, day)
+        text += f" - {format_clock(start, day)}-{end_text} {project_name} ({format_time(end - start)})"
+        if others:
+            text += f", overlaps {', '.join(others)}"
+        text += "\n"
+    return text
+
+CSV_FIELDNAMES = ['Project Name', 'Session', 'Start Time', 'End Time', 'Lap Time (h:m:s)', 'Total Time (h:m:s)', 'Pauses']
+
+# Rows handed to the csv writer at a time
+CSV_BATCH_SIZE = 1000
+
+def export_rows():
+    # (rows, number of rows) for the detailed report. The rows are a generator
+    # that may be consumed on another thread.
+    load_data()
+    store = get_data_store()
+    return store.iter_export_rows(), store.count_all_sessions()
+
+def iter_csv_rows(rows):
+    for project_name, total_time, idx, start_time, end_time, lap_time, pauses in rows:
+        pauses_info = ''.join(
+            f"Start: {format_timestamp(pause_start)}, End: {format_timestamp(pause_end) if pause_end else 'Ongoing'}; "
+            for pause_start, pause_end in pauses)
+        yield [
+            project_name,
+            idx,
+            format_timestamp(start_time),
+            format_timestamp(end_time) if end_time else 'Running',
+            format_time(lap_time) if lap_time else 'Running',
+            format_time(total_time),
+            pauses_info
+        ]
+
+@timed('export_report_to_csv')
+def write_csv_report(file_path, rows, total=None, progress=None, cancel=None):
+    # Streams rows to file_path in batches. progress(done, total) is called
+    # after every batch; if the cancel event gets set the partial file is
+    # removed and False is returned.
+    done = 0
+    with open(file_path, 'w', newline='', buffering=1024 * 1024) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_FIELDNAMES)
+        batch = []
+        for row in iter_csv_rows(rows):
+            batch.append(row)
+            if len(batch) >= CSV_BATCH_SIZE:
+                writer.writerows(batch)
+                done += len(batch)
+                batch = []
+                if progress:
+                    progress(done, total)
+                if cancel is not None and cancel.is_set():
+                    break
+        else:
+            writer.writerows(batch)
+            done += len(batch)
+            if progress:
+                progress(done, total)
+            record_bytes('export_report_to_csv', csvfile.tell())
+            return True
+    os.remove(file_path)
+    return False
+
+def export_report_to_csv(file_path):
+    rows, total = export_rows()
+    return write_csv_report(file_path, rows, total)
+
+@lru_cache(maxsize=4096)
+def _minute_prefix(minute):
+    # UTC offsets are whole minutes, so everything down to the minute can be
+    # shared by all timestamps in the same minute
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(minute * 60))
+
+def format_timestamp(timestamp):
+    # Same output as time.strftime(TIME_FORMAT, time.localtime(timestamp))
+    seconds = int(timestamp)
+    return f"{_minute_prefix(seconds // 60)}:{seconds % 60:02d}"
+
+def format_time(seconds):
+    seconds = int(seconds)
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    seconds = seconds % 60
+    return f"{hours}h {minutes}m {seconds}s"
@@ -0,0 +1,58 @@
+
+import time
+import tkinter as tk
+from tkinter import ttk
+from tkinter import messagebox
+
+import instrument
+
+# Refresh interval of the numbers on screen
+REFRESH_MS = 1000
+
+class DebugWindow:
+    # Live view of the instrumentation counters. Opened with Ctrl+Shift+D;
+    # turns profiling on for the rest of the session if it was off.
+    def __init__(self, root):
+        instrument.enable()
+        self.window = tk.Toplevel(root)
+        self.window.title("Debug: Operation Timings")
+
+        columns = ('Operation', 'Calls', 'Mean', 'p50', 'p90', 'p99', 'Max', 'Bytes')
+        self.tree = ttk.Treeview(self.window, columns=columns, show='headings', height=10)
+        for column in columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=80, anchor='e')
+        self.tree.column('Operation', width=160, anchor='w')
+        self.tree.pack(fill='both', expand=True)
+
+        ttk.Label(self.window, text="Recent slow calls:").pack(anchor='w', padx=5)
+        self.slow_list = tk.Listbox(self.window, height=6)
+        self.slow_list.pack(fill='both', expand=True, padx=5)
+
+        buttons = ttk.Frame(self.window, padding=(5, 5))
+        buttons.pack(fill='x')
+        ttk.Button(buttons, text="Dump JSON", command=self.dump).pack(side='left', padx=2)
+        ttk.Button(buttons, text="Reset", command=instrument.reset).pack(side='left', padx=2)
+
+        self.refresh()
+
+    def refresh(self):
+        if not self.window.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        for name, stats in instrument.snapshot().items():
+            self.tree.insert('', 'end', values=(
+                name, stats['count'], format_seconds(stats['mean']), format_seconds(stats['p50']),
+                format_seconds(stats['p90']), format_seconds(stats['p99']), format_seconds(stats['max']),
+                stats['bytes']))
+        self.slow_list.delete(0, 'end')
+        for when, name, seconds in reversed(instrument.slow_calls()):
+            self.slow_list.insert('end', f"{time.strftime('%H:%M:%S', time.localtime(when))}  {name}  {format_seconds(seconds)}")
+        self.window.after(REFRESH_MS, self.refresh)
+
+    def dump(self):
+        path = instrument.dump()
+        messagebox.showinfo("Timings Saved", f"Timings written to {path}", parent=self.window)
+
+def format_seconds(seconds):
+    return f"{seconds * 1000:.2f} ms"
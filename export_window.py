@@ -0,0 +1,76 @@
+
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+from tkinter import messagebox
+
+import core
+
+# How often the window checks on the export thread
+POLL_MS = 100
+
+class ExportWindow:
+    # Runs the CSV export on a worker thread and shows its progress. The rows
+    # are snapshotted here on the Tk thread and then streamed to disk by the
+    # worker, which reports back through a queue polled with after().
+    def __init__(self, root, file_path):
+        self.file_path = file_path
+        self.cancel_event = threading.Event()
+        self.messages = queue.Queue()
+
+        rows, self.total = core.export_rows()
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Exporting Report")
+        self.window.protocol('WM_DELETE_WINDOW', self.cancel)
+        frame = ttk.Frame(self.window, padding="10")
+        frame.pack(fill='both', expand=True)
+        self.label = ttk.Label(frame, text=f"Exporting to {file_path}")
+        self.label.pack(fill='x')
+        self.progress = ttk.Progressbar(frame, length=300, maximum=max(self.total, 1))
+        self.progress.pack(fill='x', pady=10)
+        self.cancel_button = ttk.Button(frame, text="Cancel", command=self.cancel)
+        self.cancel_button.pack()
+
+        self.thread = threading.Thread(target=self.run, args=(rows,), daemon=True)
+        self.thread.start()
+        self.window.after(POLL_MS, self.poll)
+
+    def run(self, rows):
+        try:
+            finished = core.write_csv_report(
+                self.file_path, rows, self.total,
+                progress=lambda done, total: self.messages.put(('progress', done)),
+                cancel=self.cancel_event)
+            self.messages.put(('done', finished))
+        except Exception as e:
+            self.messages.put(('error', e))
+
+    def poll(self):
+        try:
+            while True:
+                kind, value = self.messages.get_nowait()
+                if kind == 'progress':
+                    self.progress['value'] = value
+                    self.label.config(text=f"Exported {value} of {self.total} sessions")
+                else:
+                    self.finish(kind, value)
+                    return
+        except queue.Empty:
+            pass
+        self.window.after(POLL_MS, self.poll)
+
+    def finish(self, kind, value):
+        self.window.destroy()
+        if kind == 'error':
+            messagebox.showerror("Export Failed", f"An error occurred while exporting the report:\n{value}")
+        elif value:
+            messagebox.showinfo("Export Successful", f"Report exported to {self.file_path}")
+        else:
+            messagebox.showinfo("Export Cancelled", "The export was cancelled.")
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+        self.label.config(text="Cancelling...")
@@ -0,0 +1,157 @@
+
+# Undo and redo across restarts. Each undoable change is kept as the record
+# that was applied and its inverse (transitions.inverse_record), so an entry
+# costs what the change touched: one session for a stop or a pause, two names
+# for a rename, the removed projects for a delete or a clear. Nothing else of
+# the timesheet is ever copied.
+#
+# The entries live in timesheet.json.history, appended to as things happen:
+#   {"push": label, "size": n}     followed by n bytes: {"undo": record, "redo": record}
+#   {"undo": 1} / {"redo": 1}      the newest entry moved to the other stack
+# Reading it back only parses the short lines and skips over the records, so
+# in memory an entry is its label and where its records are in the file.
+# Past UNDO_LEVELS entries or UNDO_BYTES of records the oldest are dropped
+# (the newest is always kept, however large) and the file is rewritten.
+
+import os
+import json
+
+from session_columns import json_default
+from store import file_lock, file_signature
+
+UNDO_LEVELS = int(os.environ.get('TIMESHEET_UNDO_LEVELS', '50'))
+UNDO_BYTES = int(os.environ.get('TIMESHEET_UNDO_MB', '64')) * 1024 * 1024
+
+class History:
+    def __init__(self, data_path):
+        self.path = data_path + '.history'
+        self.undo_entries = []  # [(offset of the records, size, label)], oldest first
+        self.redo_entries = []
+        self._signature = None
+        self._offset = 0  # bytes of the file read so far
+
+    def _refresh(self):
+        # Callers hold the lock. Reads what other processes appended, or
+        # everything if the file was rewritten.
+        signature = file_signature(self.path)
+        if signature == self._signature:
+            return
+        old = self._signature
+        if old is None or signature is None or signature[0] != old[0] or signature[1] < old[1]:
+            self.undo_entries = []
+            self.redo_entries = []
+            self._offset = 0
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                self._read_entries(f)
+        except FileNotFoundError:
+            pass
+        self._signature = signature
+
+    def _read_entries(self, f):
+        while True:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                # Torn write from a crash; cut off on the next append
+                return
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                return
+            if 'push' in entry:
+                offset = f.tell()
+                f.seek(entry['size'], os.SEEK_CUR)
+                if f.tell() > os.fstat(f.fileno()).st_size:
+                    return
+                self.undo_entries.append((offset, entry['size'], entry['push']))
+                self.redo_entries = []
+            elif 'undo' in entry and self.undo_entries:
+                self.redo_entries.append(self.undo_entries.pop())
+            elif 'redo' in entry and self.redo_entries:
+                self.undo_entries.append(self.redo_entries.pop())
+            self._offset = f.tell()
+
+    def _append(self, chunk):
+        with open(self.path, 'ab') as f:
+            if f.tell() != self._offset:
+                f.truncate(self._offset)
+            f.write(chunk)
+        offset = self._offset
+        self._offset += len(chunk)
+        self._signature = file_signature(self.path)
+        return offset
+
+    def push(self, label, undo_record, redo_record):
+        # After a change was committed; makes it the newest entry to undo and
+        # forgets everything that could be redone
+        payload = json.dumps({'undo': undo_record, 'redo': redo_record}, default=json_default).encode() + b'\n'
+        header = json.dumps({'push': label, 'size': len(payload)}).encode() + b'\n'
+        with file_lock(self.path):
+            self._refresh()
+            offset = self._append(header + payload)
+            self.undo_entries.append((offset + len(header), len(payload), label))
+            self.redo_entries = []
+            self._evict()
+
+    def _evict(self):
+        entries = self.undo_entries
+        size = sum(entry[1] for entry in entries)
+        drop = 0
+        while len(entries) - drop > 1 and (len(entries) - drop > UNDO_LEVELS or size > UNDO_BYTES):
+            size -= entries[drop][1]
+            drop += 1
+        if drop:
+            self._rewrite(entries[drop:])
+
+    def _rewrite(self, entries):
+        # The kept entries, copied over as they are, into a new file swapped
+        # in like the data file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        kept = []
+        with open(self.path, 'rb') as source, open(tmp_path, 'wb') as target:
+            for offset, size, label in entries:
+                target.write(json.dumps({'push': label, 'size': size}).encode() + b'\n')
+                kept.append((target.tell(), size, label))
+                source.seek(offset)
+                target.write(source.read(size))
+            self._offset = target.tell()
+        os.replace(tmp_path, self.path)
+        self.undo_entries = kept
+        self.redo_entries = []
+        self._signature = file_signature(self.path)
+
+    def labels(self):
+        # (label of the next undo or None, label of the next redo or None)
+        with file_lock(self.path):
+            self._refresh()
+        return (self.undo_entries[-1][2] if self.undo_entries else None,
+                self.redo_entries[-1][2] if self.redo_entries else None)
+
+    def step(self, direction, commit):
+        # Undoes ('undo') or redoes ('redo') the newest entry by passing its
+        # record to commit; returns the entry's label, or None if there is
+        # nothing to do. If commit raises, the entry stays where it was.
+        with file_lock(self.path):
+            self._refresh()
+            entries, other = ((self.undo_entries, self.redo_entries) if direction == 'undo'
+                              else (self.redo_entries, self.undo_entries))
+            if not entries:
+                return None
+            offset, size, label = entries[-1]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                records = json.loads(f.read(size))
+            commit(records[direction])
+            self._append(json.dumps({direction: 1}).encode() + b'\n')
+            other.append(entries.pop())
+            return label
+
+_histories = {}
+
+def get_history(data_path):
+    # One history per data file for the whole process
+    history = _histories.get(data_path)
+    if history is None:
+        history = _histories[data_path] = History(data_path)
+    return history
@@ -0,0 +1,252 @@
+
+# Bulk import of finished sessions from CSV files (including the detailed
+# report written by export_report_to_csv) and JSONL event logs. Rows are
+# normalized as they are read, checked per project against the existing
+# sessions for duplicates and overlaps in one sorted pass, and everything that
+# passes is committed as a single 'import' record, so a million sessions cost
+# one write, not one per session.
+
+import os
+import csv
+import json
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+import core
+from store import default_data
+from transitions import new_session, split_import, try_apply
+
+# Header names accepted for each column, compared case-insensitively
+CSV_COLUMNS = {
+    'project': ['project name', 'project'],
+    'start': ['start time', 'start_time', 'start'],
+    'end': ['end time', 'end_time', 'end'],
+    'pauses': ['pauses'],
+}
+
+JSONL_EXTENSIONS = ['.jsonl', '.ndjson', '.log']
+
+# Events that can be replayed from a log; the rest change whole projects
+EVENT_OPS = ['start', 'resume', 'stop', 'pause', 'resume_paused']
+
+# Problems listed in the summary; the rest are only counted
+ERRORS_SHOWN = 20
+
+class ImportResult:
+    def __init__(self):
+        self.sessions = {}  # {project name: [session, ...]} as read
+        self.read = 0
+        self.imported = 0
+        self.projects = 0
+        self.duplicates = 0
+        self.overlaps = 0
+        self.open_sessions = 0
+        self.errors = []  # (file, line, message)
+
+    def add(self, project_name, session):
+        self.read += 1
+        self.sessions.setdefault(project_name, []).append(session)
+
+# About 180 years of days
+@lru_cache(maxsize=65536)
+def _day_start(day):
+    # (local midnight, whether the day has 24 hours) for 'YYYY-MM-DD'
+    year, month, mday = date.fromisoformat(day).timetuple()[:3]
+    start = time.mktime((year, month, mday, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((year, month, mday + 1, 0, 0, 0, 0, 0, -1))
+    return start, end - start == 86400
+
+def parse_local_time(text):
+    # time.mktime(time.strptime(text, TIME_FORMAT)) without the strptime:
+    # midnight is looked up once per day and the time of day added to it,
+    # except on days with a daylight saving switch
+    day_start, regular = _day_start(text[:10])
+    hour, minute, second = int(text[11:13]), int(text[14:16]), int(text[17:19])
+    if text[10] != ' ' or text[13] != ':' or text[16] != ':' or hour > 23 or minute > 59 or second > 59:
+        raise ValueError(f"invalid time '{text}'")
+    if regular:
+        return day_start + hour * 3600 + minute * 60 + second
+    return time.mktime(time.strptime(text, core.TIME_FORMAT))
+
+def parse_timestamp(value):
+    # Epoch seconds, TIME_FORMAT in local time (what the export writes) or
+    # ISO 8601; naive times are local
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = value.strip()
+    if len(text) == 19 and text[10] == ' ':
+        return parse_local_time(text)
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+def make_session(start_time, end_time, pauses):
+    # A closed session in the shape the rest of the app uses; raises
+    # ValueError for times that don't add up
+    if end_time <= start_time:
+        raise ValueError("session does not end after it starts")
+    session = new_session(start_time)
+    last_end = start_time
+    for pause_start, pause_end in sorted(pauses):
+        if pause_start < last_end or pause_end < pause_start or pause_end > end_time:
+            raise ValueError("pauses overlap or fall outside the session")
+        session['pauses'].append({'pause_start': pause_start, 'pause_end': pause_end})
+        session['total_paused_time'] += pause_end - pause_start
+        last_end = pause_end
+    session['end_time'] = end_time
+    session['lap_time'] = (end_time - start_time) - session['total_paused_time']
+    return session
+
+def parse_pauses(text):
+    # "Start: <time>, End: <time>; ..." as written by the CSV export
+    pauses = []
+    for part in text.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        start_text, separator, end_text = part.partition(', End: ')
+        if not separator or not start_text.startswith('Start: '):
+            raise ValueError(f"unreadable pause '{part}'")
+        if end_text == 'Ongoing':
+            raise ValueError("pause has no end")
+        pauses.append((parse_timestamp(start_text[len('Start: '):]), parse_timestamp(end_text)))
+    return pauses
+
+def read_csv(path, result):
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip().lower() for name in next(reader, [])]
+        columns = {}
+        for column, names in CSV_COLUMNS.items():
+            for name in names:
+                if name in header:
+                    columns[column] = header.index(name)
+                    break
+        missing = [column for column in ['project', 'start', 'end'] if column not in columns]
+        if missing:
+            result.errors.append((path, 1, f"missing column(s): {', '.join(missing)}"))
+            return
+        project_column, start_column, end_column = columns['project'], columns['start'], columns['end']
+        pauses_column = columns.get('pauses')
+
+        for line, row in enumerate(reader, start=2):
+            try:
+                project_name = row[project_column].strip()
+                end_text = row[end_column].strip()
+                if not project_name:
+                    raise ValueError("no project name")
+                if end_text in ('', 'Running'):
+                    result.open_sessions += 1
+                    continue
+                pauses = parse_pauses(row[pauses_column]) if pauses_column is not None and pauses_column < len(row) else []
+                session = make_session(parse_timestamp(row[start_column]), parse_timestamp(end_text), pauses)
+            except (ValueError, IndexError) as e:
+                result.errors.append((path, line, str(e) or "incomplete row"))
+                continue
+            result.add(project_name, session)
+
+def read_jsonl(path, result):
+    # Each line is either a transition event ({"op": "start", "project": ...,
+    # "time": ...}) or a finished session ({"project": ..., "start": ...,
+    # "end": ..., "pauses": [[start, end], ...]}). Events are replayed in
+    # order and the sessions they close are imported.
+    events = default_data()
+    with open(path) as f:
+        for line, text in enumerate(f, start=1):
+            if not text.strip():
+                continue
+            try:
+                entry = json.loads(text)
+                project_name = entry['project']
+                if not isinstance(project_name, str) or not project_name:
+                    raise ValueError("no project name")
+                if 'op' in entry:
+                    op = entry['op']
+                    if op not in EVENT_OPS:
+                        raise ValueError(f"'{op}' events cannot be imported")
+                    project = events['projects'].get(project_name)
+                    if op == 'start' and project and project['status'] == 'Stopped':
+                        op = 'resume'
+                    error = try_apply(events, {'op': op, 'project': project_name, 'time': parse_timestamp(entry['time'])})
+                    if error is not None:
+                        raise ValueError(error.message)
+                    continue
+                start_time = parse_timestamp(entry.get('start', entry.get('start_time')))
+                end_value = entry.get('end', entry.get('end_time'))
+                if end_value is None:
+                    result.open_sessions += 1
+                    continue
+                pauses = [(parse_timestamp(pause['pause_start']), parse_timestamp(pause['pause_end']))
+                          if isinstance(pause, dict) else (parse_timestamp(pause[0]), parse_timestamp(pause[1]))
+                          for pause in entry.get('pauses', [])]
+                session = make_session(start_time, parse_timestamp(end_value), pauses)
+            except KeyError as e:
+                result.errors.append((path, line, f"missing {e}"))
+                continue
+            except (ValueError, IndexError, TypeError, AttributeError) as e:
+                result.errors.append((path, line, str(e) or "incomplete entry"))
+                continue
+            result.add(project_name, session)
+
+    for project_name, project in events['projects'].items():
+        for session in project['sessions']:
+            if session['end_time'] is None:
+                result.open_sessions += 1
+            elif session['end_time'] <= session['start_time']:
+                result.errors.append((path, 0, f"events of '{project_name}' are out of order"))
+            else:
+                result.add(project_name, session)
+
+def read_file(path, result):
+    if os.path.splitext(path)[1].lower() in JSONL_EXTENSIONS:
+        read_jsonl(path, result)
+    else:
+        read_csv(path, result)
+
+def import_files(paths, dry_run=False):
+    # Reads every file, then merges into the current data with one commit.
+    # Raises TransitionError if the data changed underneath in a way that
+    # conflicts; OSError for files that cannot be opened.
+    result = ImportResult()
+    for path in paths:
+        read_file(path, result)
+
+    data = core.load_data()
+    store = core.get_data_store()
+    to_import = {}
+    for project_name, sessions in result.sessions.items():
+        sessions.sort(key=lambda session: session['start_time'])
+        # Archived sessions count as well, so re-importing an old export
+        # finds its duplicates
+        existing = list(store.project_sessions(project_name)) if project_name in data['projects'] else []
+        accepted, duplicates, overlaps = split_import(existing, sessions)
+        result.duplicates += len(duplicates)
+        result.overlaps += len(overlaps)
+        if accepted:
+            to_import[project_name] = accepted
+            result.imported += len(accepted)
+    result.projects = len(to_import)
+
+    if to_import and not dry_run:
+        core.commit({'op': 'import', 'sessions': to_import, 'time': time.time()})
+    return result
+
+def import_text(result, dry_run=False):
+    text = f"Read {result.read} finished session(s).\n"
+    text += f"{'Would import' if dry_run else 'Imported'} {result.imported} session(s)"
+    text += f" into {result.projects} project(s).\n"
+    if result.duplicates:
+        text += f"Skipped {result.duplicates} duplicate session(s).\n"
+    if result.overlaps:
+        text += f"Skipped {result.overlaps} session(s) overlapping existing ones.\n"
+    if result.open_sessions:
+        text += f"Skipped {result.open_sessions} session(s) that were still running.\n"
+    if result.errors:
+        text += f"Skipped {len(result.errors)} invalid row(s):\n"
+        for path, line, message in result.errors[:ERRORS_SHOWN]:
+            text += f" - {os.path.basename(path)}{f':{line}' if line else ''}: {message}\n"
+        if len(result.errors) > ERRORS_SHOWN:
+            text += f" - ... and {len(result.errors) - ERRORS_SHOWN} more\n"
+    return text.rstrip('\n')
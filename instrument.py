@@ -0,0 +1,136 @@
+
+# Opt-in timing of the operations that make the tracker feel slow. Set
+# TIMESHEET_PROFILE=1 to record call counts, latency histograms and bytes
+# read/written per operation; the numbers are shown in the debug window
+# (Ctrl+Shift+D in the GUI) and written as JSON on exit or on demand, to
+# TIMESHEET_PROFILE_FILE (default ~/timesheet-profile.json).
+
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from collections import deque
+from pathlib import Path
+
+ENABLED = os.environ.get('TIMESHEET_PROFILE') == '1'
+DUMP_FILE = os.environ.get('TIMESHEET_PROFILE_FILE', os.path.join(Path.home(), 'timesheet-profile.json'))
+
+# Calls at least this slow are also kept individually, newest last
+SLOW_SECONDS = 0.1
+SLOW_CALLS_KEPT = 100
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+class OperationStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.bytes = 0
+        self.byte_events = 0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of calls
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return BUCKETS[index] if index < len(BUCKETS) else self.max
+        return 0.0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+            'bytes': self.bytes,
+            'byte_events': self.byte_events,
+            'histogram': dict(zip([str(bound) for bound in BUCKETS] + ['inf'], self.buckets)),
+        }
+
+_stats = {}
+_slow_calls = deque(maxlen=SLOW_CALLS_KEPT)  # (wall clock time, operation, seconds)
+_lock = threading.Lock()
+
+def _get(name):
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = OperationStats()
+    return stats
+
+def record(name, seconds):
+    with _lock:
+        _get(name).add(seconds)
+        if seconds >= SLOW_SECONDS:
+            _slow_calls.append((time.time(), name, seconds))
+
+def record_bytes(name, size):
+    if ENABLED:
+        with _lock:
+            stats = _get(name)
+            stats.bytes += size
+            stats.byte_events += 1
+
+def timed(name):
+    # Decorator; costs a single flag check while profiling is off
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+def snapshot():
+    with _lock:
+        return {name: stats.as_dict() for name, stats in sorted(_stats.items())}
+
+def slow_calls():
+    with _lock:
+        return list(_slow_calls)
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _slow_calls.clear()
+
+def dump(path=None):
+    path = path or DUMP_FILE
+    with open(path, 'w') as f:
+        json.dump({'created': time.time(), 'operations': snapshot(), 'slow_calls': slow_calls()}, f, indent=1)
+    return path
+
+def _dump_at_exit():
+    if ENABLED and _stats:
+        dump()
+
+atexit.register(_dump_at_exit)
@@ -0,0 +1,189 @@
+
+import os
+import json
+
+from instrument import record_bytes, timed
+from store import DataStore, default_data, file_lock, file_signature, load_data_file, write_data_file
+from stream_loader import DamagedDataFile
+from transitions import TransitionError, apply_record, try_apply
+
+# Fold the journal into the snapshot after this many records
+COMPACT_EVERY = 1000
+
+class JournalStore(DataStore):
+    # The snapshot is the regular timesheet.json plus 'journal_seq', the
+    # sequence number of the last record folded into it. Every change after
+    # that is one JSON line appended to timesheet.json.journal, so a state
+    # change costs the size of its record no matter how much history exists.
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        super().__init__(path)
+        self.journal_path = path + '.journal'
+        self.compact_every = compact_every
+        self._journal_signature = None
+        self._journal_offset = 0
+        self._seq = 0
+        self._records_since_compact = 0
+
+    def load(self):
+        signature = file_signature(self.path)
+        journal_signature = file_signature(self.journal_path)
+        if self._data is not None and signature == self._signature:
+            if journal_signature == self._journal_signature:
+                return self._data
+            if self._journal_appended(journal_signature):
+                # Someone appended records; replay only the new tail
+                self._replay(self._data)
+                self._journal_signature = journal_signature
+                self.generation += 1
+                self.reads += 1
+                return self._data
+
+        damage = None
+        if signature is None:
+            data = default_data()
+        else:
+            try:
+                data, self.file_format = load_data_file(self.path, self.columnar)
+            except DamagedDataFile as e:
+                # The journal still applies on top of what was recovered
+                data, damage = e.data, e
+
+        self._seq = data.get('journal_seq', 0)
+        self._journal_offset = 0
+        self._records_since_compact = 0
+        self._replay(data)
+        self._data = data
+        self._signature = signature
+        self._journal_signature = journal_signature
+        self.generation += 1
+        self.reads += 1
+        if damage is not None:
+            raise damage
+        if signature is not None:
+            record_bytes('read_file', signature[1])
+        return data
+
+    def _journal_appended(self, journal_signature):
+        old = self._journal_signature
+        return (old is not None and journal_signature is not None
+                and journal_signature[0] == old[0] and journal_signature[1] >= old[1])
+
+    def _replay(self, data):
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                tail = f.read()
+        except FileNotFoundError:
+            return
+
+        for line in tail.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                # Torn write from a crash; it is dropped on the next append
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            self._journal_offset += len(line)
+            if record['seq'] <= self._seq:
+                # Already folded into the snapshot
+                continue
+            self._seq = record['seq']
+            self._records_since_compact += 1
+            try:
+                apply_record(data, record)
+            except TransitionError:
+                pass
+
+    def commit(self, record):
+        # Replays whatever other processes appended before adding our record
+        with file_lock(self.path):
+            data = self.load()
+            generation = self.generation
+            try:
+                apply_record(data, record)
+                self._append([record])
+            except TransitionError:
+                # Refused before anything was changed
+                raise
+            except BaseException:
+                # The cached data is ahead of the journal now, or half changed
+                self.invalidate()
+                raise
+            self._index_records(generation, [record])
+        return data
+
+    def commit_many(self, records, before=None):
+        with file_lock(self.path):
+            data = self.load()
+            generation = self.generation
+            try:
+                errors = []
+                for record in records:
+                    if before is not None:
+                        before(data, record)
+                    errors.append(try_apply(data, record))
+                applied = [record for record, error in zip(records, errors) if error is None]
+                self._append(applied)
+            except BaseException:
+                self.invalidate()
+                raise
+            self._index_records(generation, applied)
+        return errors
+
+    def _append(self, records):
+        # Callers hold the file lock. All records go out in one write and one fsync.
+        if not records:
+            return
+        self.generation += 1
+        lines = []
+        for record in records:
+            self._seq += 1
+            lines.append(json.dumps(dict(record, seq=self._seq)) + '\n')
+        chunk = ''.join(lines).encode()
+        with open(self.journal_path, 'ab') as f:
+            if f.tell() != self._journal_offset:
+                f.truncate(self._journal_offset)
+            try:
+                f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                # Take back whatever part of it reached the file
+                f.truncate(self._journal_offset)
+                raise
+        self._journal_offset += len(chunk)
+        self._journal_signature = file_signature(self.journal_path)
+        record_bytes('journal_append', len(chunk))
+
+        self._records_since_compact += len(records)
+        if self._records_since_compact >= self.compact_every:
+            self.compact()
+
+    def save(self, data):
+        # A whole-document save replaces the snapshot and empties the journal
+        with file_lock(self.path):
+            self._data = data
+            self.generation += 1
+            self.compact()
+
+    @timed('write_file')
+    def compact(self):
+        # Callers hold the file lock
+        data = self._data if self._data is not None else self.load()
+        data['journal_seq'] = self._seq
+        self.archive_old_sessions(data)
+
+        # Write the new snapshot next to the old one and swap it in atomically.
+        # If we crash before the journal is truncated, the records it still
+        # holds are skipped on replay because of their sequence numbers.
+        write_data_file(self.path, data, self.file_format)
+        record_bytes('write_file', os.path.getsize(self.path))
+        with open(self.journal_path, 'wb'):
+            pass
+
+        self._data = data
+        self._signature = file_signature(self.path)
+        self._journal_signature = file_signature(self.journal_path)
+        self._journal_offset = 0
+        self._records_since_compact = 0
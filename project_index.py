@@ -0,0 +1,86 @@
+
+# Index of the project names for the search box of the main window. The
+# names are kept sorted, case folded, so the list comes out in name order
+# without a sort, and a search is a pass over the folded names in C-speed
+# substring tests. Results are remembered per query: typing one more
+# character only goes through the matches of the query before it, which
+# keeps each keystroke in the low milliseconds at 100k projects.
+#
+# The store builds the index on the first search and keeps it up to date
+# with its own commits (apply), like the timeline index; a change by another
+# process makes it build a new one.
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+# Queries whose matches are remembered
+CACHED_QUERIES = 32
+
+class ProjectIndex:
+    def __init__(self, names=()):
+        self.entries = sorted((name.casefold(), name) for name in names)
+        self.cache = OrderedDict()  # {folded query: [entry, ...]}
+        self.generation = None
+
+    def _find(self, name):
+        entry = (name.casefold(), name)
+        position = bisect_left(self.entries, entry)
+        if position < len(self.entries) and self.entries[position] == entry:
+            return position
+        return None
+
+    def add(self, name):
+        if self._find(name) is None:
+            insort(self.entries, (name.casefold(), name))
+            self.cache.clear()
+
+    def remove(self, name):
+        position = self._find(name)
+        if position is not None:
+            del self.entries[position]
+            self.cache.clear()
+
+    def apply(self, records):
+        # Follows records that were just applied to the data; False for one
+        # it can't follow, and the index has to be rebuilt
+        for record in records:
+            op = record['op']
+            if op == 'start':
+                self.add(record['project'])
+            elif op == 'delete':
+                self.remove(record['project'])
+            elif op == 'rename':
+                self.remove(record['project'])
+                self.add(record['new_name'])
+            elif op == 'clear':
+                self.entries = []
+                self.cache.clear()
+            elif op in ('import', 'restore'):
+                for project_name in record['sessions' if op == 'import' else 'projects']:
+                    self.add(project_name)
+            elif op == 'revert':
+                if record['status'] is None:
+                    self.remove(record['project'])
+            elif op not in ('resume', 'stop', 'pause', 'resume_paused'):
+                return False
+        return True
+
+    def search(self, query=''):
+        # Names containing query, ignoring case, in name order
+        folded = query.casefold()
+        if not folded:
+            return [name for _, name in self.entries]
+        matches = self.cache.get(folded)
+        if matches is None:
+            # Start from the fewest matches of a query this one contains
+            candidates = self.entries
+            for cached, cached_matches in self.cache.items():
+                if cached in folded and len(cached_matches) < len(candidates):
+                    candidates = cached_matches
+            matches = [entry for entry in candidates if folded in entry[0]]
+            self.cache[folded] = matches
+            if len(self.cache) > CACHED_QUERIES:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(folded)
+        return [name for _, name in matches]
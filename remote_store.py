@@ -0,0 +1,126 @@
+
+import os
+import json
+import threading
+import http.client
+from urllib.parse import quote, urlsplit
+
+from archive import Archive
+from store import DataStore, default_data
+from transitions import TransitionError, apply_record
+
+SERVER_URL = os.environ.get('TIMESHEET_SERVER', 'http://127.0.0.1:8765')
+
+TIMEOUT = 10
+
+class RemoteStore(DataStore):
+    # The data lives in a server.py process. load() asks the server for the
+    # document with If-None-Match, so an unchanged timesheet costs a 304 and
+    # no parsing; commits are sent as transition records and merged by the
+    # server with everybody else's.
+    def __init__(self, url=SERVER_URL):
+        super().__init__(url)
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self._etag = None
+        self._conn = None
+        # The export's worker thread shares the connection with the GUI
+        self._request_lock = threading.Lock()
+        self.archive = RemoteArchive(self)
+
+    def request(self, method, path, payload=None, headers=None):
+        # Keeps one connection open; a GET is retried once on a fresh
+        # connection if the server dropped the old one
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = dict(headers or {})
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        with self._request_lock:
+            return self._request(method, path, body, headers)
+
+    def _request(self, method, path, body, headers):
+        for attempt in range(2 if method == 'GET' else 1):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=TIMEOUT)
+            try:
+                self._conn.request(method, path, body, headers)
+                response = self._conn.getresponse()
+                return response.status, response.getheader('ETag'), response.read()
+            except (http.client.HTTPException, OSError):
+                self._conn.close()
+                self._conn = None
+                if attempt or method != 'GET':
+                    raise
+
+    def load(self):
+        headers = {'If-None-Match': self._etag} if self._etag and self._data is not None else {}
+        try:
+            status, etag, body = self.request('GET', '/data', headers=headers)
+        except (http.client.HTTPException, OSError):
+            # Server unreachable: keep showing what we last knew; commits
+            # report the error
+            if self._data is None:
+                self._data = default_data()
+            return self._data
+        if status == 304:
+            return self._data
+        self._data = json.loads(body)
+        self._etag = etag
+        self.generation += 1
+        self.reads += 1
+        return self._data
+
+    def commit(self, record):
+        try:
+            status, _, body = self.request('POST', '/records', {'records': [record]})
+        except (http.client.HTTPException, OSError) as e:
+            raise TransitionError("Server Unavailable", f"Could not reach the timesheet server at {self.path}: {e}")
+        if status != 200:
+            raise TransitionError("Server Error", f"The timesheet server answered {status}.")
+        error, = json.loads(body)['results']
+        if error is not None:
+            raise TransitionError(error['title'], error['message'])
+
+        # The server accepted the record; apply it to our copy as well so the
+        # caller sees the result without fetching the whole document. The
+        # next load() picks up the server's version.
+        if self._data is not None:
+            try:
+                apply_record(self._data, record)
+                self.generation += 1
+                return self._data
+            except TransitionError:
+                self.invalidate()
+        return self.load()
+
+    def commit_many(self, records):
+        status, _, body = self.request('POST', '/records', {'records': records})
+        if status != 200:
+            raise TransitionError("Server Error", f"The timesheet server answered {status}.")
+        self.invalidate()
+        return [None if error is None else TransitionError(error['title'], error['message'])
+                for error in json.loads(body)['results']]
+
+    def save(self, data):
+        raise TransitionError("Not Supported", "Whole-file saves are not possible against the timesheet server.")
+
+    def invalidate(self):
+        super().invalidate()
+        self._etag = None
+
+class RemoteArchive(Archive):
+    # Archived months are fetched from the server when a view needs them
+    def __init__(self, store):
+        super().__init__(store.path)
+        self.store = store
+
+    def signature(self, filename):
+        # Period files only change together with the document
+        return self.store._etag
+
+    def read_bytes(self, filename):
+        status, _, body = self.store.request('GET', '/archive/' + quote(filename))
+        if status != 200:
+            raise OSError(f"The timesheet server has no archive file '{filename}'.")
+        return body
@@ -0,0 +1,91 @@
+
+# Per-day totals kept next to the projects as
+#   data['rollups'] = {project_name: {'YYYY-MM-DD': seconds worked}}
+# They are updated by the 'stop' transition as each session closes, so a
+# report over any date range only has to visit one bucket per project and
+# day instead of every session.
+
+from datetime import date, datetime, time as day_start, timedelta
+
+GRANULARITIES = ['day', 'week', 'month']
+
+def worked_intervals(session):
+    # The (start, end) stretches of a closed session that were not paused
+    start = session['start_time']
+    end = session['end_time']
+    intervals = []
+    for pause in sorted(session.get('pauses', []), key=lambda pause: pause['pause_start']):
+        pause_start = max(start, pause['pause_start'])
+        pause_end = min(end, pause.get('pause_end') or end)
+        if pause_start > start:
+            intervals.append((start, pause_start))
+        start = max(start, pause_end)
+    if end > start:
+        intervals.append((start, end))
+    return intervals
+
+def session_days(session):
+    # {'YYYY-MM-DD': seconds} for a closed session, split at local midnight
+    days = {}
+    for start, end in worked_intervals(session):
+        while start < end:
+            day = datetime.fromtimestamp(start).date()
+            next_midnight = datetime.combine(day + timedelta(days=1), day_start()).timestamp()
+            stop = min(end, next_midnight)
+            key = day.isoformat()
+            days[key] = days.get(key, 0) + (stop - start)
+            start = stop
+    return days
+
+def add_session(project_rollups, session):
+    for day, seconds in session_days(session).items():
+        project_rollups[day] = project_rollups.get(day, 0) + seconds
+
+def remove_session(project_rollups, session):
+    # Takes back add_session, for undo
+    for day, seconds in session_days(session).items():
+        remaining = project_rollups.get(day, 0) - seconds
+        if remaining > 1e-6:
+            project_rollups[day] = remaining
+        else:
+            project_rollups.pop(day, None)
+
+def build_rollups(data):
+    # From scratch, for timesheets written before rollups existed
+    rollups = {}
+    for project_name, project in data['projects'].items():
+        project_rollups = rollups[project_name] = {}
+        for session in project['sessions']:
+            if session['end_time']:
+                add_session(project_rollups, session)
+    return rollups
+
+def ensure_rollups(data):
+    if 'rollups' not in data:
+        data['rollups'] = build_rollups(data)
+    return data['rollups']
+
+def iter_days(start_day, end_day):
+    day = start_day
+    while day <= end_day:
+        yield day
+        day += timedelta(days=1)
+
+def bucket_key(day, granularity):
+    if granularity == 'day':
+        return day.isoformat()
+    if granularity == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == 'month':
+        return f"{day.year}-{day.month:02d}"
+    raise ValueError(f"Unknown granularity '{granularity}'")
+
+def group_totals(day_totals, granularity):
+    # [(bucket, project, seconds)] from [(project, 'YYYY-MM-DD', seconds)],
+    # ordered by bucket and then project
+    buckets = {}
+    for project_name, day, seconds in day_totals:
+        key = (bucket_key(date.fromisoformat(day), granularity), project_name)
+        buckets[key] = buckets.get(key, 0) + seconds
+    return sorted((bucket, project_name, seconds) for (bucket, project_name), seconds in buckets.items())
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+# Shared timesheet service for a team: one process owns the data file and
+# everyone else talks HTTP/JSON to it.
+#   python server.py [--host HOST] [--port PORT] [--data FILE] [--storage json|journal|sqlite]
+#
+#   POST /start, /stop, /pause, /resume, /resume_paused  {"project": NAME}
+#   POST /records   {"records": [transition record, ...]}
+#   GET  /status, /report
+#   GET  /data      the whole document, with an ETag for conditional requests
+#   GET  /archive/FILE  a compressed period file of archived sessions
+#
+# Point the Tk app or the command line at it with TIMESHEET_STORAGE=remote
+# and TIMESHEET_SERVER=http://HOST:PORT.
+
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import core
+import store
+from session_columns import json_default
+from transitions import APPLY, STATUS_AFTER
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Most records written to the store in one commit
+MAX_BATCH = 1000
+# Large enough for a bulk import sent as one record
+MAX_BODY = 256 * 1024 * 1024
+
+OPERATIONS = ['start', 'stop', 'pause', 'resume', 'resume_paused']
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large'}
+
+class BadRequest(Exception):
+    pass
+
+def error_body(title, message):
+    return {'error': {'title': title, 'message': message}}
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def is_session(session):
+    # A session as records carry them (see transitions.copy_session)
+    if not isinstance(session, dict):
+        return False
+    if not all(is_number(session.get(key)) for key in ('start_time', 'lap_time')):
+        return False
+    if session.get('end_time') is not None and not is_number(session['end_time']):
+        return False
+    if not is_number(session.get('total_paused_time', 0)) or not isinstance(session.get('pauses', []), list):
+        return False
+    return all(isinstance(pause, dict) and is_number(pause.get('pause_start'))
+               and (pause.get('pause_end') is None or is_number(pause['pause_end']))
+               for pause in session.get('pauses', []))
+
+def is_session_list(sessions, closed=False):
+    return isinstance(sessions, list) and all(is_session(session) and not (closed and session['end_time'] is None)
+                                              for session in sessions)
+
+def is_project_map(value, check):
+    # {project name: something check() accepts}
+    return isinstance(value, dict) and all(isinstance(name, str) and check(item) for name, item in value.items())
+
+def is_change(change):
+    # [start time, session or None], as sync.py sends them
+    return (isinstance(change, list) and len(change) == 2 and is_number(change[0])
+            and (change[1] is None or is_session(change[1])))
+
+def is_restored_project(project):
+    return (isinstance(project, dict) and isinstance(project.get('status'), str)
+            and is_number(project.get('total_time')) and is_session_list(project.get('sessions')))
+
+def record_problem(record):
+    # What is wrong with a record sent by a client, or None. Everything the
+    # transition reads is checked here, so a bad record is a 400 and never
+    # reaches the data file.
+    op = record['op']
+    if op == 'clear':
+        return None
+    if op == 'import':
+        if not is_project_map(record.get('sessions'), lambda sessions: is_session_list(sessions, closed=True)):
+            return "'sessions' must map project names to lists of closed sessions"
+        return None
+    if op == 'restore':
+        if not is_project_map(record.get('projects'), is_restored_project):
+            return "'projects' must map project names to projects"
+        if 'rollups' in record and not is_project_map(record['rollups'], lambda rollups: is_project_map(rollups, is_number)):
+            return "'rollups' must map project names to per-day totals"
+        return None
+    if op == 'merge':
+        if not is_project_map(record.get('changes'), lambda changes: isinstance(changes, list) and changes
+                              and all(is_change(change) for change in changes)):
+            return "'changes' must map project names to lists of [start time, session or null]"
+        whole = record.get('whole', [])
+        if not isinstance(whole, list) or not all(isinstance(name, str) for name in whole):
+            return "'whole' must be a list of project names"
+        return None
+    if not isinstance(record.get('project'), str):
+        return "'project' must be a string"
+    if op in STATUS_AFTER and not is_number(record.get('time')):
+        return "'time' must be a number"
+    if op == 'rename' and not isinstance(record.get('new_name'), str):
+        return "'new_name' must be a string"
+    if op == 'revert':
+        expect = record.get('expect')
+        if not (isinstance(expect, list) and len(expect) == 2 and isinstance(expect[0], str)
+                and isinstance(expect[1], int) and not isinstance(expect[1], bool)):
+            return "'expect' must be [status, session count]"
+        if not isinstance(record.get('keep'), int) or isinstance(record['keep'], bool) or record['keep'] < 0:
+            return "'keep' must be a session count"
+        if not is_session_list(record.get('sessions')):
+            return "'sessions' must be a list of sessions"
+        if record.get('status') is not None and not isinstance(record['status'], str):
+            return "'status' must be a string or null"
+        if record.get('status') is not None and not is_number(record.get('total_time')):
+            return "'total_time' must be a number"
+    return None
+
+def parse_records(payload):
+    if not isinstance(payload, dict) or not isinstance(payload.get('records'), list):
+        raise BadRequest("Expected {\"records\": [...]}")
+    for record in payload['records']:
+        if not isinstance(record, dict) or record.get('op') not in APPLY:
+            raise BadRequest(f"Invalid record: {record!r}")
+        problem = record_problem(record)
+        if problem is not None:
+            raise BadRequest(f"Invalid '{record['op']}' record: {problem}")
+    return payload['records']
+
+async def read_request(reader):
+    # (method, path, headers, body), or None when the client hung up
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+    headers = {'version': version}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY:
+        raise BadRequest("Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    return method, target.split('?')[0], headers, body
+
+def write_response(writer, status, body=b'', headers=()):
+    head = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Length: {len(body)}"]
+    if body and not any(name == 'Content-Type' for name, _ in headers):
+        head.append("Content-Type: application/json")
+    head.extend(f"{name}: {value}" for name, value in headers)
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+
+class TimesheetServer:
+    # All store access runs on a single worker thread so the event loop never
+    # waits on the disk. Records that arrive while a write is in progress are
+    # queued and go to the store together in the next commit (group commit),
+    # so under load the number of writes stays flat as clients are added.
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = []  # (record, future)
+        self.wakeup = asyncio.Event()
+        # Distinguishes ETags handed out by different runs of the server
+        self.instance = uuid.uuid4().hex[:8]
+        self.document = (None, b'')  # (generation, serialized data)
+
+    def run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def writer(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.pending:
+                batch, self.pending = self.pending[:MAX_BATCH], self.pending[MAX_BATCH:]
+                try:
+                    errors = await self.run(commit_batch, [record for record, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), error in zip(batch, errors):
+                    if not future.done():
+                        future.set_result(error)
+
+    async def submit(self, records):
+        # TransitionError or None for each record, once it has been written
+        loop = asyncio.get_running_loop()
+        futures = []
+        for record in records:
+            future = loop.create_future()
+            self.pending.append((record, future))
+            futures.append(future)
+        self.wakeup.set()
+        return await asyncio.gather(*futures)
+
+    def serialize_data(self):
+        data = core.load_data()
+        generation = core.get_data_store().generation
+        if self.document[0] != generation:
+            self.document = (generation, json.dumps(data, default=json_default).encode())
+        return self.document
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except BadRequest as e:
+                    write_response(writer, 413, json.dumps(error_body("Bad Request", str(e))).encode())
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    status, payload, extra_headers = await self.dispatch(method, path, headers, body)
+                except BadRequest as e:
+                    status, payload, extra_headers = 400, error_body("Bad Request", str(e)), ()
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                write_response(writer, status, body, extra_headers)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close' or headers['version'] == 'HTTP/1.0':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, headers, body):
+        name = path.strip('/')
+        if method == 'GET':
+            if name == 'data':
+                generation, document = await self.run(self.serialize_data)
+                etag = f'"{self.instance}-{generation}"'
+                if headers.get('if-none-match') == etag:
+                    return 304, b'', [('ETag', etag)]
+                return 200, document, [('ETag', etag)]
+            if name == 'status':
+                active = await self.run(core.status)
+                return 200, {'projects': [{'name': project_name, 'status': project_status, 'elapsed': elapsed}
+                                          for project_name, project_status, elapsed in active]}, ()
+            if name == 'report':
+                totals = await self.run(core.report)
+                return 200, {'projects': [{'name': project_name, 'total_time': total}
+                                          for project_name, total in totals]}, ()
+            if name.startswith('archive/'):
+                # Compressed period files of archived sessions, for RemoteStore
+                filename = name[len('archive/'):]
+                if '/' not in filename and not filename.startswith('.'):
+                    try:
+                        archive = core.get_data_store().archive
+                        return 200, await self.run(archive.read_bytes, filename), [('Content-Type', 'application/octet-stream')]
+                    except FileNotFoundError:
+                        pass
+            return 404, error_body("Not Found", f"No such resource: {path}"), ()
+
+        if method != 'POST':
+            return 405, error_body("Method Not Allowed", f"{method} is not supported."), ()
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            raise BadRequest("Body is not valid JSON")
+
+        if name == 'records':
+            errors = await self.submit(parse_records(payload))
+            return 200, {'results': [None if error is None else error_body(error.title, error.message)['error']
+                                     for error in errors]}, ()
+        if name in OPERATIONS:
+            if not isinstance(payload, dict) or not isinstance(payload.get('project'), str):
+                raise BadRequest("Expected {\"project\": NAME}")
+            record = {'op': name, 'project': payload['project'], 'time': payload.get('time', time.time())}
+            if not is_number(record['time']):
+                raise BadRequest("'time' must be a number")
+            error, = await self.submit([record])
+            if error is not None:
+                return 409, error_body(error.title, error.message), ()
+            return 200, {'ok': True}, ()
+        return 404, error_body("Not Found", f"No such resource: {path}"), ()
+
+def commit_batch(records):
+    core.load_data()
+    return core.get_data_store().commit_many(records)
+
+async def serve(host, port):
+    server = TimesheetServer()
+    writer_task = asyncio.create_task(server.writer())
+    listener = await asyncio.start_server(server.handle_client, host, port, backlog=4096)
+    print(f"Serving {core.DATA_FILE} on http://{host}:{port}", file=sys.stderr)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        writer_task.cancel()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared timesheet server")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--data', default=core.DATA_FILE, help="data file (default ~/timesheet.json)")
+    parser.add_argument('--storage', choices=['json', 'journal', 'sqlite', 'sharded'], default=None,
+                        help="storage engine (default TIMESHEET_STORAGE or json)")
+    args = parser.parse_args(argv)
+
+    storage = args.storage or store.STORAGE
+    if storage == 'remote':
+        parser.error("the server needs a local storage engine, not 'remote'")
+    store.STORAGE = storage
+    core.DATA_FILE = args.data
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+
+# Compact in-memory form of a project's sessions, used instead of a list of
+# dicts when TIMESHEET_SESSIONS=columns. Each field is one array of floats:
+#
+#   starts, ends, laps, paused      one entry per session, None stored as NaN
+#   pause_offsets                   the pauses of session i are
+#                                   pause_offsets[i]:pause_offsets[i + 1]
+#   pause_starts, pause_ends        every pause of the project, in order
+#
+# so a session costs 36 bytes plus 16 per pause instead of a dict, four
+# floats and a list of dicts. Indexing returns small views that read and
+# write the arrays and answer like the dicts did (session['end_time'],
+# session['pauses'][-1]['pause_start'], ...), so the transitions, the views
+# and the export work on either form.
+
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+NAN = float('nan')
+
+SESSION_FIELDS = {
+    'start_time': 'starts',
+    'end_time': 'ends',
+    'lap_time': 'laps',
+    'total_paused_time': 'paused',
+}
+SESSION_KEYS = ['start_time', 'end_time', 'lap_time', 'pauses', 'total_paused_time']
+PAUSE_KEYS = ['pause_start', 'pause_end']
+
+def to_float(value):
+    return NAN if value is None else value
+
+def from_float(value):
+    # NaN is the only value not equal to itself
+    return None if value != value else value
+
+class SessionColumns:
+    __slots__ = ('starts', 'ends', 'laps', 'paused', 'pause_offsets', 'pause_starts', 'pause_ends')
+
+    def __init__(self, sessions=()):
+        self.starts = array('d')
+        self.ends = array('d')
+        self.laps = array('d')
+        self.paused = array('d')
+        self.pause_offsets = array('I', [0])
+        self.pause_starts = array('d')
+        self.pause_ends = array('d')
+        for session in sessions:
+            self.append(session)
+
+    @classmethod
+    def from_arrays(cls, starts, ends, laps, paused, pause_offsets, pause_starts, pause_ends):
+        # Takes the arrays over as they are, e.g. straight from binary_format
+        columns = cls.__new__(cls)
+        columns.starts = starts
+        columns.ends = ends
+        columns.laps = laps
+        columns.paused = paused
+        columns.pause_offsets = pause_offsets
+        columns.pause_starts = pause_starts
+        columns.pause_ends = pause_ends
+        return columns
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _index(self, index):
+        if index < 0:
+            index += len(self.starts)
+        if not 0 <= index < len(self.starts):
+            raise IndexError(index)
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            lo, hi, step = index.indices(len(self.starts))
+            if step != 1:
+                return [SessionView(self, idx) for idx in range(lo, hi, step)]
+            return self.take(lo, max(lo, hi))
+        return SessionView(self, self._index(index))
+
+    def __iter__(self):
+        for idx in range(len(self.starts)):
+            yield SessionView(self, idx)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def append(self, session):
+        self.starts.append(session['start_time'])
+        self.ends.append(to_float(session['end_time']))
+        self.laps.append(session['lap_time'])
+        self.paused.append(session.get('total_paused_time', 0))
+        for pause in session.get('pauses', []):
+            self.pause_starts.append(pause['pause_start'])
+            self.pause_ends.append(to_float(pause.get('pause_end')))
+        self.pause_offsets.append(len(self.pause_starts))
+
+    def take(self, lo, hi):
+        # Sessions lo:hi as a new SessionColumns
+        first, last = self.pause_offsets[lo], self.pause_offsets[hi]
+        return SessionColumns.from_arrays(
+            self.starts[lo:hi], self.ends[lo:hi], self.laps[lo:hi], self.paused[lo:hi],
+            array('I', [offset - first for offset in self.pause_offsets[lo:hi + 1]]),
+            self.pause_starts[first:last], self.pause_ends[first:last])
+
+    def set_pauses(self, idx, pauses):
+        first, last = self.pause_offsets[idx], self.pause_offsets[idx + 1]
+        self.pause_starts[first:last] = array('d', [pause['pause_start'] for pause in pauses])
+        self.pause_ends[first:last] = array('d', [to_float(pause.get('pause_end')) for pause in pauses])
+        shift = len(pauses) - (last - first)
+        if shift:
+            for following in range(idx + 1, len(self.pause_offsets)):
+                self.pause_offsets[following] += shift
+
+    def add_pause(self, idx, pause):
+        # New pauses only ever go to the running session, the last one, which
+        # makes this an append
+        position = self.pause_offsets[idx + 1]
+        self.pause_starts.insert(position, pause['pause_start'])
+        self.pause_ends.insert(position, to_float(pause.get('pause_end')))
+        for following in range(idx + 1, len(self.pause_offsets)):
+            self.pause_offsets[following] += 1
+
+    def bounds(self, start=None, end=None):
+        # Index range of the sessions starting in [start, end), bisected on
+        # the starts array itself
+        lo = 0 if start is None else bisect_left(self.starts, start)
+        hi = len(self.starts) if end is None else bisect_left(self.starts, end)
+        return lo, max(lo, hi)
+
+    def column(self, key, lo=0, hi=None):
+        # Values of one field for sessions lo:hi, None where a time is unset
+        values = getattr(self, SESSION_FIELDS[key])[lo:hi]
+        if key == 'end_time':
+            return [from_float(value) for value in values]
+        return values.tolist()
+
+    def to_list(self):
+        # The sessions as plain dicts, as they are written to JSON
+        sessions = []
+        pauses = zip(self.pause_starts, self.pause_ends)
+        offsets = self.pause_offsets
+        for idx, (start_time, end_time, lap_time, paused_time) in enumerate(zip(self.starts, self.ends, self.laps, self.paused)):
+            count = offsets[idx + 1] - offsets[idx]
+            sessions.append({
+                'start_time': start_time,
+                'end_time': from_float(end_time),
+                'lap_time': lap_time,
+                'pauses': [{'pause_start': pause_start, 'pause_end': from_float(pause_end)}
+                           for pause_start, pause_end in islice(pauses, count)] if count else [],
+                'total_paused_time': paused_time
+            })
+        return sessions
+
+class SessionView:
+    __slots__ = ('columns', 'index')
+
+    def __init__(self, columns, index):
+        self.columns = columns
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'pauses':
+            return PausesView(self.columns, self.index)
+        value = getattr(self.columns, SESSION_FIELDS[key])[self.index]
+        return from_float(value) if key == 'end_time' else value
+
+    def __setitem__(self, key, value):
+        if key == 'pauses':
+            self.columns.set_pauses(self.index, value)
+        else:
+            getattr(self.columns, SESSION_FIELDS[key])[self.index] = to_float(value)
+
+    def __contains__(self, key):
+        return key in SESSION_KEYS
+
+    def get(self, key, default=None):
+        return self[key] if key in SESSION_KEYS else default
+
+    def keys(self):
+        return list(SESSION_KEYS)
+
+    def to_dict(self):
+        session = {key: self[key] for key in SESSION_KEYS}
+        session['pauses'] = session['pauses'].to_list()
+        return session
+
+class PausesView:
+    # The pauses of one session
+    __slots__ = ('columns', 'session')
+
+    def __init__(self, columns, session):
+        self.columns = columns
+        self.session = session
+
+    def _range(self):
+        offsets = self.columns.pause_offsets
+        return offsets[self.session], offsets[self.session + 1]
+
+    def __len__(self):
+        first, last = self._range()
+        return last - first
+
+    def __getitem__(self, index):
+        first, last = self._range()
+        if index < 0:
+            index += last - first
+        if not 0 <= index < last - first:
+            raise IndexError(index)
+        return PauseView(self.columns, first + index)
+
+    def __iter__(self):
+        first, last = self._range()
+        for idx in range(first, last):
+            yield PauseView(self.columns, idx)
+
+    def append(self, pause):
+        self.columns.add_pause(self.session, pause)
+
+    def to_list(self):
+        return [pause.to_dict() for pause in self]
+
+class PauseView:
+    __slots__ = ('columns', 'index')
+
+    def __init__(self, columns, index):
+        self.columns = columns
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'pause_start':
+            return self.columns.pause_starts[self.index]
+        if key == 'pause_end':
+            return from_float(self.columns.pause_ends[self.index])
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'pause_start':
+            self.columns.pause_starts[self.index] = value
+        elif key == 'pause_end':
+            self.columns.pause_ends[self.index] = to_float(value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in PAUSE_KEYS
+
+    def get(self, key, default=None):
+        return self[key] if key in PAUSE_KEYS else default
+
+    def keys(self):
+        return list(PAUSE_KEYS)
+
+    def to_dict(self):
+        return {'pause_start': self['pause_start'], 'pause_end': self['pause_end']}
+
+def columnize(data):
+    # Turns every project's list of sessions into SessionColumns; projects
+    # already in that form are left alone, so this is cheap to repeat
+    for project in data['projects'].values():
+        if not isinstance(project['sessions'], SessionColumns):
+            project['sessions'] = SessionColumns(project['sessions'])
+    return data
+
+def json_default(value):
+    # For json.dumps(default=...): writes the views as the dicts they stand for
+    if isinstance(value, SessionColumns):
+        return value.to_list()
+    if isinstance(value, PausesView):
+        return value.to_list()
+    if isinstance(value, (SessionView, PauseView)):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
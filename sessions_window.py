@@ -0,0 +1,117 @@
+
+import time
+import tkinter as tk
+from tkinter import ttk
+from tkinter import messagebox
+
+import core
+from core import format_time, format_timestamp
+from virtual_tree import VirtualTreeview
+
+# Sessions window column -> session field it sorts by
+SORT_FIELDS = {
+    'Session': 'seq',
+    'Start Time': 'start_time',
+    'End Time': 'end_time',
+    'Lap Time': 'lap_time',
+    'Paused Time': 'total_paused_time',
+}
+
+DATE_FORMAT = '%Y-%m-%d'
+
+def parse_date(text, days=0):
+    # Local midnight of a YYYY-MM-DD date (plus days), or None for an empty field
+    text = text.strip()
+    if not text:
+        return None
+    date = time.strptime(text, DATE_FORMAT)
+    return time.mktime((date.tm_year, date.tm_mon, date.tm_mday + days, 0, 0, 0, 0, 0, -1))
+
+class SessionsWindow:
+    # Lists the sessions of one project. Only the rows on screen are fetched
+    # from the store and formatted, so the window opens in the same time for
+    # ten sessions as for a hundred thousand.
+    def __init__(self, root, project_name):
+        self.project_name = project_name
+        self.order = 'seq'
+        self.descending = False
+        self.start = None
+        self.end = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"Sessions for {project_name}")
+
+        # Date range filter
+        filter_frame = ttk.Frame(self.window, padding=(5, 5))
+        filter_frame.pack(fill='x')
+        ttk.Label(filter_frame, text="From (YYYY-MM-DD):").pack(side='left')
+        self.from_entry = ttk.Entry(filter_frame, width=12)
+        self.from_entry.pack(side='left', padx=(2, 10))
+        ttk.Label(filter_frame, text="To:").pack(side='left')
+        self.to_entry = ttk.Entry(filter_frame, width=12)
+        self.to_entry.pack(side='left', padx=(2, 10))
+        ttk.Button(filter_frame, text="Filter", command=self.apply_filter).pack(side='left', padx=2)
+        ttk.Button(filter_frame, text="Clear", command=self.clear_filter).pack(side='left', padx=2)
+        self.count_label = ttk.Label(filter_frame)
+        self.count_label.pack(side='right')
+
+        # Sessions Treeview
+        columns = ('Session', 'Start Time', 'End Time', 'Lap Time', 'Paused Time')
+        self.view = VirtualTreeview(self.window, columns, self.fetch_rows)
+        sessions_tree = self.view.tree
+        for column in columns:
+            sessions_tree.heading(column, text=column, command=lambda column=column: self.sort_by(column))
+        sessions_tree.column('Session', width=80)
+        sessions_tree.column('Start Time', width=150)
+        sessions_tree.column('End Time', width=150)
+        sessions_tree.column('Lap Time', width=100)
+        sessions_tree.column('Paused Time', width=100)
+        self.view.pack(fill='both', expand=True)
+
+        self.refresh()
+
+    def refresh(self):
+        count = core.get_data_store().count_sessions(self.project_name, self.start, self.end) or 0
+        self.count_label.config(text=f"{count} sessions")
+        self.view.set_row_count(count)
+
+    def fetch_rows(self, start, stop):
+        rows = core.get_data_store().session_page(
+            self.project_name, start, stop - start, self.order, self.descending, self.start, self.end)
+        return [self.format_row(row) for row in rows]
+
+    def format_row(self, row):
+        idx, start_time, end_time, lap_time, total_paused_time = row
+        start_time_str = format_timestamp(start_time)
+        end_time_str = format_timestamp(end_time) if end_time else 'Running'
+        lap_time_formatted = format_time(lap_time) if lap_time else 'Running'
+        paused_time_formatted = format_time(total_paused_time)
+        return (f"Session {idx}", start_time_str, end_time_str, lap_time_formatted, paused_time_formatted)
+
+    def sort_by(self, column):
+        order = SORT_FIELDS[column]
+        if order == self.order or {order, self.order} == {'seq', 'start_time'}:
+            self.descending = not self.descending
+        else:
+            self.descending = False
+        self.order = order
+        self.refresh()
+
+    def apply_filter(self):
+        try:
+            start = parse_date(self.from_entry.get())
+            # The "To" day is included
+            end = parse_date(self.to_entry.get(), days=1)
+        except ValueError:
+            messagebox.showerror("Invalid Date", "Please enter dates as YYYY-MM-DD.", parent=self.window)
+            return
+        self.start = start
+        self.end = end
+        self.refresh()
+
+    def clear_filter(self):
+        self.from_entry.delete(0, 'end')
+        self.to_entry.delete(0, 'end')
+        self.start = None
+        self.end = None
+        self.refresh()
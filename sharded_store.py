@@ -0,0 +1,297 @@
+
+import os
+import json
+
+from archive import Archive, restore_archived
+from instrument import record_bytes, timed
+from session_columns import SessionColumns
+from store import DataStore, default_data, file_lock, file_signature, read_data_file, write_data_file
+from stream_loader import DamagedDataFile, load_json_stream
+from transitions import TransitionError, apply_record, try_apply
+
+# Transitions that change one project's sessions, and so its shard
+SESSION_OPS = ['start', 'resume', 'stop', 'pause', 'resume_paused']
+
+class ShardedProject(dict):
+    # A project as listed in the manifest: status and total_time are there
+    # from the start, the sessions are read from the shard the first time
+    # anything asks for them. Copies and pickles are plain dicts.
+    __slots__ = ('store', 'shard')
+
+    def __init__(self, store, shard, fields):
+        super().__init__(fields)
+        self.store = store
+        self.shard = shard
+
+    def loaded(self):
+        return dict.__contains__(self, 'sessions')
+
+    def __missing__(self, key):
+        if key != 'sessions':
+            raise KeyError(key)
+        self.store.read_shard(self)
+        return dict.__getitem__(self, 'sessions')
+
+    def __contains__(self, key):
+        return key == 'sessions' or dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        if key == 'sessions':
+            return self['sessions']
+        return dict.get(self, key, default)
+
+    def keys(self):
+        self['sessions']
+        return dict.keys(self)
+
+    def items(self):
+        self['sessions']
+        return dict.items(self)
+
+    def values(self):
+        self['sessions']
+        return dict.values(self)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __reduce__(self):
+        return dict, (dict(self.items()),)
+
+class ShardedStore(DataStore):
+    # One file per project plus a small manifest, all in timesheet.shards/:
+    #   manifest.json = {'projects': {name: {'shard': '7.json', 'status': ...,
+    #                                        'total_time': ...}},
+    #                    'next_shard': 8}
+    #   7.json        = {'status': ..., 'total_time': ..., 'sessions': [...]}
+    # A transition rewrites the shard of the project it touches and the
+    # manifest, a rename or a delete only the manifest (a deleted project's
+    # shard is unlinked afterwards). Loading reads the manifest alone, which
+    # is enough to list the projects; a project's shard is read when its
+    # sessions are first needed.
+    #
+    # Each project's file only holds its own history, so there is no tiering
+    # into archives here: archived sessions are brought back when the JSON
+    # file is migrated, as for SQLite. The per-day rollups are not stored
+    # either; a report builds them from the shards once per process.
+    def __init__(self, path):
+        super().__init__(path)
+        self.directory = os.path.splitext(path)[0] + '.shards'
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self._manifest = None
+        if not os.path.exists(self.manifest_path) and os.path.exists(path):
+            # First start on the sharded engine: bring the JSON history along
+            self.save(restore_archived(read_data_file(path), Archive(path)))
+
+    def shard_path(self, shard):
+        return os.path.join(self.directory, shard)
+
+    def load(self):
+        signature = file_signature(self.manifest_path)
+        if self._data is not None and signature == self._signature:
+            return self._data
+
+        damage = None
+        if signature is None:
+            manifest = {'projects': {}, 'next_shard': 1}
+        else:
+            try:
+                manifest = load_json_stream(self.manifest_path)
+            except DamagedDataFile as e:
+                manifest = self._recover_manifest(e.data)
+                damage = DamagedDataFile(default_data(), (
+                    f"The project list in {self.manifest_path} is damaged. It was rebuilt from the "
+                    f"{len(manifest['projects'])} project file(s) next to it; projects whose names were "
+                    f"lost are called 'Recovered <number>'."), e.quarantine_path)
+            else:
+                if 'next_shard' not in manifest:
+                    # Empty; only damage if project files were written beside it
+                    manifest = self._recover_manifest(manifest)
+                    if manifest['projects']:
+                        damage = DamagedDataFile(default_data(), (
+                            f"The project list in {self.manifest_path} is empty. It was rebuilt from the "
+                            f"{len(manifest['projects'])} project file(s) next to it; they are called "
+                            f"'Recovered <number>'."), None)
+
+        data = default_data()
+        for name, entry in manifest['projects'].items():
+            data['projects'][name] = ShardedProject(self, entry['shard'], {
+                'status': entry['status'],
+                'total_time': entry['total_time']
+            })
+        self._manifest = manifest
+        self._data = data
+        self._signature = signature
+        self.generation += 1
+        self.reads += 1
+        if damage is not None:
+            damage.data = data
+            raise damage
+        if signature is not None:
+            record_bytes('read_file', signature[1])
+        return data
+
+    def _recover_manifest(self, salvaged):
+        # Every shard on disk is kept, whatever happened to the manifest:
+        # under its name where the readable part of the manifest has it,
+        # otherwise under its number. The next write saves the new manifest.
+        names = {entry['shard']: name for name, entry in salvaged['projects'].items()
+                 if isinstance(entry, dict) and 'shard' in entry}
+        manifest = {'projects': {}, 'next_shard': 1}
+        for filename in sorted(os.listdir(self.directory)):
+            number, extension = os.path.splitext(filename)
+            if extension != '.json' or not number.isdigit():
+                continue
+            try:
+                with open(self.shard_path(filename), 'rb') as f:
+                    shard = json.loads(f.read())
+            except json.JSONDecodeError:
+                # Left on disk for a closer look; next_shard keeps it from
+                # being overwritten
+                pass
+            else:
+                manifest['projects'][names.get(filename, f"Recovered {number}")] = {
+                    'shard': filename,
+                    'status': shard['status'],
+                    'total_time': shard['total_time']
+                }
+            manifest['next_shard'] = max(manifest['next_shard'], int(number) + 1)
+        return manifest
+
+    @timed('read_shard')
+    def read_shard(self, project):
+        try:
+            with open(self.shard_path(project.shard), 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            # Deleted by another process since our manifest was read; the
+            # next load sees the project gone
+            project['sessions'] = []
+            return
+        record_bytes('read_shard', len(raw))
+        shard = json.loads(raw)
+        # The shard is written before the manifest, so after a crash between
+        # the two it is the more recent of them
+        project['status'] = shard['status']
+        project['total_time'] = shard['total_time']
+        project['sessions'] = SessionColumns(shard['sessions']) if self.columnar else shard['sessions']
+
+    def save(self, data):
+        # Rewrites every shard
+        with file_lock(self.path):
+            self.load()
+            self._write(data, list(data['projects'].values()))
+
+    def commit(self, record):
+        # Same merge as the JSON engine: under the lock the latest manifest is
+        # read and the record applied on top of it
+        with file_lock(self.path):
+            data = self.load()
+            generation = self.generation
+            try:
+                apply_record(data, record)
+                self._write(data, self._touched(data, record))
+            except TransitionError:
+                # Refused before anything was changed
+                raise
+            except BaseException:
+                # The cached data is ahead of the files now, or half changed
+                self.invalidate()
+                raise
+            self._index_records(generation, [record])
+        return data
+
+    def commit_many(self, records, before=None):
+        with file_lock(self.path):
+            data = self.load()
+            generation = self.generation
+            errors = []
+            touched = []
+            try:
+                for record in records:
+                    if before is not None:
+                        before(data, record)
+                    error = try_apply(data, record)
+                    if error is None:
+                        touched.extend(self._touched(data, record))
+                    errors.append(error)
+                if None in errors:
+                    self._write(data, touched)
+            except BaseException:
+                # A record that failed other than by TransitionError may have
+                # been applied in part
+                self.invalidate()
+                raise
+            if None in errors:
+                self._index_records(generation, [record for record, error in zip(records, errors) if error is None])
+        return errors
+
+    def _touched(self, data, record):
+        # Projects whose shards a record that was just applied has changed.
+        # The objects are kept rather than the names, as a later record of
+        # the same batch may rename them.
+        op = record['op']
+        if op in SESSION_OPS:
+            return [data['projects'][record['project']]]
+        if op == 'import':
+            return [data['projects'][project_name] for project_name in record['sessions']]
+        if op == 'restore':
+            return [data['projects'][project_name] for project_name in record['projects']]
+        if op == 'merge':
+            return [data['projects'][project_name] for project_name in record['changes'] if project_name in data['projects']]
+        if op == 'revert' and record['project'] in data['projects']:
+            return [data['projects'][record['project']]]
+        return []
+
+    @timed('write_file')
+    def _write(self, data, touched):
+        # Callers hold the file lock. Shards first, then the manifest that
+        # points at them, then whatever the manifest no longer points at.
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = {'projects': {}, 'next_shard': self._manifest['next_shard']}
+        touched = {id(project) for project in touched}
+        written = 0
+        for name, project in data['projects'].items():
+            if not isinstance(project, ShardedProject):
+                # Started, imported or saved since the load
+                project = data['projects'][name] = ShardedProject(self, f"{manifest['next_shard']}.json", project)
+                manifest['next_shard'] += 1
+                touched.add(id(project))
+            if id(project) in touched:
+                if self.columnar and not isinstance(project['sessions'], SessionColumns):
+                    project['sessions'] = SessionColumns(project['sessions'])
+                write_data_file(self.shard_path(project.shard), {
+                    'status': project['status'],
+                    'total_time': project['total_time'],
+                    'sessions': project['sessions']
+                })
+                written += os.path.getsize(self.shard_path(project.shard))
+            manifest['projects'][name] = {
+                'shard': project.shard,
+                'status': project['status'],
+                'total_time': project['total_time']
+            }
+        write_data_file(self.manifest_path, manifest)
+
+        in_use = {entry['shard'] for entry in manifest['projects'].values()}
+        for entry in self._manifest['projects'].values():
+            if entry['shard'] not in in_use:
+                try:
+                    os.remove(self.shard_path(entry['shard']))
+                except FileNotFoundError:
+                    pass
+
+        self._manifest = manifest
+        self._data = data
+        self._signature = file_signature(self.manifest_path)
+        self.generation += 1
+        record_bytes('write_file', written + self._signature[1])
+
+    def open_sessions(self):
+        # Only the shards of running and paused projects are read
+        return {name: project['sessions'][-1]['start_time'] for name, project in self.load()['projects'].items()
+                if project['status'] in ['Running', 'Paused']}
+
+    def invalidate(self):
+        super().invalidate()
+        self._manifest = None
@@ -0,0 +1,420 @@
+
+import os
+import sys
+import sqlite3
+import itertools
+
+from archive import Archive, restore_archived
+from rollups import build_rollups, session_days
+from store import DataStore, default_data, read_data_file
+from stream_loader import DamagedDataFile
+from transitions import apply_record, try_apply
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    total_time REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS projects_status ON projects(status);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL,
+    lap_time REAL NOT NULL DEFAULT 0,
+    total_paused_time REAL NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS sessions_project ON sessions(project_id, seq);
+CREATE INDEX IF NOT EXISTS sessions_project_start ON sessions(project_id, start_time);
+CREATE INDEX IF NOT EXISTS sessions_start ON sessions(start_time);
+
+CREATE TABLE IF NOT EXISTS pauses (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    pause_start REAL NOT NULL,
+    pause_end REAL
+);
+CREATE INDEX IF NOT EXISTS pauses_session ON pauses(session_id);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    day TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (project_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rollups_day ON rollups(day);
+'''
+
+# PRAGMA user_version of a database with everything in SCHEMA filled in;
+# 1 added the rollups table. 0 is a database not set up yet: the JSON import
+# sets the version in the same transaction, so one that was cut short runs
+# again on the next start.
+SCHEMA_VERSION = 1
+
+# Columns the sessions view may sort by
+SESSION_ORDERS = ['seq', 'start_time', 'end_time', 'lap_time', 'total_paused_time']
+
+class SQLiteStore(DataStore):
+    # Projects, sessions and pauses live in their own indexed tables. load()
+    # still returns the familiar nested dict for the GUI, rebuilt only when
+    # another connection has committed (PRAGMA data_version), while the
+    # report/status/sessions/export queries run directly as SQL.
+    def __init__(self, path, json_path=None):
+        super().__init__(path)
+        self._damage = None  # DamagedDataFile of the JSON import, raised by the first load()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(SCHEMA)
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0 and not self.conn.execute('SELECT EXISTS (SELECT 1 FROM projects)').fetchone()[0]:
+            # First start on the SQLite engine: bring the JSON history along
+            self._import_json(json_path)
+        elif version < SCHEMA_VERSION:
+            # Database from before the rollups table existed; the version is
+            # set with the rollups, so an interrupted migration runs again
+            with self.conn:
+                self._write_rollups(self.load())
+                self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _import_json(self, json_path):
+        data = default_data()
+        if json_path and os.path.exists(json_path):
+            try:
+                data = read_data_file(json_path)
+            except DamagedDataFile as e:
+                # What could be read comes along, the rest was copied aside
+                data = e.data
+                self._damage = e
+            data = restore_archived(data, Archive(json_path))
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            if self.conn.execute('PRAGMA user_version').fetchone()[0]:
+                # Another process imported it meanwhile
+                return
+            self._replace_all(data)
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._data = data
+        self._signature = self._data_version()
+        self.generation += 1
+
+    def _data_version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def load(self):
+        if self._damage is not None:
+            damage, self._damage = self._damage, None
+            damage.data = self.load()
+            raise damage
+        version = self._data_version()
+        if self._data is not None and version == self._signature:
+            return self._data
+
+        data = default_data()
+        projects = data['projects']
+        names = {}
+        for project_id, name, status, total_time in self.conn.execute(
+                'SELECT id, name, status, total_time FROM projects ORDER BY id'):
+            names[project_id] = name
+            projects[name] = {'status': status, 'sessions': [], 'total_time': total_time}
+        sessions = {}
+        for session_id, project_id, start_time, end_time, lap_time, total_paused_time in self.conn.execute(
+                'SELECT id, project_id, start_time, end_time, lap_time, total_paused_time '
+                'FROM sessions ORDER BY project_id, seq'):
+            session = {
+                'start_time': start_time,
+                'end_time': end_time,
+                'lap_time': lap_time,
+                'pauses': [],
+                'total_paused_time': total_paused_time
+            }
+            sessions[session_id] = session
+            projects[names[project_id]]['sessions'].append(session)
+        for session_id, pause_start, pause_end in self.conn.execute(
+                'SELECT session_id, pause_start, pause_end FROM pauses ORDER BY id'):
+            sessions[session_id]['pauses'].append({'pause_start': pause_start, 'pause_end': pause_end})
+
+        self._data = data
+        self._signature = version
+        self.generation += 1
+        self.reads += 1
+        return data
+
+    def save(self, data):
+        # Replace everything in one transaction (used by the JSON migrator)
+        with self.conn:
+            self._replace_all(data)
+        self._data = data
+        self._signature = self._data_version()
+        self.generation += 1
+
+    def _replace_all(self, data):
+        # Callers open the transaction
+        self.conn.execute('DELETE FROM projects')
+        for name, project in data['projects'].items():
+            project_id = self.conn.execute(
+                'INSERT INTO projects (name, status, total_time) VALUES (?, ?, ?)',
+                (name, project['status'], project['total_time'])).lastrowid
+            self._insert_sessions(project_id, project['sessions'])
+        self._write_rollups(data)
+
+    def _insert_sessions(self, project_id, sessions):
+        for seq, session in enumerate(sessions, start=1):
+            session_id = self.conn.execute(
+                'INSERT INTO sessions (project_id, seq, start_time, end_time, lap_time, total_paused_time) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (project_id, seq, session['start_time'], session['end_time'], session['lap_time'],
+                 session.get('total_paused_time', 0))).lastrowid
+            self.conn.executemany(
+                'INSERT INTO pauses (session_id, pause_start, pause_end) VALUES (?, ?, ?)',
+                [(session_id, pause['pause_start'], pause.get('pause_end'))
+                 for pause in session.get('pauses', [])])
+
+    def _write_rollups(self, data):
+        self.conn.execute('DELETE FROM rollups')
+        for name, project_rollups in build_rollups(data).items():
+            self.conn.executemany(
+                'INSERT INTO rollups (project_id, day, seconds) '
+                'SELECT id, ?, ? FROM projects WHERE name = ?',
+                [(day, seconds, name) for day, seconds in project_rollups.items()])
+
+    def commit(self, record):
+        # BEGIN IMMEDIATE takes the write lock before the state is read, so
+        # the record is validated and applied against the latest commit of
+        # any other process or connection
+        try:
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                data = self.load()
+                generation = self.generation
+                apply_record(data, record)
+                self.generation += 1
+                self._write_record(record, data)
+                self._index_records(generation, [record])
+        except BaseException:
+            # The cached dict may be ahead of the database now
+            self.invalidate()
+            raise
+        return data
+
+    def commit_many(self, records, before=None):
+        # One transaction for the whole batch
+        try:
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                data = self.load()
+                generation = self.generation
+                errors = []
+                for record in records:
+                    if before is not None:
+                        before(data, record)
+                    error = try_apply(data, record)
+                    if error is None:
+                        self._write_record(record, data)
+                    errors.append(error)
+                if None in errors:
+                    self.generation += 1
+                    self._index_records(generation, [record for record, error in zip(records, errors) if error is None])
+        except BaseException:
+            self.invalidate()
+            raise
+        return errors
+
+    def _write_record(self, record, data):
+        op = record['op']
+        if op == 'clear':
+            self.conn.execute('DELETE FROM projects')
+        elif op == 'delete':
+            self.conn.execute('DELETE FROM projects WHERE name = ?', (record['project'],))
+        elif op == 'rename':
+            self.conn.execute('UPDATE projects SET name = ? WHERE name = ?', (record['new_name'], record['project']))
+        elif op in ('restore', 'revert', 'merge'):
+            # Undo and sync: the projects they touched are written afresh
+            if op == 'restore':
+                names = record['projects']
+            elif op == 'merge':
+                names = record['changes']
+            else:
+                names = [record['project']]
+            for project_name in names:
+                project = data['projects'].get(project_name)
+                if project is None:
+                    self.conn.execute('DELETE FROM projects WHERE name = ?', (project_name,))
+                else:
+                    self._rewrite_project(project_name, project)
+                    self.conn.execute('DELETE FROM rollups WHERE project_id = (SELECT id FROM projects WHERE name = ?)',
+                                      (project_name,))
+                    self.conn.executemany(
+                        'INSERT INTO rollups (project_id, day, seconds) SELECT id, ?, ? FROM projects WHERE name = ?',
+                        [(day, seconds, project_name) for day, seconds in
+                         build_rollups({'projects': {project_name: project}})[project_name].items()])
+        elif op == 'import':
+            for project_name, sessions in record['sessions'].items():
+                self._rewrite_project(project_name, data['projects'][project_name])
+                self.conn.executemany(
+                    'INSERT INTO rollups (project_id, day, seconds) '
+                    'SELECT id, ?, ? FROM projects WHERE name = ? '
+                    'ON CONFLICT (project_id, day) DO UPDATE SET seconds = seconds + excluded.seconds',
+                    [(day, seconds, project_name) for session in sessions for day, seconds in session_days(session).items()])
+        else:
+            project = data['projects'][record['project']]
+            self._write_current_session(record['project'], project)
+            if op == 'stop':
+                self.conn.executemany(
+                    'INSERT INTO rollups (project_id, day, seconds) '
+                    'SELECT id, ?, ? FROM projects WHERE name = ? '
+                    'ON CONFLICT (project_id, day) DO UPDATE SET seconds = seconds + excluded.seconds',
+                    [(day, seconds, record['project']) for day, seconds in session_days(project['sessions'][-1]).items()])
+
+    def _rewrite_project(self, project_name, project):
+        # Imported sessions can land between existing ones, and sessions are
+        # numbered by position, so the project's sessions are written afresh
+        row = self.conn.execute('SELECT id FROM projects WHERE name = ?', (project_name,)).fetchone()
+        if row is None:
+            project_id = self.conn.execute(
+                'INSERT INTO projects (name, status, total_time) VALUES (?, ?, ?)',
+                (project_name, project['status'], project['total_time'])).lastrowid
+        else:
+            project_id = row[0]
+            self.conn.execute('UPDATE projects SET status = ?, total_time = ? WHERE id = ?',
+                              (project['status'], project['total_time'], project_id))
+            self.conn.execute('DELETE FROM sessions WHERE project_id = ?', (project_id,))
+        self._insert_sessions(project_id, project['sessions'])
+
+    def _write_current_session(self, project_name, project):
+        # start/resume/pause/resume_paused/stop only ever touch the project row
+        # and its last session and pause, so write exactly those rows
+        row = self.conn.execute('SELECT id FROM projects WHERE name = ?', (project_name,)).fetchone()
+        if row is None:
+            project_id = self.conn.execute(
+                'INSERT INTO projects (name, status, total_time) VALUES (?, ?, ?)',
+                (project_name, project['status'], project['total_time'])).lastrowid
+        else:
+            project_id = row[0]
+            self.conn.execute('UPDATE projects SET status = ?, total_time = ? WHERE id = ?',
+                              (project['status'], project['total_time'], project_id))
+
+        seq = len(project['sessions'])
+        session = project['sessions'][-1]
+        values = (session['start_time'], session['end_time'], session['lap_time'], session.get('total_paused_time', 0))
+        row = self.conn.execute('SELECT id FROM sessions WHERE project_id = ? AND seq = ?', (project_id, seq)).fetchone()
+        if row is None:
+            session_id = self.conn.execute(
+                'INSERT INTO sessions (start_time, end_time, lap_time, total_paused_time, project_id, seq) '
+                'VALUES (?, ?, ?, ?, ?, ?)', values + (project_id, seq)).lastrowid
+        else:
+            session_id = row[0]
+            self.conn.execute(
+                'UPDATE sessions SET start_time = ?, end_time = ?, lap_time = ?, total_paused_time = ? WHERE id = ?',
+                values + (session_id,))
+
+        pauses = session.get('pauses', [])
+        if pauses:
+            pause = pauses[-1]
+            count, last_id = self.conn.execute(
+                'SELECT COUNT(*), MAX(id) FROM pauses WHERE session_id = ?', (session_id,)).fetchone()
+            if count < len(pauses):
+                self.conn.execute('INSERT INTO pauses (session_id, pause_start, pause_end) VALUES (?, ?, ?)',
+                                  (session_id, pause['pause_start'], pause.get('pause_end')))
+            else:
+                self.conn.execute('UPDATE pauses SET pause_end = ? WHERE id = ?', (pause.get('pause_end'), last_id))
+
+    def project_totals(self):
+        return self.conn.execute('SELECT name, total_time FROM projects ORDER BY id').fetchall()
+
+    def active_projects(self):
+        return self.conn.execute('''
+            SELECT p.name, p.status, s.start_time, s.total_paused_time,
+                   CASE WHEN p.status = 'Paused' THEN
+                       (SELECT pause_start FROM pauses WHERE session_id = s.id ORDER BY id DESC LIMIT 1)
+                   END
+            FROM projects p
+            JOIN sessions s ON s.project_id = p.id
+                AND s.seq = (SELECT MAX(seq) FROM sessions WHERE project_id = p.id)
+            WHERE p.status IN ('Running', 'Paused')
+            ORDER BY p.id''').fetchall()
+
+    def _session_filter(self, project_name, start, end):
+        row = self.conn.execute('SELECT id FROM projects WHERE name = ?', (project_name,)).fetchone()
+        if row is None:
+            return None, ()
+        where = 'project_id = ?'
+        params = [row[0]]
+        if start is not None:
+            where += ' AND start_time >= ?'
+            params.append(start)
+        if end is not None:
+            where += ' AND start_time < ?'
+            params.append(end)
+        return where, params
+
+    def count_sessions(self, project_name, start=None, end=None):
+        where, params = self._session_filter(project_name, start, end)
+        if where is None:
+            return None
+        return self.conn.execute(f'SELECT COUNT(*) FROM sessions WHERE {where}', params).fetchone()[0]
+
+    def session_page(self, project_name, offset, limit, order='seq', descending=False, start=None, end=None):
+        if order not in SESSION_ORDERS:
+            raise ValueError(f"Cannot sort sessions by '{order}'")
+        where, params = self._session_filter(project_name, start, end)
+        if where is None:
+            return []
+        direction = 'DESC' if descending else 'ASC'
+        return self.conn.execute(
+            f'SELECT seq, start_time, end_time, lap_time, total_paused_time FROM sessions WHERE {where} '
+            f'ORDER BY {order} {direction}, seq {direction} LIMIT ? OFFSET ?',
+            list(params) + [limit, offset]).fetchall()
+
+    def day_totals(self, start_day, end_day):
+        return self.conn.execute(
+            'SELECT p.name, r.day, r.seconds FROM rollups r JOIN projects p ON p.id = r.project_id '
+            'WHERE r.day BETWEEN ? AND ?', (start_day.isoformat(), end_day.isoformat())).fetchall()
+
+    def count_all_sessions(self):
+        return self.conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def iter_export_rows(self):
+        return self._export_rows()
+
+    def _export_rows(self):
+        # A connection of its own gives the export a consistent snapshot and
+        # lets it run on a worker thread while the GUI keeps writing
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute('''
+                SELECT p.name, p.total_time, s.id, s.seq, s.start_time, s.end_time, s.lap_time,
+                       pa.pause_start, pa.pause_end
+                FROM projects p
+                JOIN sessions s ON s.project_id = p.id
+                LEFT JOIN pauses pa ON pa.session_id = s.id
+                ORDER BY p.id, s.seq, pa.id''')
+            for _, rows in itertools.groupby(cursor, key=lambda row: row[2]):
+                rows = list(rows)
+                name, total_time, _, seq, start_time, end_time, lap_time, _, _ = rows[0]
+                pauses = [(row[7], row[8]) for row in rows if row[7] is not None]
+                yield (name, total_time, seq, start_time, end_time, lap_time, pauses)
+        finally:
+            conn.close()
+
+    def close(self):
+        self.conn.close()
+
+def migrate_json(json_path, db_path):
+    # One-shot copy of an existing timesheet.json into a SQLite database
+    store = SQLiteStore(db_path)
+    store.save(restore_archived(read_data_file(json_path), Archive(json_path)))
+    store.close()
+
+if __name__ == '__main__':
+    # python sqlite_store.py [timesheet.json [timesheet.db]]
+    from core import DATA_FILE
+    json_path = sys.argv[1] if len(sys.argv) > 1 else DATA_FILE
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(json_path)[0] + '.db'
+    migrate_json(json_path, db_path)
+    print(f"Migrated {json_path} to {db_path}")
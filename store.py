@@ -0,0 +1,444 @@
+
+import os
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from archive import ARCHIVE_DAYS, Archive, ProjectSessions, archive_sessions, archived_count
+from binary_format import MAGIC, decode, encode, is_binary
+from instrument import record_bytes, timed
+from project_index import ProjectIndex
+from rollups import ensure_rollups, iter_days
+from session_columns import columnize, json_default
+from stream_loader import DamagedDataFile, load_json_stream
+from timeline import build_index
+from transitions import TransitionError, apply_record, try_apply
+
+# Format of newly created data files: 'json' or 'binary' (see binary_format.py).
+# Existing files are read in whichever format they are in and keep it.
+FILE_FORMAT = os.environ.get('TIMESHEET_FORMAT', 'json')
+
+# In-memory form of each project's sessions: 'dicts', a list of dicts as in
+# the file, or 'columns', arrays of floats (see session_columns.py) that take
+# a fraction of the memory for long histories
+SESSION_MODEL = os.environ.get('TIMESHEET_SESSIONS', 'dicts')
+
+def default_data():
+    return {
+        "projects": {}  # {project_name: project_data}
+    }
+
+def file_signature(path):
+    # (inode, size, mtime) identifies a version of the file without reading it
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+@timed('read_file')
+def load_data_file(path, columnar=False, salvage=True):
+    # (data, 'json' or 'binary'); the format is recognized from the file itself.
+    # A damaged JSON file raises DamagedDataFile with what could be recovered.
+    # With salvage=False (read as dicts only) it raises the plain JSONDecodeError
+    # instead, and nothing is written beside the file.
+    with open(path, 'rb') as f:
+        raw = f.read(len(MAGIC))
+        if is_binary(raw) or not columnar:
+            raw += f.read()
+    if is_binary(raw):
+        data, file_format = decode(raw, columnar), 'binary'
+    elif columnar:
+        # Read project by project, so only one project is ever held as dicts
+        data, file_format = load_json_stream(path, columnar), 'json'
+    else:
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError:
+            if not salvage:
+                raise
+            raw = None
+            data = load_json_stream(path)
+        file_format = 'json'
+    # Ensure all necessary keys are present
+    for key, default_value in default_data().items():
+        if key not in data:
+            data[key] = default_value
+    return data, file_format
+
+def read_data_file(path, salvage=True):
+    return load_data_file(path, salvage=salvage)[0]
+
+@contextmanager
+def file_lock(path):
+    # Exclusive advisory lock on path + '.lock', shared by every process and
+    # thread using the same data file. Held only around read-modify-write.
+    with open(path + '.lock', 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds; keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def write_data_file(path, data, file_format='json'):
+    # Readers see either the old file or the new one, never half of it, and a
+    # crash while writing leaves the old file in place
+    if file_format == 'binary':
+        payload = encode(data)
+    else:
+        # json.dumps runs the C encoder; json.dump to a file does not
+        payload = json.dumps(data, default=json_default).encode()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class DataStore:
+    # Keeps the parsed timesheet in memory and only goes back to disk when the
+    # file has been replaced or modified by someone else.
+    # True for a store whose commit() returns before the change is written
+    writes_behind = False
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._signature = None
+        # Bumped whenever the data changes, so views can skip work when it didn't
+        self.generation = 0
+        self._order_cache = None
+        # Closed sessions older than ARCHIVE_DAYS live in compressed files here
+        self.archive = Archive(path)
+        self.file_format = FILE_FORMAT
+        self.columnar = SESSION_MODEL == 'columns'
+        # Interval index behind sessions_between, built on first use
+        self._timeline = None
+        # Name index behind find_projects, likewise
+        self._names = None
+        # Session arrays behind the analytics, likewise
+        self._sessions = None
+        # Times the data was read from storage; the store's own writes don't
+        # count, so a change means someone else changed it
+        self.reads = 0
+
+    def load(self):
+        signature = file_signature(self.path)
+        if self._data is not None and signature == self._signature:
+            return self._data
+
+        if signature is None:
+            data = default_data()
+        else:
+            try:
+                data, self.file_format = load_data_file(self.path, self.columnar)
+            except DamagedDataFile as e:
+                # Keep what was recovered for this version of the file, so the
+                # damage is reported once, not on every tick, and the next
+                # write saves the recovered history rather than nothing
+                self._data = e.data
+                self._signature = signature
+                self.generation += 1
+                self.reads += 1
+                raise
+
+        self._data = data
+        self._signature = signature
+        self.generation += 1
+        self.reads += 1
+        if signature is not None:
+            record_bytes('read_file', signature[1])
+        return data
+
+    def save(self, data):
+        with file_lock(self.path):
+            self._write(data)
+
+    @timed('write_file')
+    def _write(self, data):
+        self.archive_old_sessions(data)
+        if self.columnar:
+            # Projects started since the load hold a plain list
+            columnize(data)
+        write_data_file(self.path, data, self.file_format)
+        self._data = data
+        self._signature = file_signature(self.path)
+        self.generation += 1
+        record_bytes('write_file', self._signature[1])
+
+    def commit(self, record):
+        # Apply one transition record and persist the result. Under the lock
+        # the latest file is re-read if another process changed it and the
+        # record is applied on top of that, so concurrent writers merge
+        # operation by operation instead of overwriting each other.
+        with file_lock(self.path):
+            data = self.load()
+            generation = self.generation
+            try:
+                apply_record(data, record)
+                self._write(data)
+            except TransitionError:
+                # Refused before anything was changed
+                raise
+            except BaseException:
+                # The cached data is ahead of the file now, or half changed
+                self.invalidate()
+                raise
+            self._index_records(generation, [record])
+        return data
+
+    def commit_many(self, records, before=None):
+        # Group commit: each record is applied on its own so a rejected one
+        # doesn't hold back the rest, then the result is written once.
+        # Returns the TransitionError or None for every record. before, if
+        # given, is called as before(data, record) just ahead of each record
+        # (see core.commit_recorded).
+        with file_lock(self.path):
+            data = self.load()
+            generation = self.generation
+            try:
+                errors = []
+                for record in records:
+                    if before is not None:
+                        before(data, record)
+                    errors.append(try_apply(data, record))
+                if None in errors:
+                    self._write(data)
+            except BaseException:
+                # A record that failed other than by TransitionError may have
+                # been applied in part
+                self.invalidate()
+                raise
+            if None in errors:
+                self._index_records(generation, [record for record, error in zip(records, errors) if error is None])
+        return errors
+
+    def _index_records(self, generation, records):
+        # Moves the timeline and name indexes and the session table along
+        # with records applied on top of the data of generation; after any
+        # other change they are built afresh
+        for attribute in ('_timeline', '_names', '_sessions'):
+            index = getattr(self, attribute)
+            if index is not None and index.generation == generation and index.apply(records):
+                index.generation = self.generation
+            else:
+                setattr(self, attribute, None)
+
+    def archive_old_sessions(self, data):
+        # Callers hold the file lock and write data right after
+        if ARCHIVE_DAYS > 0:
+            archive_sessions(data, self.archive, time.time() - ARCHIVE_DAYS * 86400)
+
+    def project_sessions(self, project_name, start=None, end=None):
+        # A project's sessions starting in [start, end), archived ones included
+        data = self.load()
+        return ProjectSessions(self.archive, data, data['projects'][project_name], start, end)
+
+    # Queries used by the status, report, sessions and export views. Storage
+    # engines that can answer them without the whole document override these.
+
+    def project_totals(self):
+        return [(name, project['total_time']) for name, project in self.load()['projects'].items()]
+
+    def active_projects(self):
+        # (name, status, session start, paused so far, start of the current pause)
+        active = []
+        for name, project in self.load()['projects'].items():
+            if project['status'] in ['Running', 'Paused']:
+                current_session = project['sessions'][-1]
+                pause_start = current_session['pauses'][-1]['pause_start'] if project['status'] == 'Paused' else None
+                active.append((name, project['status'], current_session['start_time'],
+                               current_session.get('total_paused_time', 0), pause_start))
+        return active
+
+    def count_sessions(self, project_name, start=None, end=None):
+        # Number of sessions starting in [start, end), or None if there is no such project
+        if project_name not in self.load()['projects']:
+            return None
+        return len(self.project_sessions(project_name, start, end))
+
+    def session_page(self, project_name, offset, limit, order='seq', descending=False, start=None, end=None):
+        # One page of (session number, start, end, lap time, paused time) rows
+        # for the sessions starting in [start, end), sorted by order; no rows
+        # if there is no such project
+        if project_name not in self.load()['projects']:
+            return []
+        sessions = self.project_sessions(project_name, start, end)
+        count = len(sessions)
+        if order in ['seq', 'start_time']:
+            # Sessions are kept in start order, so this is plain index arithmetic
+            if descending:
+                indices = range(count - 1 - offset, max(count - 1 - offset - limit, -1), -1)
+            else:
+                indices = range(offset, min(offset + limit, count))
+        else:
+            indices = self._sorted_indices(project_name, sessions, start, end, order, descending)[offset:offset + limit]
+        rows = []
+        for idx in indices:
+            session = sessions[idx]
+            rows.append((sessions.seq(idx), session['start_time'], session['end_time'], session['lap_time'],
+                         session.get('total_paused_time', 0)))
+        return rows
+
+    def _sorted_indices(self, project_name, sessions, start, end, order, descending):
+        # Only the sort order is kept (one list of ints), not the rows themselves
+        key = (project_name, start, end, order, descending, self.generation)
+        if self._order_cache is None or self._order_cache[0] != key:
+            values = sessions.column(order)
+            def sort_key(idx):
+                value = values[idx]
+                return (float('inf') if value is None else value, idx)
+            self._order_cache = (key, sorted(range(len(values)), key=sort_key, reverse=descending))
+        return self._order_cache[1]
+
+    def day_totals(self, start_day, end_day):
+        # [(project, 'YYYY-MM-DD', seconds)] for the days start_day..end_day
+        # (datetime.date, inclusive), read from the per-day rollups
+        rollups = ensure_rollups(self.load())
+        days = [day.isoformat() for day in iter_days(start_day, end_day)]
+        first, last = start_day.isoformat(), end_day.isoformat()
+        totals = []
+        for project_name, project_rollups in rollups.items():
+            # Visit whichever is smaller: the days asked for or the days worked
+            if len(project_rollups) < len(days):
+                totals.extend((project_name, day, seconds) for day, seconds in project_rollups.items()
+                              if first <= day <= last)
+            else:
+                totals.extend((project_name, day, project_rollups[day]) for day in days if day in project_rollups)
+        return totals
+
+    def _timeline_index(self):
+        data = self.load()
+        if self._timeline is None or self._timeline.generation != self.generation:
+            self._timeline = build_index(data, self.archive)
+            self._timeline.generation = self.generation
+        return self._timeline
+
+    def project_index(self):
+        data = self.load()
+        if self._names is None or self._names.generation != self.generation:
+            self._names = ProjectIndex(data['projects'])
+            self._names.generation = self.generation
+        return self._names
+
+    def session_table(self):
+        # Imported here so only the analytics pay for NumPy
+        from analytics import build_table
+        data = self.load()
+        if self._sessions is None or self._sessions.generation != self.generation:
+            self._sessions = build_table(data, self.project_sessions)
+            self._sessions.generation = self.generation
+        return self._sessions
+
+    def sessions_between(self, start, end):
+        # [(start, end or None, project)] of every session with any part in
+        # [start, end), archived ones included, ordered by start
+        return self._timeline_index().overlapping(start, end)
+
+    def open_sessions(self):
+        # {project: start} of the sessions that are running or paused
+        return dict(self._timeline_index().running)
+
+    def count_all_sessions(self):
+        return sum(len(project['sessions']) + archived_count(project) for project in self.load()['projects'].values())
+
+    def iter_export_rows(self):
+        # (project, project total, session number, start, end, lap time, [(pause start, pause end)])
+        # The project list is captured here, on the calling thread, so the
+        # returned generator can be consumed by a worker thread. Archived
+        # months are read one at a time as the export reaches them.
+        projects = [(name, project['total_time'], self.project_sessions(name))
+                    for name, project in self.load()['projects'].items()]
+        return self._export_rows(projects)
+
+    def _export_rows(self, projects):
+        for project_name, total_time, sessions in projects:
+            for idx, session in enumerate(sessions):
+                pauses = [(pause['pause_start'], pause.get('pause_end')) for pause in session.get('pauses', [])]
+                yield (project_name, total_time, idx + 1, session['start_time'],
+                       session['end_time'], session['lap_time'], pauses)
+
+    def invalidate(self):
+        self._data = None
+        self._signature = None
+
+    def take_errors(self):
+        # [(title, message)] of changes that failed after commit() returned;
+        # only a store that writes in the background has any
+        return []
+
+    def flush(self):
+        # Everything is written by the time commit() returns
+        pass
+
+    def queued_label(self):
+        # Undo label of a change committed but not yet in the undo history
+        return None
+
+    def close(self):
+        pass
+
+# Storage engine used for new stores: 'json' rewrites the whole file on each
+# change, 'journal' appends one record per change (see journal.py), 'sqlite'
+# keeps normalized tables in timesheet.db (see sqlite_store.py), 'sharded'
+# keeps one file per project in timesheet.shards (see sharded_store.py),
+# 'remote' sends everything to a shared server.py at TIMESHEET_SERVER
+STORAGE = os.environ.get('TIMESHEET_STORAGE', 'json')
+
+_stores = {}
+
+def create_store(path, storage=None):
+    storage = storage or STORAGE
+    if storage == 'json':
+        return DataStore(path)
+    if storage == 'journal':
+        from journal import JournalStore
+        return JournalStore(path)
+    if storage == 'sqlite':
+        from sqlite_store import SQLiteStore
+        return SQLiteStore(os.path.splitext(path)[0] + '.db', json_path=path)
+    if storage == 'sharded':
+        from sharded_store import ShardedStore
+        return ShardedStore(path)
+    if storage == 'remote':
+        from remote_store import RemoteStore
+        return RemoteStore()
+    raise ValueError(f"Unknown storage engine '{storage}'")
+
+def get_store(path):
+    # One store per data file for the whole process
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = create_store(path)
+    return store
+
+def set_store(path, data_store):
+    # Makes get_store(path) return data_store from now on, e.g. a
+    # BackgroundStore in front of the configured engine
+    _stores[path] = data_store
@@ -0,0 +1,364 @@
+
+# Incremental reader for the JSON data file. The file is read in chunks and
+# parsed one project at a time, so besides the parsed data only one project's
+# text is in memory at once (and with TIMESHEET_SESSIONS=columns each project
+# is turned into arrays before the next one is read).
+#
+# When the file is damaged (a crash mid-write on a filesystem without atomic
+# rename, a bad sector, an editor accident) everything readable is kept:
+# whole projects, and of a project the damage is in, every sound session
+# before it. Reading picks up again at the next project after the damage, so
+# one bad byte costs at most the rest of one project. The unreadable parts
+# are copied to timesheet.json.damaged-<time> so nothing is lost, and the
+# caller gets DamagedDataFile with the recovered data instead of the empty
+# defaults that would otherwise be written over the history.
+
+import os
+import re
+import json
+import codecs
+import time
+
+from session_columns import SESSION_KEYS, PAUSE_KEYS, SessionColumns
+
+CHUNK_SIZE = 1 << 22
+
+WHITESPACE = ' \t\n\r'
+
+# Where the next key of an object may start
+NEXT_KEY = re.compile(r',[ \t\n\r]*"')
+
+decoder = json.JSONDecoder()
+
+class Damaged(Exception):
+    # offset: byte offset of the first unreadable byte, when it is not
+    # where the reader stopped
+    def __init__(self, offset=None):
+        super().__init__(offset)
+        self.offset = offset
+
+class DamagedDataFile(json.JSONDecodeError):
+    # What could be read of a damaged data file. A JSONDecodeError, so code
+    # that only knows about unreadable files keeps working.
+    def __init__(self, data, report, quarantine_path):
+        super().__init__(report, '', 0)
+        self.data = data
+        self.report = report
+        self.quarantine_path = quarantine_path
+
+    def __str__(self):
+        return self.report
+
+class ChunkReader:
+    def __init__(self, f):
+        self.f = f
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.buffer = ''
+        self.pos = 0
+        self.base = 0  # byte offset in the file of buffer[0]
+        self.dropped = 0  # characters parsed and dropped before buffer[0]
+        self.eof = False
+
+    def fill(self, size=CHUNK_SIZE):
+        # Appends at least size more bytes of the file; False at the end
+        if self.eof:
+            return False
+        if self.pos > CHUNK_SIZE:
+            # Drop what has been parsed
+            self.base += len(self.buffer[:self.pos].encode())
+            self.dropped += self.pos
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            self.buffer += self.text_decoder.decode(b'', final=True)
+            return False
+        self.buffer += self.text_decoder.decode(chunk)
+        return True
+
+    def mark(self):
+        # The current position, still valid after the buffer is refilled
+        return self.dropped + self.pos
+
+    def seek(self, mark):
+        # Back to a mark; the buffer never drops anything past the start of
+        # the value being read, so this stays within it
+        self.pos = mark - self.dropped
+
+    def offset(self):
+        # Byte offset in the file of the current position
+        return self.base + len(self.buffer[:self.pos].encode())
+
+    def peek(self):
+        # Next character after any whitespace, '' at the end of the file
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def take(self, expected):
+        char = self.peek()
+        if char not in expected or not char:
+            raise Damaged()
+        self.pos += 1
+        return char
+
+    def value(self):
+        # One complete JSON value, read with the C decoder. A value cut off by
+        # the end of the buffer fails to decode near that end; more of the
+        # file is read (twice as much each time, so a large project is
+        # decoded a bounded number of times) and it is tried again.
+        self.peek()
+        size = CHUNK_SIZE
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                cut_off = e.pos >= len(self.buffer) - 64 or e.msg.startswith('Unterminated string')
+                if cut_off and self.fill(size):
+                    size *= 2
+                    continue
+                raise Damaged()
+            if end == len(self.buffer) and self.fill():
+                # A number may go on in the next chunk
+                continue
+            self.pos = end
+            return value
+
+class StreamLoad:
+    def __init__(self, f, columnar=False):
+        self.reader = ChunkReader(f)
+        self.columnar = columnar
+        self.data = {}
+        self.damaged = []  # [start, end] byte ranges skipped, end None for the rest of the file
+        self.partial = []  # names of the projects read only in part
+        self.sessions = 0
+
+    def run(self):
+        reader = self.reader
+        try:
+            reader.take('{')
+            if reader.peek() == '}':
+                reader.pos += 1
+            else:
+                while True:
+                    key = reader.value()
+                    reader.take(':')
+                    if key == 'projects':
+                        self.projects()
+                    else:
+                        self.data[key] = reader.value()
+                    if reader.take(',}') == '}':
+                        break
+            if reader.peek():
+                # Something after the end of the document
+                raise Damaged()
+        except Damaged as e:
+            self.damaged.append([reader.offset() if e.offset is None else e.offset, None])
+        return self
+
+    def projects(self):
+        reader = self.reader
+        projects = self.data['projects'] = {}
+        reader.take('{')
+        if reader.peek() == '}':
+            reader.pos += 1
+            return
+        entry = None
+        while True:
+            try:
+                name, project = entry or self.project(projects)
+                entry = None
+                self.add_project(projects, name, project)
+                if reader.take(',}') == '}':
+                    return
+            except Damaged:
+                entry = self.resync()
+
+    def project(self, projects):
+        reader = self.reader
+        name = reader.value()
+        reader.take(':')
+        reader.peek()
+        start = reader.mark()
+        try:
+            return name, reader.value()
+        except Damaged:
+            # Go back and read it field by field, session by session; what
+            # was read stays when the damage is met
+            reader.seek(start)
+            self.partial.append(name)
+            projects[name] = project = {}
+            self.project_fields(project)
+            self.partial.pop()
+            return name, project
+
+    def resync(self):
+        # Skips from the damage to the next '"name": {project}' that reads
+        # whole and returns it; the damage runs to the end of the file when
+        # there is none
+        reader = self.reader
+        offset = reader.offset()
+        while True:
+            match = NEXT_KEY.search(reader.buffer, reader.pos)
+            if match is None:
+                # Keep the last few characters, a key may start in them
+                reader.pos = max(reader.pos, len(reader.buffer) - 16)
+                if not reader.fill():
+                    raise Damaged(offset)
+                continue
+            reader.pos = match.start() + 1
+            end = reader.offset()
+            try:
+                name = reader.value()
+                reader.take(':')
+                project = reader.value()
+                follows = reader.peek()
+            except Damaged:
+                continue
+            # Nothing inside a project is an object holding a list of sessions
+            if (isinstance(name, str) and isinstance(project, dict)
+                    and isinstance(project.get('sessions'), list) and follows in (',', '}')):
+                self.damaged.append([offset, end])
+                return name, project
+
+    def add_project(self, projects, name, project):
+        sessions = project.get('sessions', [])
+        self.sessions += len(sessions)
+        if self.columnar:
+            project['sessions'] = SessionColumns(sessions)
+        projects[name] = project
+
+    def project_fields(self, project):
+        reader = self.reader
+        reader.take('{')
+        while True:
+            key = reader.value()
+            reader.take(':')
+            if key == 'sessions':
+                sessions = project['sessions'] = []
+                reader.take('[')
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    while True:
+                        sessions.append(reader.value())
+                        if reader.take(',]') == ']':
+                            break
+            else:
+                project[key] = reader.value()
+            if reader.take(',}') == '}':
+                return
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def sound_session(session, last):
+    # Whether a recovered session can be kept as it is; only the last one
+    # may still be open
+    if not isinstance(session, dict) or any(key not in session for key in SESSION_KEYS):
+        return False
+    start_time, end_time = session['start_time'], session['end_time']
+    if not is_number(start_time) or not (is_number(end_time) and end_time >= start_time
+                                         or end_time is None and last):
+        return False
+    if not is_number(session['lap_time']) or not is_number(session['total_paused_time']):
+        return False
+    pauses = session['pauses']
+    return isinstance(pauses, list) and all(isinstance(pause, dict) and all(key in pause for key in PAUSE_KEYS)
+                                            for pause in pauses)
+
+def repair_project(project):
+    # A project cut short by the damage: whatever its fields said, what it
+    # is now follows from the sessions that were recovered. A session that
+    # isn't sound is dropped rather than made up.
+    sessions = project.get('sessions', [])
+    sessions = [session for i, session in enumerate(sessions) if sound_session(session, i == len(sessions) - 1)]
+    project['sessions'] = sessions
+    if sessions and sessions[-1]['end_time'] is None:
+        pauses = sessions[-1]['pauses']
+        project['status'] = 'Paused' if pauses and pauses[-1].get('pause_end') is None else 'Running'
+    else:
+        project['status'] = 'Stopped'
+    if 'archived' not in project:
+        # Archived sessions are only known from 'archived', which comes
+        # after the sessions in the file; without it the total is what is left
+        project['total_time'] = sum(session['lap_time'] for session in sessions)
+    return project
+
+def quarantine_damage(path, damaged):
+    # Copies the damaged byte ranges, one per line, to a side file named
+    # after the damaged file's modification time, so loading the same
+    # damaged file again doesn't make another copy
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(os.path.getmtime(path)))
+    quarantine_path = f"{path}.damaged-{stamp}"
+    if not os.path.exists(quarantine_path):
+        with open(path, 'rb') as source, open(quarantine_path + '.tmp', 'wb') as target:
+            for i, (start, end) in enumerate(damaged):
+                if i:
+                    target.write(b'\n')
+                source.seek(start)
+                left = -1 if end is None else end - start
+                while left:
+                    chunk = source.read(CHUNK_SIZE if left < 0 else min(left, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    left -= 0 if left < 0 else len(chunk)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(quarantine_path + '.tmp', quarantine_path)
+    return quarantine_path
+
+def archive_files_on_disk(path):
+    # {period: filename} of the archive directory, for when the data file's
+    # own list was in the damaged part
+    try:
+        filenames = os.listdir(path + '.archive')
+    except FileNotFoundError:
+        return {}
+    return {filename.split('.')[0]: filename for filename in sorted(filenames) if not filename.endswith('.tmp')}
+
+def load_json_stream(path, columnar=False):
+    # The data file's contents, read incrementally; raises DamagedDataFile
+    # with whatever could be recovered when it is damaged
+    with open(path, 'rb') as f:
+        load = StreamLoad(f, columnar).run()
+    data = load.data
+    if not load.damaged:
+        return data
+    size = os.path.getsize(path)
+    damaged_bytes = sum((size if end is None else end) - start for start, end in load.damaged)
+    if not data and not damaged_bytes:
+        # Empty, or only whitespace: nothing was lost, there was nothing yet
+        return {'projects': {}}
+
+    # A skipped range inside the projects cost at least part of one
+    projects_damaged = (load.partial or 'projects' not in data
+                        or any(end is not None for _, end in load.damaged))
+    data.setdefault('projects', {})
+    sessions = load.sessions
+    for project_name in load.partial:
+        project = repair_project(data['projects'][project_name])
+        sessions += len(project['sessions'])
+        if columnar:
+            project['sessions'] = SessionColumns(project['sessions'])
+    if 'archive_files' not in data and any('archived' in project for project in data['projects'].values()):
+        data['archive_files'] = archive_files_on_disk(path)
+    if projects_damaged:
+        # The per-day totals no longer match what is left
+        data.pop('rollups', None)
+
+    places = ", ".join(f"from byte {start} on" if end is None else f"at bytes {start}-{end}"
+                       for start, end in load.damaged)
+    partial = ", ".join(f"'{project_name}'" for project_name in load.partial)
+    # A file that just stops early has no unreadable bytes to keep
+    quarantine_path = quarantine_damage(path, load.damaged) if damaged_bytes else None
+    report = (f"The data file is damaged {places}. "
+              f"Recovered {len(data['projects'])} project(s) with {sessions} session(s)"
+              + (f", {partial} only in part" if partial else "") + "."
+              + (f" The unreadable parts ({damaged_bytes} bytes) were copied to {quarantine_path}."
+                 if quarantine_path else ""))
+    raise DamagedDataFile(data, report, quarantine_path)
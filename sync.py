@@ -0,0 +1,299 @@
+
+# Keeping the timesheets of several machines in step through sync_server.py.
+# What travels is sessions: each is known by (project name, start time), and
+# every local change to one is written down with a version stamp, [Lamport
+# clock, machine id]. A sync sends the changes made here since the last one
+# and receives everyone else's since then; where two machines changed the
+# same session, the higher stamp wins on every machine, so they all end up
+# with the same data whichever syncs first. A deleted session travels as
+# None, so a delete or a clear on one machine reaches the others.
+#
+# Nothing is written down until the first sync, which sends everything
+# there is. From then on timesheet.json.sync holds, appended to as changes
+# are committed:
+#   {"machine": id, "server": url, "cursor": n, "clock": n}   first line
+#   {"project": name, "start": time, "session": session or null, "clock": n}
+# cursor is the last of the server's changes applied here. A sync costs
+# the changes on either side, however long the history is.
+
+import os
+import json
+import uuid
+import http.client
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from archive import session_bounds
+from session_columns import json_default
+from store import file_lock, file_signature
+from transitions import TransitionError, copy_session
+
+SYNC_SERVER = os.environ.get('TIMESHEET_SYNC_SERVER', 'http://127.0.0.1:8766')
+
+TIMEOUT = 30
+
+# Changes sent to the server per request
+PUSH_BATCH = 5000
+
+def changed_keys(data, record, all_sessions):
+    # (project name, start time) of every session record is about to change,
+    # worked out from data before it is applied
+    op = record['op']
+    projects = data['projects']
+    if op in ('start', 'resume'):
+        return [(record['project'], record['time'])]
+    if op in ('stop', 'pause', 'resume_paused'):
+        project = projects.get(record['project'])
+        if project is None or not project['sessions']:
+            return []
+        return [(record['project'], project['sessions'][-1]['start_time'])]
+    if op in ('delete', 'clear', 'rename'):
+        names = list(projects) if op == 'clear' else [record['project']]
+        keys = [(project_name, session['start_time']) for project_name in names if project_name in projects
+                for session in all_sessions(project_name)]
+        if op == 'rename':
+            keys += [(record['new_name'], start_time) for _, start_time in keys]
+        return keys
+    if op == 'import':
+        return [(project_name, session['start_time'])
+                for project_name, sessions in record['sessions'].items() for session in sessions]
+    if op == 'restore':
+        return [(project_name, session['start_time'])
+                for project_name, project in record['projects'].items() for session in project['sessions']]
+    if op == 'revert':
+        project = projects.get(record['project'])
+        sessions = project['sessions'] if project else []
+        return ([(record['project'], sessions[idx]['start_time']) for idx in range(record['keep'], len(sessions))]
+                + [(record['project'], session['start_time']) for session in record['sessions']])
+    return []
+
+def current_sessions(data, keys, all_sessions):
+    # {(project name, start time): session or None} of keys in data as it is
+    found = {}
+    archived = {}
+    for project_name, start_time in keys:
+        project = data['projects'].get(project_name)
+        session = None
+        if project is not None:
+            sessions = project['sessions']
+            lo, hi = session_bounds(sessions, start_time, start_time + 1e-6)
+            if lo < hi:
+                session = sessions[lo]
+            elif 'archived' in project:
+                if project_name not in archived:
+                    archived[project_name] = {old['start_time']: old for old in all_sessions(project_name)}
+                session = archived[project_name].get(start_time)
+        found[(project_name, start_time)] = None if session is None else copy_session(session)
+    return found
+
+class SyncClient:
+    # One HTTP connection to the sync server for the length of a sync
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.url = url
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=TIMEOUT)
+
+    def post(self, path, payload):
+        try:
+            self.conn.request('POST', path, json.dumps(payload, default=json_default).encode(),
+                              {'Content-Type': 'application/json'})
+            response = self.conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            raise TransitionError("Sync Failed", f"Could not reach the sync server at {self.url}: {e}")
+        if response.status != 200:
+            raise TransitionError("Sync Failed", f"The sync server answered {response.status}.")
+        return json.loads(body)
+
+    def close(self):
+        self.conn.close()
+
+class SyncLog:
+    def __init__(self, data_path):
+        self.path = data_path + '.sync'
+        self.header = None
+        self.pending = {}  # {(project name, start time): (session or None, clock)}
+        self._signature = None
+        self._offset = 0
+
+    def enabled(self):
+        return os.path.exists(self.path)
+
+    def _refresh(self):
+        # Callers hold the lock. Reads what other processes appended, or
+        # everything if the file was rewritten.
+        signature = file_signature(self.path)
+        if signature == self._signature:
+            return
+        old = self._signature
+        if old is None or signature is None or signature[0] != old[0] or signature[1] < old[1]:
+            self.header = None
+            self.pending = {}
+            self._offset = 0
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn write from a crash; cut off on the next append
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if 'machine' in entry:
+                        self.header = entry
+                    else:
+                        self.pending[(entry['project'], entry['start'])] = (entry['session'], entry['clock'])
+                    self._offset += len(line)
+        except FileNotFoundError:
+            pass
+        self._signature = signature
+
+    def _clock(self):
+        return max([self.header['clock']] + [clock for _, clock in self.pending.values()])
+
+    def _append(self, changes, clock):
+        lines = ''.join(json.dumps({'project': project_name, 'start': start_time, 'session': session, 'clock': clock},
+                                   default=json_default) + '\n'
+                        for (project_name, start_time), session in changes.items()).encode()
+        with open(self.path, 'ab') as f:
+            if f.tell() != self._offset:
+                f.truncate(self._offset)
+            f.write(lines)
+        self._offset += len(lines)
+        self._signature = file_signature(self.path)
+        for key, session in changes.items():
+            self.pending[key] = (session, clock)
+
+    @contextmanager
+    def recording(self, store, record, all_sessions):
+        # Around the commit of record: writes down the sessions it changed,
+        # stamped with the next clock. The lock keeps a sync from applying
+        # other machines' changes between the commit and this.
+        if not self.enabled():
+            yield
+            return
+        with file_lock(self.path):
+            self._refresh()
+            keys = changed_keys(store.load(), record, all_sessions)
+            yield
+            if keys and self.header is not None:
+                self._append(current_sessions(store.load(), keys, all_sessions), self._clock() + 1)
+
+    @contextmanager
+    def recording_many(self, store, all_sessions):
+        # recording for a group commit: yields a list for the caller to fill
+        # with the changed_keys of the records that were applied, or None
+        # when nothing is written down yet
+        if not self.enabled():
+            yield None
+            return
+        with file_lock(self.path):
+            self._refresh()
+            keys = []
+            yield keys
+            if keys and self.header is not None:
+                self._append(current_sessions(store.load(), keys, all_sessions), self._clock() + 1)
+
+    def sync(self, store, all_sessions, server=None):
+        # Sends the changes made here, applies everyone else's; returns
+        # (changes sent, changes received)
+        with file_lock(self.path):
+            self._refresh()
+            if self.header is None:
+                # First sync: everything there is goes to the server
+                data = store.load()
+                self.header = {'machine': uuid.uuid4().hex[:12], 'server': SYNC_SERVER, 'cursor': 0, 'clock': 0}
+                self.pending = {}
+                self._write()
+                keys = [(project_name, session['start_time']) for project_name in data['projects']
+                        for session in all_sessions(project_name)]
+                self._append(current_sessions(data, keys, all_sessions), 1)
+            if server is not None:
+                self.header['server'] = server
+
+            client = SyncClient(self.header['server'])
+            try:
+                machine = self.header['machine']
+                clock = self._clock()
+                pending = list(self.pending.items())
+                for lo in range(0, len(pending), PUSH_BATCH):
+                    client.post('/push', {'machine': machine, 'changes': [
+                        {'project': project_name, 'start': start_time, 'session': session, 'clock': change_clock}
+                        for (project_name, start_time), (session, change_clock) in pending[lo:lo + PUSH_BATCH]]})
+
+                # The server only logs a change that beats the session's
+                # previous one, so a session's last entry is the version
+                # every machine ends up with
+                latest = {}
+                cursor = self.header['cursor']
+                while True:
+                    reply = client.post('/pull', {'since': cursor})
+                    for change in reply['changes']:
+                        clock = max(clock, change['clock'])
+                        latest[(change['project'], change['start'])] = change
+                    cursor = reply['seq']
+                    if not reply['more']:
+                        break
+            finally:
+                client.close()
+
+            # Applied unless it is this machine's own version, or one of
+            # this machine's changes beats it
+            received = {}
+            for key, change in latest.items():
+                if change['machine'] == machine:
+                    continue
+                own = self.pending.get(key)
+                if own is not None and (own[1], machine) > (change['clock'], change['machine']):
+                    continue
+                received[key] = change['session']
+
+            if received:
+                store.commit(merge_record(store.load(), received, all_sessions))
+            self.header['cursor'] = cursor
+            self.header['clock'] = clock
+            self.pending = {}
+            self._write()
+            return len(pending), len(received)
+
+    def _write(self):
+        # The header alone, swapped in like the data file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(self.header) + '\n')
+        os.replace(tmp_path, self.path)
+        self._offset = os.path.getsize(self.path)
+        self._signature = file_signature(self.path)
+
+def merge_record(data, received, all_sessions):
+    # The 'merge' record for {(project name, start time): session or None}.
+    # A change that reaches into a project's archived sessions is sent as
+    # the whole project, archive included, as only this side can read it.
+    changes = {}
+    for (project_name, start_time), session in received.items():
+        changes.setdefault(project_name, []).append([start_time, session])
+    whole = []
+    for project_name, project_changes in changes.items():
+        project = data['projects'].get(project_name)
+        if project is None or 'archived' not in project:
+            continue
+        sessions = project['sessions']
+        first = sessions[0]['start_time'] if len(sessions) else float('inf')
+        if min(start_time for start_time, _ in project_changes) < first:
+            merged = {session['start_time']: copy_session(session) for session in all_sessions(project_name)}
+            for start_time, session in project_changes:
+                merged[start_time] = session
+            changes[project_name] = [[start_time, session] for start_time, session in merged.items() if session is not None]
+            whole.append(project_name)
+    return {'op': 'merge', 'changes': changes, 'whole': whole}
+
+_sync_logs = {}
+
+def get_sync_log(data_path):
+    # One per data file for the whole process
+    sync_log = _sync_logs.get(data_path)
+    if sync_log is None:
+        sync_log = _sync_logs[data_path] = SyncLog(data_path)
+    return sync_log
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+# Sync server for timesheets on several machines (see sync.py). It keeps no
+# timesheet of its own, only the log of changed sessions each machine has
+# sent, and hands every machine the ones it hasn't seen yet.
+#   python sync_server.py [--host HOST] [--port PORT] [--log FILE]
+#
+#   POST /push  {"machine": id, "changes": [{"project", "start", "session", "clock"}, ...]}
+#               -> {"accepted": n, "seq": newest change}
+#   POST /pull  {"since": seq} -> {"changes": [...], "seq": n, "more": bool}
+#
+# A change is accepted if its stamp [clock, machine] is higher than that
+# of the session's latest change, so every machine ends up with the same
+# version of a session no matter in which order they sync. The log is one
+# JSON line per accepted change; lines overtaken by a later change of the
+# same session are dropped once they make up most of the file.
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+
+from server import BadRequest, TimesheetServer, error_body
+
+DEFAULT_PORT = 8766
+DEFAULT_LOG = os.path.join(Path.home(), 'timesheet-sync.log')
+
+# Changes returned by one pull
+MAX_PULL = 10000
+
+# Fewest overtaken lines worth rewriting the log for
+COMPACT_MIN = 10000
+
+def parse_changes(payload):
+    if not isinstance(payload, dict) or not isinstance(payload.get('machine'), str) \
+            or not isinstance(payload.get('changes'), list):
+        raise BadRequest("Expected {\"machine\": ID, \"changes\": [...]}")
+    for change in payload['changes']:
+        if not isinstance(change, dict) or not isinstance(change.get('project'), str) \
+                or not isinstance(change.get('start'), (int, float)) or not isinstance(change.get('clock'), int) \
+                or not isinstance(change.get('session'), (dict, type(None))):
+            raise BadRequest(f"Invalid change: {change!r}")
+    return payload['machine'], payload['changes']
+
+class ChangeLog:
+    def __init__(self, path):
+        self.path = path
+        self._read()
+
+    def _read(self):
+        self.seqs = array('q')  # seq of every line in the file, in order
+        self.offsets = array('q')  # where each line starts
+        self.size = 0
+        self.latest = {}  # {(project name, start time): (clock, machine, seq)}
+        self.seq = 0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Torn write from a crash; cut off on the next append
+                        break
+                    self._index(json.loads(line), len(line))
+        except FileNotFoundError:
+            pass
+
+    def _index(self, change, length):
+        self.seqs.append(change['seq'])
+        self.offsets.append(self.size)
+        self.size += length
+        self.latest[(change['project'], change['start'])] = (change['clock'], change['machine'], change['seq'])
+        self.seq = change['seq']
+
+    def push(self, machine, changes):
+        # Appends the changes that win over what the log has; returns how many
+        offset = self.size
+        lines = []
+        for change in changes:
+            key = (change['project'], change['start'])
+            latest = self.latest.get(key)
+            if latest is not None and (change['clock'], machine) <= latest[:2]:
+                continue
+            entry = {'seq': self.seq + 1, 'project': change['project'], 'start': change['start'],
+                     'session': change['session'], 'clock': change['clock'], 'machine': machine}
+            line = (json.dumps(entry) + '\n').encode()
+            lines.append(line)
+            self._index(entry, len(line))
+        if lines:
+            with open(self.path, 'ab') as f:
+                f.truncate(offset)
+                f.write(b''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            if len(self.seqs) - len(self.latest) > max(COMPACT_MIN, len(self.latest)):
+                self.compact()
+        return len(lines)
+
+    def pull(self, since):
+        # The JSON reply with up to MAX_PULL changes after seq since, cut
+        # straight out of the file
+        first = bisect_right(self.seqs, since)
+        last = min(first + MAX_PULL, len(self.seqs))
+        if first == last:
+            chunk = b''
+        else:
+            end = self.offsets[last] if last < len(self.seqs) else self.size
+            with open(self.path, 'rb') as f:
+                f.seek(self.offsets[first])
+                chunk = f.read(end - self.offsets[first])
+        seq = self.seqs[last - 1] if last > first else since
+        more = 'true' if last < len(self.seqs) else 'false'
+        return b'{"changes": [' + b','.join(chunk.splitlines()) + f'], "seq": {seq}, "more": {more}}}'.encode()
+
+    def compact(self):
+        # Keeps the newest line of every session, seqs unchanged, so the
+        # machines' cursors stay valid
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(self.path, 'rb') as source, open(tmp_path, 'wb') as target:
+            for line in source:
+                change = json.loads(line)
+                if self.latest[(change['project'], change['start'])][2] == change['seq']:
+                    target.write(line)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(tmp_path, self.path)
+        self._read()
+
+class SyncServer(TimesheetServer):
+    # The timesheet server's HTTP handling with the change log behind it.
+    # The log is only touched on the worker thread, one request at a time.
+    def __init__(self, log_path):
+        super().__init__()
+        self.log = ChangeLog(log_path)
+
+    async def dispatch(self, method, path, headers, body):
+        name = path.strip('/')
+        if method != 'POST':
+            return 405, error_body("Method Not Allowed", f"{method} is not supported."), ()
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            raise BadRequest("Body is not valid JSON")
+        if name == 'push':
+            accepted = await self.run(self.log.push, *parse_changes(payload))
+            return 200, {'accepted': accepted, 'seq': self.log.seq}, ()
+        if name == 'pull':
+            if not isinstance(payload, dict) or not isinstance(payload.get('since'), int):
+                raise BadRequest("Expected {\"since\": SEQ}")
+            return 200, await self.run(self.log.pull, payload['since']), ()
+        return 404, error_body("Not Found", f"No such resource: {path}"), ()
+
+async def serve(host, port, log_path):
+    server = SyncServer(log_path)
+    listener = await asyncio.start_server(server.handle_client, host, port)
+    print(f"Syncing through {log_path} on http://{host}:{port}", file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Timesheet sync server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--log', default=DEFAULT_LOG, help="change log file (default ~/timesheet-sync.log)")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.log))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+
+# The modules live at the top of the repository, next to this directory
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import core
+import store
+
+ENGINES = ['json', 'journal', 'sqlite', 'sharded']
+
+@pytest.fixture
+def data_file(tmp_path, monkeypatch):
+    # A fresh timesheet for core to work on: JSON engine, sessions as dicts,
+    # no archiving. Tests change store.STORAGE and friends before the first
+    # core call to try the others.
+    path = str(tmp_path / 'timesheet.json')
+    monkeypatch.setattr(core, 'DATA_FILE', path)
+    monkeypatch.setattr(store, 'STORAGE', 'json')
+    monkeypatch.setattr(store, 'SESSION_MODEL', 'dicts')
+    monkeypatch.setattr(store, 'ARCHIVE_DAYS', 0)
+    yield path
+    data_store = store._stores.pop(path, None)
+    if data_store is not None:
+        data_store.close()
@@ -0,0 +1,34 @@
+
+import json
+import os
+
+from aggregate import aggregate
+
+def timesheet(*seconds):
+    sessions = [{'start_time': 1000.0 * i, 'end_time': 1000.0 * i + lap, 'lap_time': lap,
+                 'pauses': [], 'total_paused_time': 0} for i, lap in enumerate(seconds)]
+    return {'projects': {'Alpha': {'status': 'Stopped', 'sessions': sessions, 'total_time': sum(seconds)}}}
+
+def test_files_are_summed_per_person_and_project(tmp_path):
+    (tmp_path / 'alice.json').write_text(json.dumps(timesheet(60, 120)))
+    (tmp_path / 'bob.json').write_text(json.dumps(timesheet(30)))
+    paths = sorted(str(path) for path in tmp_path.iterdir())
+
+    rows, errors = aggregate(paths, workers=1)
+    assert rows == [('alice', 'Alpha', 2, 180.0), ('bob', 'Alpha', 1, 30.0)]
+    assert errors == []
+
+def test_damaged_input_is_reported_and_left_alone(tmp_path):
+    raw = json.dumps(timesheet(60, 120)).encode()
+    damaged = tmp_path / 'alice.json'
+    damaged.write_bytes(raw[:len(raw) // 2])
+    (tmp_path / 'bob.json').write_text(json.dumps(timesheet(30)))
+    paths = sorted(str(path) for path in tmp_path.iterdir())
+
+    rows, errors = aggregate(paths, workers=1)
+    assert rows == [('bob', 'Alpha', 1, 30.0)]
+    assert [(os.path.basename(path), error.startswith("not valid JSON")) for path, error in errors] == [
+        ('alice.json', True)]
+    # Nothing is salvaged or copied out next to the inputs
+    assert sorted(os.listdir(tmp_path)) == ['alice.json', 'bob.json']
+    assert damaged.read_bytes() == raw[:len(raw) // 2]
@@ -0,0 +1,38 @@
+
+import time
+
+import pytest
+
+import core
+import store
+
+DAY = 24 * 3600
+
+@pytest.mark.parametrize('model', ['dicts', 'columns'])
+def test_stopping_an_old_session_keeps_it_in_the_data_file(data_file, monkeypatch, model):
+    monkeypatch.setattr(store, 'SESSION_MODEL', model)
+    monkeypatch.setattr(store, 'ARCHIVE_DAYS', 1)
+    started = time.time() - 2 * DAY
+    core.commit({'op': 'start', 'project': 'Old', 'time': started})
+
+    lap_time = core.stop_project('Old')
+
+    assert lap_time == pytest.approx(time.time() - started, abs=5)
+    project = core.load_data()['projects']['Old']
+    assert project['status'] == 'Stopped'
+    assert len(project['sessions']) == 1
+    assert project['sessions'][-1]['lap_time'] == lap_time
+
+def test_older_sessions_are_archived_but_not_the_newest(data_file, monkeypatch):
+    monkeypatch.setattr(store, 'ARCHIVE_DAYS', 1)
+    now = time.time()
+    for days_ago in (10, 8, 6):
+        core.commit({'op': 'start' if days_ago == 10 else 'resume', 'project': 'Old', 'time': now - days_ago * DAY})
+        core.commit({'op': 'stop', 'project': 'Old', 'time': now - days_ago * DAY + 3600})
+
+    project = core.load_data()['projects']['Old']
+    assert len(project['sessions']) == 1
+    assert sum(project['archived']['periods'].values()) == 2
+    assert [session['start_time'] for session in core.all_sessions('Old')] == \
+        [now - days_ago * DAY for days_ago in (10, 8, 6)]
+    assert project['total_time'] == pytest.approx(3 * 3600)
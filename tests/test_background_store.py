@@ -0,0 +1,127 @@
+
+import json
+import threading
+
+import pytest
+
+import background_store
+import core
+import store
+from conftest import ENGINES
+from history import History
+from store import DataStore
+from sync import SyncLog
+from transitions import TransitionError
+
+@pytest.fixture
+def background(data_file, monkeypatch):
+    # The writer waits for flush(), and never polls on its own
+    monkeypatch.setattr(background_store, 'FLUSH_DELAY', 60)
+    monkeypatch.setattr(background_store, 'POLL_INTERVAL', 60)
+    def start(engine):
+        monkeypatch.setattr(store, 'STORAGE', engine)
+        core.start_background_writer()
+        return core.get_data_store()
+    return start
+
+def test_sqlite_queries_run_as_sql_once_written(background, monkeypatch):
+    data_store = background('sqlite')
+    core.start_project('Alpha')
+
+    # Not written yet: only the copy in memory knows about it
+    assert [name for name, _ in core.report()] == ['Alpha']
+    data_store.flush()
+
+    def in_memory(self):
+        raise AssertionError("answered from memory")
+    monkeypatch.setattr(DataStore, 'project_totals', in_memory)
+    monkeypatch.setattr(DataStore, 'active_projects', in_memory)
+    assert [name for name, _ in core.report()] == ['Alpha']
+    assert [row[:2] for row in core.status()] == [('Alpha', 'Running')]
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_queries_agree_before_and_after_the_write(background, engine):
+    data_store = background(engine)
+    core.start_project('Alpha')
+    core.start_project('Beta')
+    core.stop_project('Alpha')
+    def answers():
+        return (core.report(), [row[:2] for row in core.status()], data_store.count_sessions('Alpha'),
+                data_store.session_page('Alpha', 0, 10), list(data_store.iter_export_rows()))
+    before = answers()
+    data_store.flush()
+    assert answers() == before
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_change_turned_down_by_the_disk_leaves_the_undo_history(background, data_file, engine):
+    data_store = background(engine)
+    core.start_project('Alpha')
+    data_store.flush()
+    core.start_project('Beta')
+    assert core.undo_labels() == ("Start 'Beta'", None)
+
+    # Another process starts the same project before ours is written
+    other = store.create_store(data_file, engine)
+    other.commit({'op': 'start', 'project': 'Beta', 'time': 5.0})
+    other.close()
+    data_store.flush()
+
+    assert [title for title, _ in data_store.take_errors()] == ["Project Exists"]
+    assert core.undo_labels() == ("Start 'Alpha'", None)
+    assert core.undo() == "Start 'Alpha'"
+    data_store.flush()
+    assert list(core.load_data()['projects']) == ['Beta']
+
+def test_history_and_sync_log_are_written_by_the_writer_thread(background, data_file, monkeypatch):
+    with open(data_file + '.sync', 'w') as f:
+        f.write(json.dumps({'machine': 'here', 'server': 'http://127.0.0.1:1', 'cursor': 0, 'clock': 0}) + '\n')
+    threads = []
+    def on_thread(name, func):
+        def wrapper(*args, **kwargs):
+            threads.append((name, threading.current_thread().name))
+            return func(*args, **kwargs)
+        return wrapper
+    monkeypatch.setattr(core, 'inverse_record', on_thread('inverse', core.inverse_record))
+    monkeypatch.setattr(History, 'push', on_thread('push', History.push))
+    monkeypatch.setattr(SyncLog, '_append', on_thread('sync', SyncLog._append))
+    data_store = background('json')
+
+    core.start_project('Alpha')
+    core.stop_project('Alpha')
+    assert threads == []
+    data_store.flush()
+
+    assert sorted(set(threads)) == [('inverse', 'timesheet-writer'), ('push', 'timesheet-writer'),
+                                    ('sync', 'timesheet-writer')]
+    assert core.undo_labels() == ("Stop 'Alpha'", None)
+    with open(data_file + '.sync') as f:
+        changes = [json.loads(line) for line in f][1:]
+    assert {change['project'] for change in changes} == {'Alpha'}
+    assert changes[-1]['session']['end_time'] is not None
+
+def test_undo_before_the_write_undoes_the_newest_change(background):
+    data_store = background('json')
+    core.start_project('Alpha')
+    core.start_project('Beta')
+    assert core.undo_labels() == ("Start 'Beta'", None)
+
+    assert core.undo() == "Start 'Beta'"
+    assert list(core.load_data()['projects']) == ['Alpha']
+    assert core.undo_labels() == ("Start 'Alpha'", "Start 'Beta'")
+    data_store.flush()
+    assert data_store.take_errors() == []
+
+def test_undo_turned_down_by_the_disk_keeps_its_entry(background, data_file):
+    data_store = background('json')
+    core.start_project('Alpha')
+    data_store.flush()
+    # Another process stops it, so the undo of the start no longer fits
+    other = store.create_store(data_file, 'json')
+    other.commit({'op': 'stop', 'project': 'Alpha', 'time': 5e9})
+
+    with pytest.raises(TransitionError) as info:
+        core.undo()
+    assert info.value.title == "Cannot Undo"
+    assert core.undo_labels() == ("Start 'Alpha'", None)
+    assert data_store.take_errors() == []
+    assert core.load_data()['projects']['Alpha']['status'] == 'Stopped'
@@ -0,0 +1,64 @@
+
+import json
+
+import pytest
+
+import core
+import store
+from binary_format import decode, encode, is_binary
+from transitions import copy_session
+
+def session(start, end=None, pauses=()):
+    paused = sum(pause_end - pause_start for pause_start, pause_end in pauses if pause_end is not None)
+    return {'start_time': start, 'end_time': end, 'lap_time': 0 if end is None else end - start - paused,
+            'pauses': [{'pause_start': pause_start, 'pause_end': pause_end} for pause_start, pause_end in pauses],
+            'total_paused_time': paused}
+
+DATA = {
+    'projects': {
+        'Alpha': {'status': 'Stopped', 'total_time': 450.5,
+                  'sessions': [session(1000.5, 1200.0), session(2000.0, 2400.0, [(2100.0, 2150.0)])]},
+        'Bêta ☕': {'status': 'Paused', 'total_time': 100.0,
+                   'sessions': [session(3000.0, None, [(3100.0, None)])]},
+        'Empty': {'status': 'Stopped', 'total_time': 0.0, 'sessions': [], 'archived': {'count': 3}},
+    },
+    'rollups': {'Alpha': {'2023-11-14': 450.5}, 'Bêta ☕': {'2023-11-15': 100.0}},
+    'archive_files': {'2023-10': '2023-10.json'},
+    'journal_seq': 7,
+}
+
+def test_encode_decode_round_trip():
+    raw = encode(DATA)
+    assert is_binary(raw)
+    assert decode(raw) == DATA
+    assert decode(raw) is not DATA
+
+def test_columnar_decode_holds_the_same_sessions():
+    raw = encode(DATA)
+    data = decode(raw, columnar=True)
+    for name, project in DATA['projects'].items():
+        assert [copy_session(s) for s in data['projects'][name]['sessions']] == project['sessions']
+    # Columns are written back as they are
+    assert encode(data) == raw
+
+def test_missing_rollups_stay_missing():
+    data = {key: value for key, value in DATA.items() if key != 'rollups'}
+    assert 'rollups' not in decode(encode(data))
+    assert decode(encode({'projects': {}})) == {'projects': {}}
+
+@pytest.mark.parametrize('damage', [lambda raw: raw[:3], lambda raw: raw[:len(raw) // 2],
+                                    lambda raw: raw[:4] + b'\xff\xff' + raw[6:]])
+def test_damaged_file_is_a_decode_error(damage):
+    # Truncated, or written by an unknown version
+    with pytest.raises(json.JSONDecodeError):
+        decode(damage(encode(DATA)))
+
+def test_binary_file_keeps_its_format_when_written(data_file):
+    store.write_data_file(data_file, DATA, 'binary')
+    assert store.load_data_file(data_file) == (DATA, 'binary')
+
+    core.commit({'op': 'resume', 'project': 'Alpha', 'time': 5000.0})
+    with open(data_file, 'rb') as f:
+        raw = f.read()
+    assert is_binary(raw)
+    assert decode(raw)['projects']['Alpha']['status'] == 'Running'
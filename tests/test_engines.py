@@ -0,0 +1,99 @@
+
+import datetime
+import threading
+
+import pytest
+
+import store
+from conftest import ENGINES
+
+DAY = 86400.0
+# Three days from noon on 2024-03-01 UTC, so the per-day totals span more
+# than one day wherever the tests run
+BASE = 1709294400.0
+
+RECORDS = [
+    {'op': 'start', 'project': 'Alpha', 'time': BASE},
+    {'op': 'start', 'project': 'Beta', 'time': BASE + 60},
+    {'op': 'pause', 'project': 'Alpha', 'time': BASE + 600},
+    {'op': 'resume_paused', 'project': 'Alpha', 'time': BASE + 900},
+    {'op': 'stop', 'project': 'Alpha', 'time': BASE + 3600},
+    {'op': 'resume', 'project': 'Alpha', 'time': BASE + DAY},
+    {'op': 'stop', 'project': 'Alpha', 'time': BASE + DAY + 1800},
+    {'op': 'rename', 'project': 'Beta', 'new_name': 'Gamma', 'time': BASE + DAY + 1900},
+    {'op': 'stop', 'project': 'Gamma', 'time': BASE + DAY + 2000},
+    {'op': 'start', 'project': 'Delta', 'time': BASE + 2 * DAY},
+    {'op': 'delete', 'project': 'Delta', 'time': BASE + 2 * DAY + 10},
+    {'op': 'start', 'project': 'Epsilon', 'time': BASE + 2 * DAY + 20},
+    {'op': 'pause', 'project': 'Epsilon', 'time': BASE + 2 * DAY + 30},
+]
+
+def answers(data_store):
+    first = datetime.date.fromtimestamp(BASE) - datetime.timedelta(days=1)
+    last = first + datetime.timedelta(days=4)
+    return {
+        'projects': {name: (project['status'], project['total_time'], [dict(session) for session in project['sessions']])
+                     for name, project in data_store.load()['projects'].items()},
+        'totals': sorted(map(tuple, data_store.project_totals())),
+        'active': sorted(map(tuple, data_store.active_projects())),
+        'count': data_store.count_sessions('Alpha'),
+        'page': [tuple(row) for row in data_store.session_page('Alpha', 0, 10, order='lap_time', descending=True)],
+        'days': sorted(map(tuple, data_store.day_totals(first, last))),
+        'all': data_store.count_all_sessions(),
+        'export': list(data_store.iter_export_rows()),
+    }
+
+def run(path, engine, batched):
+    data_store = store.create_store(path, engine)
+    if batched:
+        errors = data_store.commit_many(RECORDS + [{'op': 'stop', 'project': 'Nobody', 'time': BASE}])
+        assert [error.title for error in errors if error is not None] == ["Project Not Found"]
+    else:
+        for record in RECORDS:
+            data_store.commit(record)
+    return data_store
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_engines_give_the_same_answers(data_file, tmp_path, batched):
+    # data_file only for its settings: no archiving, so every engine keeps
+    # all the sessions in the data
+    results = {}
+    for engine in ENGINES:
+        (tmp_path / engine).mkdir()
+        path = str(tmp_path / engine / 'timesheet.json')
+        data_store = run(path, engine, batched)
+        results[engine] = answers(data_store)
+        data_store.close()
+        # And the same again from what was written
+        reopened = store.create_store(path, engine)
+        assert answers(reopened) == results[engine], engine
+        reopened.close()
+    for engine in ENGINES[1:]:
+        assert results[engine] == results['json'], engine
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_concurrent_writers_lose_nothing(data_file, engine):
+    # Every thread has a store of its own, as a separate process would
+    errors = []
+    def worker(number):
+        data_store = store.create_store(data_file, engine)
+        try:
+            for i in range(10):
+                data_store.commit({'op': 'start', 'project': f"P{number}-{i}", 'time': BASE + i})
+                data_store.commit({'op': 'stop', 'project': f"P{number}-{i}", 'time': BASE + i + 60})
+        except Exception as e:
+            errors.append(e)
+        finally:
+            data_store.close()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    data_store = store.create_store(data_file, engine)
+    projects = data_store.load()['projects']
+    assert sorted(projects) == sorted(f"P{number}-{i}" for number in range(4) for i in range(10))
+    assert all(project['status'] == 'Stopped' and project['total_time'] == 60 for project in projects.values())
+    data_store.close()
@@ -0,0 +1,43 @@
+
+import pytest
+
+import core
+from remote_store import RemoteStore
+from store import default_data, set_store
+from transitions import TransitionError, apply_record
+
+class OfflineRemoteStore(RemoteStore):
+    # Keeps the data in memory instead of asking a server
+    def load(self):
+        if self._data is None:
+            self._data = default_data()
+        return self._data
+
+    def commit(self, record):
+        apply_record(self.load(), record)
+        return self._data
+
+def test_undo_and_redo_round_trip(data_file):
+    core.start_project('Alpha')
+    core.stop_project('Alpha')
+    assert core.undo_labels() == ("Stop 'Alpha'", None)
+
+    assert core.undo() == "Stop 'Alpha'"
+    assert core.load_data()['projects']['Alpha']['status'] == 'Running'
+    assert core.undo_labels() == ("Start 'Alpha'", "Stop 'Alpha'")
+    assert core.redo() == "Stop 'Alpha'"
+    assert core.load_data()['projects']['Alpha']['status'] == 'Stopped'
+
+def test_remote_data_has_no_undo(data_file):
+    # A local change first, so there is a history the remote store must not use
+    core.start_project('Local')
+    set_store(data_file, OfflineRemoteStore('http://127.0.0.1:1'))
+
+    core.start_project('Shared')
+    assert core.undo_labels() == (None, None)
+    with pytest.raises(TransitionError) as info:
+        core.undo()
+    assert info.value.title == "Undo Not Possible"
+    with pytest.raises(TransitionError):
+        core.redo()
+    assert list(core.load_data()['projects']) == ['Shared']
@@ -0,0 +1,71 @@
+
+import json
+
+import pytest
+
+import core
+import importer
+import store
+from conftest import ENGINES
+
+T = 1700000000.0
+
+HISTORY = [
+    {'op': 'start', 'project': 'Alpha', 'time': T},
+    {'op': 'pause', 'project': 'Alpha', 'time': T + 600},
+    {'op': 'resume_paused', 'project': 'Alpha', 'time': T + 900},
+    {'op': 'stop', 'project': 'Alpha', 'time': T + 3600},
+    {'op': 'start', 'project': 'Beta', 'time': T + 4000},
+    {'op': 'stop', 'project': 'Beta', 'time': T + 4500},
+    {'op': 'resume', 'project': 'Alpha', 'time': T + 5000},
+    {'op': 'stop', 'project': 'Alpha', 'time': T + 5100},
+]
+
+def sessions():
+    return {name: [(s['start_time'], s['end_time'], s['lap_time'],
+                    [(p['pause_start'], p['pause_end']) for p in s['pauses']])
+                   for s in core.get_data_store().project_sessions(name)]
+            for name in core.load_data()['projects']}
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_export_imports_back_unchanged_and_only_once(data_file, tmp_path, monkeypatch, engine):
+    monkeypatch.setattr(store, 'STORAGE', engine)
+    for record in HISTORY:
+        core.commit(record)
+    before = sessions()
+    export = str(tmp_path / 'export.csv')
+    core.export_report_to_csv(export)
+    core.clear_all_data()
+
+    result = importer.import_files([export])
+    assert (result.read, result.imported, result.projects, result.errors) == (3, 3, 2, [])
+    assert sessions() == before
+    assert core.load_data()['projects']['Alpha']['total_time'] == 3300 + 100
+
+    again = importer.import_files([export])
+    assert (again.imported, again.duplicates, again.overlaps) == (0, 3, 0)
+    assert sessions() == before
+
+def test_overlapping_and_broken_rows_are_skipped(data_file, tmp_path):
+    core.commit({'op': 'start', 'project': 'Alpha', 'time': T})
+    core.commit({'op': 'stop', 'project': 'Alpha', 'time': T + 3600})
+    log = tmp_path / 'log.jsonl'
+    log.write_text('\n'.join(json.dumps(entry) for entry in [
+        {'project': 'Alpha', 'start': T + 1800, 'end': T + 7200},
+        {'project': 'Alpha', 'start': T + 7200, 'end': T + 9000, 'pauses': [[T + 7500, T + 7800]]},
+        {'project': 'Beta', 'start': T + 100, 'end': T},
+        {'project': 'Beta', 'start': T + 100},
+        {'op': 'start', 'project': 'Gamma', 'time': T + 200},
+        {'op': 'stop', 'project': 'Gamma', 'time': T + 500},
+    ]) + '\n')
+
+    dry = importer.import_files([str(log)], dry_run=True)
+    assert (dry.imported, dry.overlaps, dry.open_sessions, len(dry.errors)) == (2, 1, 1, 1)
+    assert list(core.load_data()['projects']) == ['Alpha']
+
+    result = importer.import_files([str(log)])
+    assert [(path, line) for path, line, _ in result.errors] == [(str(log), 3)]
+    projects = core.load_data()['projects']
+    assert [s['start_time'] for s in projects['Alpha']['sessions']] == [T, T + 7200]
+    assert projects['Alpha']['total_time'] == 3600 + 1500
+    assert projects['Gamma']['total_time'] == 300
@@ -0,0 +1,58 @@
+
+import pytest
+
+import core
+import store
+from conftest import ENGINES
+from project_index import ProjectIndex
+
+NAMES = ['alpha', 'Beta', 'ALPINE', 'Gamma ray', 'Straße', 'Zeta alpha']
+
+def test_search_ignores_case_and_keeps_name_order():
+    index = ProjectIndex(NAMES)
+    assert index.search() == ['alpha', 'ALPINE', 'Beta', 'Gamma ray', 'Straße', 'Zeta alpha']
+    assert index.search('ALP') == ['alpha', 'ALPINE', 'Zeta alpha']
+    assert index.search('a r') == ['Gamma ray']
+    assert index.search('STRASSE') == ['Straße']
+    assert index.search('nothing') == []
+
+def test_typing_narrows_to_the_same_matches_as_a_fresh_search():
+    names = [f"Project {i}" for i in range(500)] + NAMES
+    index = ProjectIndex(names)
+    for query in ['p', 'pr', 'project 1', 'project 12', 'project 1', 'project 123', 'al', 'alp']:
+        assert index.search(query) == ProjectIndex(names).search(query)
+
+def test_changes_clear_remembered_matches():
+    index = ProjectIndex(NAMES)
+    assert index.search('alp') == ['alpha', 'ALPINE', 'Zeta alpha']
+    assert index.apply([{'op': 'start', 'project': 'Alpaca', 'time': 0.0},
+                        {'op': 'rename', 'project': 'alpha', 'new_name': 'Omega'},
+                        {'op': 'delete', 'project': 'ALPINE'},
+                        {'op': 'stop', 'project': 'Beta', 'time': 0.0}])
+    assert index.search('alp') == ['Alpaca', 'Zeta alpha']
+    assert index.search('a') == ['Alpaca', 'Beta', 'Gamma ray', 'Omega', 'Straße', 'Zeta alpha']
+    # A record it cannot follow asks for a new index
+    assert not index.apply([{'op': 'merge', 'changes': {}, 'time': 0.0}])
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_find_projects_follows_every_change(data_file, monkeypatch, engine):
+    monkeypatch.setattr(store, 'STORAGE', engine)
+    for i, name in enumerate(['Alpha', 'beta', 'Alpine']):
+        core.commit({'op': 'start', 'project': name, 'time': 1000.0 + i})
+    assert core.find_projects('AL') == ['Alpha', 'Alpine']
+    index = core.get_data_store().project_index()
+
+    core.commit({'op': 'stop', 'project': 'Alpha', 'time': 2000.0})
+    core.commit({'op': 'rename', 'project': 'beta', 'new_name': 'Palace'})
+    assert core.find_projects('al') == ['Alpha', 'Alpine', 'Palace']
+    # Moved along with our own commits, not built again
+    assert core.get_data_store().project_index() is index
+    assert core.find_projects('', sort='total', descending=True)[0] == 'Alpha'
+    assert core.find_projects('', sort='status') == ['Alpine', 'Palace', 'Alpha']
+    assert core.find_projects('al', descending=True) == ['Palace', 'Alpine', 'Alpha']
+
+    # Another process's change means a new index
+    other = store.create_store(data_file, engine)
+    other.commit({'op': 'delete', 'project': 'Alpine'})
+    other.close()
+    assert core.find_projects('al') == ['Alpha', 'Palace']
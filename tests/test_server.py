@@ -0,0 +1,98 @@
+
+import asyncio
+import http.client
+import json
+import threading
+
+import pytest
+
+import core
+from server import TimesheetServer
+
+@pytest.fixture
+def server(data_file):
+    # A timesheet server for data_file on a free port, on its own event
+    # loop thread; yields a function making one request to it
+    loop = asyncio.new_event_loop()
+    async def start():
+        timesheet_server = TimesheetServer()
+        asyncio.create_task(timesheet_server.writer())
+        return await asyncio.start_server(timesheet_server.handle_client, '127.0.0.1', 0)
+    listener = loop.run_until_complete(start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    port = listener.sockets[0].getsockname()[1]
+
+    def request(method, path, payload=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        try:
+            body = None if payload is None else json.dumps(payload).encode()
+            conn.request(method, path, body, {'Content-Type': 'application/json'} if body else {})
+            response = conn.getresponse()
+            raw = response.read()
+            return response.status, json.loads(raw) if raw else None
+        finally:
+            conn.close()
+    yield request
+
+    async def stop():
+        listener.close()
+        # The writer and any connection handler still finishing up
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    asyncio.run_coroutine_threadsafe(stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+def test_session_operations_and_queries(server):
+    assert server('POST', '/start', {'project': 'Alpha', 'time': 1000.0}) == (200, {'ok': True})
+    status, body = server('GET', '/status')
+    assert status == 200 and [project['name'] for project in body['projects']] == ['Alpha']
+    assert server('POST', '/stop', {'project': 'Alpha', 'time': 1100.0}) == (200, {'ok': True})
+    assert server('GET', '/report') == (200, {'projects': [{'name': 'Alpha', 'total_time': 100.0}]})
+
+    status, body = server('POST', '/stop', {'project': 'Alpha', 'time': 1200.0})
+    assert status == 409 and body['error']['title'] == "Project Not Active"
+
+def test_records_answer_each_record(server):
+    status, body = server('POST', '/records', {'records': [
+        {'op': 'start', 'project': 'Alpha', 'time': 1000.0},
+        {'op': 'start', 'project': 'Alpha', 'time': 1001.0},
+        {'op': 'rename', 'project': 'Alpha', 'new_name': 'Beta'},
+    ]})
+    assert status == 200
+    assert [result and result['title'] for result in body['results']] == [None, "Project Exists", None]
+    assert list(core.load_data()['projects']) == ['Beta']
+
+@pytest.mark.parametrize('path, payload', [
+    ('/start', {'project': 'Alpha', 'time': 'abc'}),
+    ('/start', {'project': 'Alpha', 'time': True}),
+    ('/start', {'project': 7}),
+    ('/records', {'records': [{'op': 'start', 'project': 'Alpha'}]}),
+    ('/records', {'records': [{'op': 'stop', 'time': 1000.0}]}),
+    ('/records', {'records': [{'op': 'rename', 'project': 'Alpha', 'new_name': None}]}),
+    ('/records', {'records': [{'op': 'merge'}]}),
+    ('/records', {'records': [{'op': 'merge', 'changes': {'Alpha': []}}]}),
+    ('/records', {'records': [{'op': 'merge', 'changes': {'Alpha': [[1000.0, {'start_time': 'x'}]]}}]}),
+    ('/records', {'records': [{'op': 'import', 'sessions': {'Alpha': [
+        {'start_time': 1000.0, 'end_time': None, 'lap_time': 0, 'pauses': []}]}}]}),
+    ('/records', {'records': [{'op': 'restore', 'projects': {'Alpha': {'status': 'Stopped'}}}]}),
+    ('/records', {'records': [{'op': 'revert', 'project': 'Alpha', 'expect': ['Running'], 'keep': 0,
+                              'sessions': [], 'status': None}]}),
+    ('/records', {'records': [{'op': 'start', 'project': 'Alpha', 'time': 1000.0}, {'op': 'nope'}]}),
+])
+def test_malformed_records_are_refused_and_not_saved(server, path, payload):
+    status, body = server('POST', path, payload)
+    assert status == 400 and body['error']['title'] == "Bad Request"
+    assert core.load_data()['projects'] == {}
+    # And the server still answers
+    assert server('GET', '/status') == (200, {'projects': []})
+
+def test_well_formed_merge_is_accepted(server):
+    session = {'start_time': 1000.0, 'end_time': 1100.0, 'lap_time': 100.0, 'pauses': [], 'total_paused_time': 0}
+    status, body = server('POST', '/records', {'records': [{'op': 'merge', 'changes': {'Alpha': [[1000.0, session]]}}]})
+    assert (status, body) == (200, {'results': [None]})
+    assert core.load_data()['projects']['Alpha']['total_time'] == 100.0
@@ -0,0 +1,86 @@
+
+import os
+import json
+
+import pytest
+
+import sharded_store
+from sharded_store import ShardedStore
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'timesheet.json')
+
+@pytest.fixture
+def written(monkeypatch):
+    # Names of the files each write rewrites
+    names = []
+    real_write_data_file = sharded_store.write_data_file
+    def write_data_file(path, data, file_format='json'):
+        names.append(os.path.basename(path))
+        real_write_data_file(path, data, file_format)
+    monkeypatch.setattr(sharded_store, 'write_data_file', write_data_file)
+    return names
+
+def started(path, *names):
+    data_store = ShardedStore(path)
+    for i, name in enumerate(names):
+        data_store.commit({'op': 'start', 'project': name, 'time': 1000.0 + i})
+    return data_store
+
+def test_transition_rewrites_only_its_project(path, written):
+    data_store = started(path, 'Alpha', 'Beta', 'Gamma')
+    shards = {name: entry['shard'] for name, entry in data_store._manifest['projects'].items()}
+    written.clear()
+
+    data_store.commit({'op': 'stop', 'project': 'Beta', 'time': 2000.0})
+    assert written == [shards['Beta'], 'manifest.json']
+    written.clear()
+    data_store.commit({'op': 'rename', 'project': 'Beta', 'new_name': 'Delta'})
+    assert written == ['manifest.json']
+    written.clear()
+    data_store.commit({'op': 'delete', 'project': 'Alpha'})
+    assert written == ['manifest.json']
+    assert not os.path.exists(data_store.shard_path(shards['Alpha']))
+
+    reopened = ShardedStore(path).load()
+    assert list(reopened['projects']) == ['Gamma', 'Delta']
+    assert reopened['projects']['Delta']['sessions'][0]['end_time'] == 2000.0
+
+def test_shards_are_read_when_their_sessions_are_needed(path, monkeypatch):
+    started(path, 'Alpha', 'Beta').commit({'op': 'stop', 'project': 'Alpha', 'time': 2000.0})
+    reads = []
+    real_read_shard = ShardedStore.read_shard
+    def read_shard(self, project):
+        reads.append(project.shard)
+        real_read_shard(self, project)
+    monkeypatch.setattr(ShardedStore, 'read_shard', read_shard)
+
+    data_store = ShardedStore(path)
+    projects = data_store.load()['projects']
+    assert [(name, project['status']) for name, project in projects.items()] == [('Alpha', 'Stopped'), ('Beta', 'Running')]
+    assert reads == []
+    assert list(data_store.open_sessions()) == ['Beta']
+    assert reads == [data_store._manifest['projects']['Beta']['shard']]
+    assert projects['Alpha']['total_time'] == 1000.0
+
+def test_other_process_changes_are_seen(path):
+    ours = started(path, 'Alpha')
+    theirs = ShardedStore(path)
+    theirs.commit({'op': 'stop', 'project': 'Alpha', 'time': 2000.0})
+    theirs.commit({'op': 'start', 'project': 'Beta', 'time': 2001.0})
+
+    ours.commit({'op': 'start', 'project': 'Gamma', 'time': 2002.0})
+    projects = ours.load()['projects']
+    assert [(name, project['status']) for name, project in projects.items()] == [
+        ('Alpha', 'Stopped'), ('Beta', 'Running'), ('Gamma', 'Running')]
+    assert len({entry['shard'] for entry in ours._manifest['projects'].values()}) == 3
+
+def test_json_history_is_brought_along(path):
+    data = {'projects': {'Alpha': {'status': 'Stopped', 'total_time': 100.0, 'sessions': [
+        {'start_time': 1000.0, 'end_time': 1100.0, 'lap_time': 100.0, 'pauses': [], 'total_paused_time': 0}]}}}
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+    projects = ShardedStore(path).load()['projects']
+    assert {name: dict(project) for name, project in projects.items()} == data['projects']
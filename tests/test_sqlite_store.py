@@ -0,0 +1,94 @@
+
+import datetime
+import json
+import sqlite3
+
+import pytest
+
+from sqlite_store import SQLiteStore
+from stream_loader import DamagedDataFile
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'timesheet.db')
+
+@pytest.fixture
+def rollup_writes(monkeypatch):
+    calls = []
+    real_write_rollups = SQLiteStore._write_rollups
+    def write_rollups(self, data):
+        calls.append(self.path)
+        real_write_rollups(self, data)
+    monkeypatch.setattr(SQLiteStore, '_write_rollups', write_rollups)
+    return calls
+
+def test_open_sessions_alone_do_not_rebuild_rollups(db_path, rollup_writes):
+    data_store = SQLiteStore(db_path)
+    data_store.commit({'op': 'start', 'project': 'Alpha', 'time': 1000.0})
+    data_store.close()
+    rollup_writes.clear()
+    # No closed session, so no rollups either: nothing to migrate
+    for _ in range(2):
+        SQLiteStore(db_path).close()
+    assert rollup_writes == []
+
+def test_database_from_before_rollups_is_migrated_once(db_path, rollup_writes):
+    day = datetime.date.fromtimestamp(1000.0)
+    data_store = SQLiteStore(db_path)
+    data_store.commit({'op': 'start', 'project': 'Alpha', 'time': 1000.0})
+    data_store.commit({'op': 'stop', 'project': 'Alpha', 'time': 1100.0})
+    data_store.close()
+    # As an older version left it: no rollups, no schema version
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('DELETE FROM rollups')
+        conn.execute('PRAGMA user_version = 0')
+    conn.close()
+    rollup_writes.clear()
+
+    data_store = SQLiteStore(db_path)
+    assert data_store.day_totals(day, day) == [('Alpha', day.isoformat(), 100.0)]
+    data_store.close()
+    SQLiteStore(db_path).close()
+    assert len(rollup_writes) == 1
+
+@pytest.fixture
+def json_file(tmp_path):
+    path = tmp_path / 'timesheet.json'
+    session = {'start_time': 1000.0, 'end_time': 1100.0, 'lap_time': 100.0, 'pauses': [], 'total_paused_time': 0}
+    path.write_text(json.dumps({'projects': {
+        'Alpha': {'status': 'Stopped', 'sessions': [session], 'total_time': 100.0},
+        'Beta': {'status': 'Stopped', 'sessions': [dict(session, start_time=2000.0, end_time=2100.0)], 'total_time': 100.0},
+    }}))
+    return str(path)
+
+def test_interrupted_import_runs_again(db_path, json_file, monkeypatch):
+    real_insert_sessions = SQLiteStore._insert_sessions
+    def insert_sessions(self, project_id, sessions):
+        if project_id > 1:
+            raise KeyboardInterrupt
+        real_insert_sessions(self, project_id, sessions)
+    monkeypatch.setattr(SQLiteStore, '_insert_sessions', insert_sessions)
+    with pytest.raises(KeyboardInterrupt):
+        SQLiteStore(db_path, json_path=json_file)
+    monkeypatch.undo()
+
+    data_store = SQLiteStore(db_path, json_path=json_file)
+    assert sorted(data_store.load()['projects']) == ['Alpha', 'Beta']
+    data_store.close()
+
+def test_damaged_json_is_imported_as_far_as_it_reads(db_path, json_file):
+    with open(json_file, 'rb+') as f:
+        raw = f.read()
+        f.truncate(raw.index(b'"Beta"') + 3)
+
+    data_store = SQLiteStore(db_path, json_path=json_file)
+    with pytest.raises(DamagedDataFile) as info:
+        data_store.load()
+    assert list(info.value.data['projects']) == ['Alpha']
+    # Reported once; the recovered part is what the database holds now
+    assert list(data_store.load()['projects']) == ['Alpha']
+    data_store.close()
+    data_store = SQLiteStore(db_path, json_path=json_file)
+    assert list(data_store.load()['projects']) == ['Alpha']
+    data_store.close()
@@ -0,0 +1,148 @@
+
+import os
+import json
+import sqlite3
+
+import pytest
+
+import background_store
+import core
+import store
+import transitions
+from conftest import ENGINES
+
+def fail_next_write(monkeypatch, engine='json'):
+    if engine == 'sqlite':
+        # SQLite syncs by itself; fail its next statement instead
+        from sqlite_store import SQLiteStore
+        real_write_record = SQLiteStore._write_record
+        def write_record(self, record, data):
+            monkeypatch.setattr(SQLiteStore, '_write_record', real_write_record)
+            raise sqlite3.OperationalError("disk I/O error")
+        monkeypatch.setattr(SQLiteStore, '_write_record', write_record)
+    else:
+        fail_once(monkeypatch)
+
+def fail_once(monkeypatch):
+    # The next fsync raises, as a full or vanished disk would
+    real_fsync = os.fsync
+    calls = []
+    def fsync(fd):
+        calls.append(fd)
+        if len(calls) == 1:
+            raise OSError(28, "No space left on device")
+        return real_fsync(fd)
+    monkeypatch.setattr(os, 'fsync', fsync)
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_failed_write_leaves_no_change_in_memory(data_file, monkeypatch, engine):
+    monkeypatch.setattr(store, 'STORAGE', engine)
+    core.commit({'op': 'start', 'project': 'Kept', 'time': 1000.0})
+    fail_next_write(monkeypatch, engine)
+
+    with pytest.raises((OSError, sqlite3.Error)):
+        core.commit({'op': 'start', 'project': 'Lost', 'time': 2000.0})
+
+    assert list(core.load_data()['projects']) == ['Kept']
+    # Trying again works instead of being refused as a duplicate
+    core.commit({'op': 'start', 'project': 'Lost', 'time': 2000.0})
+    assert sorted(store.create_store(data_file, engine).load()['projects']) == ['Kept', 'Lost']
+
+def test_failed_group_commit_leaves_no_change_in_memory(data_file, monkeypatch):
+    data_store = core.get_data_store()
+    fail_once(monkeypatch)
+    with pytest.raises(OSError):
+        data_store.commit_many([{'op': 'start', 'project': 'Lost', 'time': 2000.0}])
+    assert core.load_data()['projects'] == {}
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_background_writer_retries_a_failed_write(data_file, monkeypatch, engine):
+    monkeypatch.setattr(store, 'STORAGE', engine)
+    monkeypatch.setattr(background_store, 'FLUSH_DELAY', 0.01)
+    monkeypatch.setattr(background_store, 'POLL_INTERVAL', 0.05)
+    core.start_background_writer()
+    fail_next_write(monkeypatch, engine)
+
+    core.start_project('Saved')
+    core.get_data_store().flush()
+
+    errors = core.get_data_store().take_errors()
+    assert [title for title, _ in errors] == ["Save Failed"]
+    assert list(core.load_data()['projects']) == ['Saved']
+    assert list(store.create_store(data_file, engine).load()['projects']) == ['Saved']
+
+@pytest.fixture
+def half_applied(monkeypatch):
+    # 'stop' changes the data and then fails, as a bug in a transition would
+    def stop(data, record):
+        data['projects'][record['project']]['status'] = 'Broken'
+        raise RuntimeError("bug")
+    monkeypatch.setitem(transitions.APPLY, 'stop', stop)
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_record_failing_part_way_leaves_no_change_in_memory(data_file, monkeypatch, engine, half_applied):
+    monkeypatch.setattr(store, 'STORAGE', engine)
+    core.commit({'op': 'start', 'project': 'Kept', 'time': 1000.0})
+
+    with pytest.raises(RuntimeError):
+        core.get_data_store().commit_many([{'op': 'start', 'project': 'Lost', 'time': 1001.0},
+                                           {'op': 'stop', 'project': 'Kept', 'time': 1002.0}])
+    with pytest.raises(RuntimeError):
+        core.commit({'op': 'stop', 'project': 'Kept', 'time': 1003.0})
+
+    projects = core.load_data()['projects']
+    assert list(projects) == ['Kept'] and projects['Kept']['status'] == 'Running'
+
+def test_background_copy_is_read_again_after_a_failing_record(data_file, monkeypatch, half_applied):
+    monkeypatch.setattr(background_store, 'FLUSH_DELAY', 60)
+    monkeypatch.setattr(background_store, 'POLL_INTERVAL', 60)
+    core.start_background_writer()
+    core.commit({'op': 'start', 'project': 'Kept', 'time': 1000.0})
+    core.get_data_store().flush()
+    core.commit({'op': 'start', 'project': 'Queued', 'time': 1001.0})
+
+    with pytest.raises(RuntimeError):
+        core.commit({'op': 'stop', 'project': 'Kept', 'time': 1002.0})
+
+    projects = core.load_data()['projects']
+    assert list(projects) == ['Kept', 'Queued'] and projects['Kept']['status'] == 'Running'
+    core.get_data_store().flush()
+    assert list(store.create_store(data_file, 'json').load()['projects']) == ['Kept', 'Queued']
+
+@pytest.mark.parametrize('engine', ['json', 'journal'])
+def test_empty_data_file_starts_a_new_timesheet(data_file, monkeypatch, engine):
+    monkeypatch.setattr(store, 'STORAGE', engine)
+    open(data_file, 'w').close()
+    errors = []
+    monkeypatch.setattr(core, 'on_data_error', errors.append)
+
+    assert core.load_data()['projects'] == {}
+    core.start_project('Alpha')
+    assert errors == []
+    assert list(store.create_store(data_file, engine).load()['projects']) == ['Alpha']
+    assert not [name for name in os.listdir(os.path.dirname(data_file)) if '.damaged-' in name]
+
+def test_empty_shard_manifest_is_rebuilt_only_when_shards_exist(data_file):
+    sharded = store.create_store(data_file, 'sharded')
+    sharded.commit({'op': 'start', 'project': 'Alpha', 'time': 1000.0})
+    sharded.close()
+    empty = store.create_store(data_file + '.new', 'sharded')
+    os.makedirs(empty.directory)
+    for path in (sharded.manifest_path, empty.manifest_path):
+        open(path, 'w').close()
+
+    assert empty.load()['projects'] == {}
+    with pytest.raises(json.JSONDecodeError) as info:
+        store.create_store(data_file, 'sharded').load()
+    assert "rebuilt from the 1 project file(s)" in str(info.value)
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_unknown_project_has_no_sessions(data_file, monkeypatch, engine):
+    monkeypatch.setattr(store, 'STORAGE', engine)
+    core.start_project('Alpha')
+    data_store = core.get_data_store()
+
+    assert data_store.count_sessions('Missing') is None
+    assert data_store.session_page('Missing', 0, 10) == []
+    assert data_store.session_page('Missing', 0, 10, order='lap_time', descending=True, start=0, end=1e12) == []
+    assert len(data_store.session_page('Alpha', 0, 10)) == 1
@@ -0,0 +1,119 @@
+
+import os
+import json
+
+import pytest
+
+from stream_loader import DamagedDataFile, load_json_stream
+
+def session(start, end=None):
+    return {'start_time': start, 'end_time': end, 'lap_time': 0 if end is None else end - start,
+            'pauses': [], 'total_paused_time': 0}
+
+def project(*sessions):
+    return {'status': 'Stopped', 'sessions': list(sessions),
+            'total_time': sum(session['lap_time'] for session in sessions)}
+
+DATA = {
+    'projects': {
+        'Alpha': project(session(1000, 1100), session(2000, 2300)),
+        'Beta': project(session(3000, 3050), session(4000, 4400), session(5000, 5600)),
+        'Gamma': project(session(6000, 6700)),
+    },
+    'rollups': {},
+}
+
+@pytest.fixture
+def write(tmp_path):
+    path = tmp_path / 'timesheet.json'
+    def write(raw):
+        path.write_bytes(raw)
+        return str(path)
+    return write
+
+def salvage(path):
+    with pytest.raises(DamagedDataFile) as info:
+        load_json_stream(path)
+    return info.value
+
+def test_sound_file_loads_whole(write):
+    assert load_json_stream(write(json.dumps(DATA).encode())) == DATA
+
+def test_truncated_file_keeps_what_was_written(write):
+    raw = json.dumps(DATA).encode()
+    cut = raw.index(b'5000')
+    damage = salvage(write(raw[:cut]))
+
+    projects = damage.data['projects']
+    assert list(projects) == ['Alpha', 'Beta']
+    assert projects['Alpha'] == DATA['projects']['Alpha']
+    assert [s['start_time'] for s in projects['Beta']['sessions']] == [3000, 4000]
+    assert projects['Beta']['total_time'] == 450
+    assert 'rollups' not in damage.data
+    with open(damage.quarantine_path, 'rb') as f:
+        assert raw[:cut].endswith(f.read())
+
+def test_byte_flip_costs_only_the_rest_of_one_project(write):
+    raw = bytearray(json.dumps(DATA).encode())
+    flip = raw.index(b'4400')
+    raw[flip] = ord('x')
+    damage = salvage(write(bytes(raw)))
+
+    projects = damage.data['projects']
+    # Reading picks up again at the next project
+    assert list(projects) == ['Alpha', 'Beta', 'Gamma']
+    assert projects['Gamma'] == DATA['projects']['Gamma']
+    assert [s['start_time'] for s in projects['Beta']['sessions']] == [3000]
+    # Read, but the per-day totals no longer match the projects
+    assert 'rollups' not in damage.data
+    assert "damaged at bytes" in damage.report and "'Beta' only in part" in damage.report
+    with open(damage.quarantine_path, 'rb') as f:
+        skipped = f.read()
+    assert b'x400' in skipped and b'Gamma' not in skipped
+
+def test_damaged_project_name_is_skipped(write):
+    raw = json.dumps(DATA).encode().replace(b'"Beta"', b'"Be\x00ta', 1)
+    damage = salvage(write(raw))
+    assert list(damage.data['projects']) == ['Alpha', 'Gamma']
+
+def test_unsound_sessions_are_dropped_not_filled_in(write):
+    raw = bytearray(json.dumps(DATA).encode())
+    # The damage hides behind a session that reads but is wrong
+    backwards = json.dumps(session(3500, 3400)).encode()
+    incomplete = b'{"start_time": 3600, "end_time": 3700}'
+    at = raw.index(b'{"start_time": 4000')
+    raw[at:at] = backwards + b', ' + incomplete + b', '
+    flip = raw.index(b'5600')
+    raw[flip] = ord('x')
+    damage = salvage(write(bytes(raw)))
+
+    beta = damage.data['projects']['Beta']
+    assert [s['start_time'] for s in beta['sessions']] == [3000, 4000]
+    assert beta['status'] == 'Stopped'
+    assert beta['total_time'] == 450
+
+def test_open_last_session_stays_running(write):
+    data = {'projects': {'Alpha': project(session(1000, 1100), session(2000)), 'Beta': project(session(3000, 3100))}}
+    raw = bytearray(json.dumps(data).encode())
+    raw[raw.index(b'"total_time"')] = ord('{')
+    damage = salvage(write(bytes(raw)))
+
+    assert damage.data['projects']['Alpha']['status'] == 'Running'
+    assert damage.data['projects']['Beta'] == data['projects']['Beta']
+
+@pytest.mark.parametrize('raw', [b'', b' \n\t\r\n'])
+def test_empty_file_is_no_data_not_damage(write, raw):
+    path = write(raw)
+    assert load_json_stream(path) == {'projects': {}}
+    assert os.listdir(os.path.dirname(path)) == ['timesheet.json']
+
+def test_file_stopping_early_reports_without_a_copy(write):
+    raw = json.dumps(DATA).encode()
+    # Cut right after a whole project: nothing that is there is unreadable
+    path = write(raw[:raw.index(b', "Gamma"')])
+    damage = salvage(path)
+
+    assert list(damage.data['projects']) == ['Alpha', 'Beta']
+    assert damage.quarantine_path is None
+    assert "copied" not in damage.report
+    assert os.listdir(os.path.dirname(path)) == ['timesheet.json']
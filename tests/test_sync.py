@@ -0,0 +1,104 @@
+
+import asyncio
+import threading
+
+import pytest
+
+import core
+import store
+from sync_server import SyncServer
+
+@pytest.fixture
+def sync_server(tmp_path):
+    # A sync server on a free port, on its own event loop thread
+    loop = asyncio.new_event_loop()
+    server = SyncServer(str(tmp_path / 'sync.log'))
+    listener = loop.run_until_complete(asyncio.start_server(server.handle_client, '127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    listener.close()
+    loop.close()
+
+class Machines:
+    # Two timesheets synced through one server; on(name) points core at one
+    def __init__(self, tmp_path, monkeypatch, url):
+        self.paths = {}
+        for name in ('a', 'b'):
+            (tmp_path / name).mkdir()
+            self.paths[name] = str(tmp_path / name / 'timesheet.json')
+        self.monkeypatch = monkeypatch
+        self.url = url
+
+    def on(self, name):
+        self.monkeypatch.setattr(core, 'DATA_FILE', self.paths[name])
+
+    def sync(self, name):
+        self.on(name)
+        return core.sync(self.url)
+
+    def sessions(self, name):
+        self.on(name)
+        return {project_name: [(session['start_time'], session['end_time']) for session in core.all_sessions(project_name)]
+                for project_name in core.load_data()['projects']}
+
+    def close(self):
+        for path in self.paths.values():
+            data_store = store._stores.pop(path, None)
+            if data_store is not None:
+                data_store.close()
+
+@pytest.fixture
+def machines(data_file, tmp_path, monkeypatch, sync_server):
+    machines = Machines(tmp_path, monkeypatch, sync_server)
+    yield machines
+    machines.close()
+
+def test_changes_reach_the_other_machine(machines):
+    machines.on('a')
+    core.commit({'op': 'start', 'project': 'Shared', 'time': 1000.0})
+    core.commit({'op': 'stop', 'project': 'Shared', 'time': 1100.0})
+    machines.sync('a')
+    assert machines.sync('b') == (0, 1)
+    assert machines.sessions('b') == machines.sessions('a') == {'Shared': [(1000.0, 1100.0)]}
+
+def test_conflicting_changes_converge_on_the_winning_stamp(machines):
+    machines.on('a')
+    core.commit({'op': 'start', 'project': 'Shared', 'time': 1000.0})
+    machines.sync('a')
+    machines.sync('b')
+
+    # B stops the session first and syncs
+    machines.on('b')
+    core.commit({'op': 'stop', 'project': 'Shared', 'time': 1105.0})
+    machines.sync('b')
+
+    # A made more changes since, so its clock is ahead and its stop wins
+    machines.on('a')
+    for start in (2000.0, 3000.0):
+        core.commit({'op': 'start' if start == 2000.0 else 'resume', 'project': 'Other', 'time': start})
+        core.commit({'op': 'stop', 'project': 'Other', 'time': start + 10})
+    core.commit({'op': 'stop', 'project': 'Shared', 'time': 1506.0})
+    machines.sync('a')
+    machines.sync('b')
+
+    assert machines.sessions('a')['Shared'] == [(1000.0, 1506.0)]
+    assert machines.sessions('b') == machines.sessions('a')
+    # Nothing left to exchange once they agree
+    assert machines.sync('a') == (0, 0)
+    assert machines.sync('b') == (0, 0)
+    assert machines.sessions('b') == machines.sessions('a')
+
+def test_deletes_travel(machines):
+    machines.on('a')
+    core.commit({'op': 'start', 'project': 'Gone', 'time': 1000.0})
+    core.commit({'op': 'stop', 'project': 'Gone', 'time': 1100.0})
+    machines.sync('a')
+    machines.sync('b')
+    machines.on('b')
+    core.delete_project('Gone')
+    machines.sync('b')
+    machines.sync('a')
+    assert machines.sessions('a') == machines.sessions('b') == {}
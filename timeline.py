@@ -0,0 +1,164 @@
+
+# Index of every session as a time interval, for "what was I doing between
+# X and Y" across all projects. Closed sessions are kept sorted by start in
+# length classes: class c holds the sessions shorter than 2**c seconds, so the
+# ones overlapping [start, end) all start in (start - 2**c, end) and are found
+# with two bisects per class. A query costs O(log n) per class plus the
+# sessions it returns, instead of a pass over every session of every project.
+# Open sessions are few and kept apart.
+#
+# The store builds the index on the first query and keeps it up to date with
+# its own commits (apply); anything else, such as a change by another process,
+# a rename or a delete, makes it build a new one. Archived months are only
+# read when a query reaches into them.
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from archive import period_bounds
+from session_columns import SessionColumns
+
+def length_class(length):
+    # Smallest c with length < 2**c
+    return int(max(0, length)).bit_length()
+
+class IntervalIndex:
+    def __init__(self, archive=None):
+        self.classes = {}  # {length class: (starts, ends, project names)}, by start
+        self.running = {}  # {project name: start of its open session}
+        self.archive = archive
+        self.deferred = []  # [(project name, sessions, closed sessions at the front)]
+        self.pending = []  # [(period start, latest end, filename, [(archive key, count, project name)])]
+        self.generation = None
+
+    def add(self, start, end, project_name):
+        starts, ends, names = self._bucket(length_class(end - start))
+        position = bisect_right(starts, start)
+        starts.insert(position, start)
+        ends.insert(position, end)
+        names.insert(position, project_name)
+
+    def _bucket(self, group):
+        bucket = self.classes.get(group)
+        if bucket is None:
+            bucket = self.classes[group] = (array('d'), array('d'), [])
+        return bucket
+
+    def add_many(self, intervals):
+        # Bulk load of (start, end, project name); sorting once beats
+        # inserting one at a time
+        grouped = {}
+        for interval in intervals:
+            grouped.setdefault(length_class(interval[1] - interval[0]), []).append(interval)
+        for group, members in grouped.items():
+            members.sort(key=lambda interval: interval[0])
+            starts, ends, names = self._bucket(group)
+            if starts:
+                members = sorted(list(zip(starts, ends, names)) + members, key=lambda interval: interval[0])
+                del starts[:], ends[:], names[:]
+            starts.extend(interval[0] for interval in members)
+            ends.extend(interval[1] for interval in members)
+            names.extend(interval[2] for interval in members)
+
+    def apply(self, records):
+        # Follows records that were just applied to the data; False for one
+        # it can't follow, and the index has to be rebuilt
+        for record in records:
+            op = record['op']
+            if op in ('start', 'resume'):
+                self.running[record['project']] = record['time']
+            elif op == 'stop':
+                self.add(self.running.pop(record['project']), record['time'], record['project'])
+            elif op == 'import':
+                for project_name, sessions in record['sessions'].items():
+                    for session in sessions:
+                        self.add(session['start_time'], session['end_time'], project_name)
+            elif op not in ('pause', 'resume_paused'):
+                return False
+        return True
+
+    def _load_deferred(self):
+        closed = []
+        for project_name, sessions, count in self.deferred:
+            for start, end in islice(session_intervals(sessions), count):
+                closed.append((start, end, project_name))
+        self.deferred = []
+        self.add_many(closed)
+
+    def _load_archived(self, start, end):
+        still_pending = []
+        for entry in self.pending:
+            period_start, latest_end, filename, members = entry
+            if period_start < end and latest_end > start:
+                intervals = []
+                for key, count, project_name in members:
+                    for session in self.archive.period_sessions(filename, key, count):
+                        intervals.append((session['start_time'], session['end_time'], project_name))
+                self.add_many(intervals)
+            else:
+                still_pending.append(entry)
+        self.pending = still_pending
+
+    def overlapping(self, start, end):
+        # [(start, end or None, project name)] of the sessions with any part
+        # in [start, end), ordered by start
+        if self.deferred:
+            self._load_deferred()
+        if self.pending:
+            self._load_archived(start, end)
+        result = []
+        for group, (starts, ends, names) in self.classes.items():
+            lo = bisect_right(starts, start - 2 ** group)
+            hi = bisect_left(starts, end)
+            for idx in range(lo, hi):
+                if ends[idx] > start:
+                    result.append((starts[idx], ends[idx], names[idx]))
+        result.extend((session_start, None, project_name)
+                      for project_name, session_start in self.running.items() if session_start < end)
+        result.sort(key=lambda row: (row[0], row[2]))
+        return result
+
+def session_intervals(sessions):
+    # (start, end) of each session, read from the arrays when the sessions
+    # are SessionColumns
+    if isinstance(sessions, SessionColumns):
+        return zip(sessions.starts, sessions.ends)
+    return ((session['start_time'], session['end_time']) for session in sessions)
+
+def build_index(data, archive=None):
+    # Only the open sessions are looked at here, which is all the overlap
+    # check on start needs. The closed ones are read on the first range query;
+    # until then the lists are safe to hold on to, as transitions only append
+    # to them or change the open session at the end, and archiving and
+    # importing put a new list in place.
+    index = IntervalIndex(archive)
+    for project_name, project in data['projects'].items():
+        sessions = project['sessions']
+        count = len(sessions)
+        if count:
+            if sessions[-1]['end_time'] is None:
+                index.running[project_name] = sessions[-1]['start_time']
+                count -= 1
+            index.deferred.append((project_name, sessions, count))
+
+    archive_ends = data.get('archive_ends', {})
+    for period, filename in data.get('archive_files', {}).items():
+        members = [(project['archived']['key'], project['archived']['periods'][period], project_name)
+                   for project_name, project in data['projects'].items()
+                   if period in project.get('archived', {}).get('periods', {})]
+        if members:
+            # Without a recorded end, assume the month's sessions may reach any time
+            index.pending.append((period_bounds(period)[0], archive_ends.get(period, float('inf')), filename, members))
+    return index
+
+def find_overlaps(rows):
+    # [(earlier row, later row)] for sessions of different projects that
+    # overlap, from rows ordered by start as overlapping() returns them
+    overlaps = []
+    active = []
+    for row in rows:
+        active = [other for other in active if other[1] is None or other[1] > row[0]]
+        overlaps.extend((other, row) for other in active if other[2] != row[2])
+        active.append(row)
+    return overlaps
@@ -0,0 +1,78 @@
+
+import tkinter as tk
+from tkinter import ttk
+from tkinter import messagebox
+from datetime import date, datetime, timedelta
+
+import core
+from core import format_clock, format_time
+
+SPANS = ['day', 'week']
+
+class TimelineWindow:
+    # What was worked on when, across all projects, for one day or one week.
+    # Sessions of different projects that overlap are highlighted.
+    def __init__(self, root):
+        self.window = tk.Toplevel(root)
+        self.window.title("Timeline")
+
+        controls = ttk.Frame(self.window, padding=(5, 5))
+        controls.pack(fill='x')
+        ttk.Label(controls, text="Day (YYYY-MM-DD):").pack(side='left')
+        self.day_entry = ttk.Entry(controls, width=12)
+        self.day_entry.insert(0, date.today().isoformat())
+        self.day_entry.pack(side='left', padx=(2, 10))
+        ttk.Label(controls, text="Show:").pack(side='left')
+        self.span_var = tk.StringVar(value='day')
+        ttk.Combobox(controls, textvariable=self.span_var, values=SPANS,
+                     state='readonly', width=8).pack(side='left', padx=(2, 10))
+        ttk.Button(controls, text="Previous", command=lambda: self.step(-1)).pack(side='left', padx=2)
+        ttk.Button(controls, text="Next", command=lambda: self.step(1)).pack(side='left', padx=2)
+        ttk.Button(controls, text="Show", command=self.refresh).pack(side='left', padx=2)
+
+        columns = ('Day', 'Start', 'End', 'Project Name', 'Duration', 'Overlaps')
+        self.tree = ttk.Treeview(self.window, columns=columns, show='headings')
+        for column in columns:
+            self.tree.heading(column, text=column)
+        self.tree.column('Day', width=100)
+        self.tree.column('Start', width=80)
+        self.tree.column('End', width=80)
+        self.tree.column('Project Name', width=200)
+        self.tree.column('Duration', width=100)
+        self.tree.column('Overlaps', width=200)
+        self.tree.tag_configure('overlap', background='#f4c7c3')
+        self.tree.pack(fill='both', expand=True)
+
+        self.refresh()
+
+    def days(self):
+        # (first day, number of days), or None if the day can't be read
+        try:
+            day = date.fromisoformat(self.day_entry.get().strip())
+        except ValueError:
+            messagebox.showerror("Invalid Date", "Please enter the day as YYYY-MM-DD.", parent=self.window)
+            return None
+        if self.span_var.get() == 'week':
+            return day - timedelta(days=day.weekday()), 7
+        return day, 1
+
+    def step(self, direction):
+        days = self.days()
+        if days:
+            first_day, count = days
+            self.day_entry.delete(0, 'end')
+            self.day_entry.insert(0, (first_day + timedelta(days=direction * count)).isoformat())
+            self.refresh()
+
+    def refresh(self):
+        days = self.days()
+        if not days:
+            return
+        first_day, count = days
+        start = datetime.combine(first_day, datetime.min.time()).timestamp()
+        end = datetime.combine(first_day + timedelta(days=count), datetime.min.time()).timestamp()
+        self.tree.delete(*self.tree.get_children())
+        for day, piece_start, piece_end, project_name, others, is_open in core.timeline_rows(core.timeline(start, end), start, end):
+            self.tree.insert('', 'end', tags=('overlap',) if others else (), values=(
+                day.isoformat(), format_clock(piece_start, day), 'now' if is_open else format_clock(piece_end, day),
+                project_name, format_time(piece_end - piece_start), ', '.join(others)))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# Command line entry point for scripts, shell hooks and cron:
+#   timesheet start|stop|pause|resume <project>
+#   timesheet status
+#   timesheet report [--csv FILE] [--from DAY] [--to DAY] [--by day|week|month]
+#   timesheet timeline [DAY] [--week] [--from HH:MM] [--to HH:MM]
+#   timesheet analytics [--from DAY] [--to DAY]
+#   timesheet aggregate DIR|FILE|GLOB... [--csv FILE] [--workers N]
+#   timesheet import FILE... [--dry-run]
+#   timesheet undo|redo
+#   timesheet sync [--server URL]
+# Only imports core, so it never loads tkinter.
+
+import sys
+import argparse
+from datetime import date, datetime, time, timedelta
+
+import core
+from rollups import GRANULARITIES
+from transitions import TransitionError
+
+def print_overlaps(project_name):
+    note = core.overlap_note(project_name)
+    if note:
+        print(note.strip())
+
+def cmd_start(args):
+    # Starting an existing, stopped project opens a new session on it
+    data = core.load_data()
+    project = data['projects'].get(args.project)
+    if project and project['status'] == 'Stopped':
+        core.resume_project(args.project)
+        print(f"Resumed working on project '{args.project}'")
+    else:
+        core.start_project(args.project)
+        print(f"Started working on project '{args.project}'")
+    print_overlaps(args.project)
+
+def cmd_stop(args):
+    elapsed_time = core.stop_project(args.project)
+    print(f"Stopped working on project '{args.project}'")
+    print(f"Time spent this session: {core.format_time(elapsed_time)}")
+
+def cmd_pause(args):
+    core.pause_project(args.project)
+    print(f"Paused project '{args.project}'")
+
+def cmd_resume(args):
+    # Resumes a paused project, or opens a new session on a stopped one
+    project = core.load_data()['projects'].get(args.project)
+    if project and project['status'] == 'Stopped':
+        core.resume_project(args.project)
+        print(f"Resumed working on project '{args.project}'")
+    else:
+        core.resume_paused_project(args.project)
+        print(f"Resumed project '{args.project}' from pause")
+    print_overlaps(args.project)
+
+def cmd_status(args):
+    print(core.status_text(core.status()).strip())
+
+def cmd_report(args):
+    if args.by or args.date_from or args.date_to:
+        # Time per project per day/week/month from the rollups
+        today = date.today()
+        start_day = args.date_from or today.replace(day=1)
+        end_day = args.date_to or today
+        print(core.breakdown_text(core.breakdown(start_day, end_day, args.by or 'day')).rstrip('\n'))
+        return
+    totals = core.report()
+    if not totals:
+        print("No time recorded yet.")
+    else:
+        print(core.report_text(totals))
+    if args.csv:
+        core.export_report_to_csv(args.csv)
+        print(f"Report exported to {args.csv}")
+
+def cmd_timeline(args):
+    # Sessions of all projects on a day (or in its week), between two times
+    first_day = args.day or date.today()
+    last_day = first_day
+    if args.week:
+        first_day -= timedelta(days=first_day.weekday())
+        last_day = first_day + timedelta(days=6)
+    start = datetime.combine(first_day, args.time_from or time.min).timestamp()
+    if args.time_to:
+        end = datetime.combine(last_day, args.time_to).timestamp()
+    else:
+        end = datetime.combine(last_day + timedelta(days=1), time.min).timestamp()
+    print(core.timeline_text(core.timeline_rows(core.timeline(start, end), start, end)).rstrip('\n'))
+
+def cmd_analytics(args):
+    # Session lengths and the hours of the week worked, over every session
+    # or those starting from..to
+    import analytics
+    start = datetime.combine(args.date_from, time.min).timestamp() if args.date_from else None
+    end = datetime.combine(args.date_to + timedelta(days=1), time.min).timestamp() if args.date_to else None
+    print(analytics.analytics_text(core.analytics(start, end)))
+
+def cmd_aggregate(args):
+    # Imported here so the everyday commands don't pay for it
+    import aggregate
+    paths = aggregate.collect_paths(args.sources)
+    if not paths:
+        raise TransitionError("No Files", "No timesheet files matched.")
+    rows, errors = aggregate.aggregate(paths, args.workers)
+    for path, error in errors:
+        print(f"Skipped {path}: {error}", file=sys.stderr)
+    print(f"Read {len(paths) - len(errors)} of {len(paths)} files.")
+    print(aggregate.aggregate_text(rows))
+    if args.csv:
+        aggregate.write_aggregate_csv(args.csv, rows)
+        print(f"Report exported to {args.csv}")
+
+def cmd_import(args):
+    import importer
+    try:
+        result = importer.import_files(args.files, dry_run=args.dry_run)
+    except OSError as e:
+        raise TransitionError("Import Failed", str(e))
+    print(importer.import_text(result, dry_run=args.dry_run))
+
+def cmd_undo(args):
+    label = core.undo()
+    print(f"Undid: {label}" if label else "Nothing to undo.")
+
+def cmd_redo(args):
+    label = core.redo()
+    print(f"Redid: {label}" if label else "Nothing to redo.")
+
+def cmd_sync(args):
+    sent, received = core.sync(args.server)
+    print(f"Sent {sent} change(s), received {received}.")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='timesheet', description="Stefan's Timesheet Tracker")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, func, help_text in [
+        ('start', cmd_start, "start a new project, or a new session on a stopped one"),
+        ('stop', cmd_stop, "stop the running or paused session"),
+        ('pause', cmd_pause, "pause the running session"),
+        ('resume', cmd_resume, "resume a paused session or a stopped project"),
+    ]:
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument('project')
+        command.set_defaults(func=func)
+
+    command = subparsers.add_parser('status', help="show running and paused projects")
+    command.set_defaults(func=cmd_status)
+
+    command = subparsers.add_parser('report', help="show total time per project")
+    command.add_argument('--csv', metavar='FILE', help="also export the detailed report to a CSV file")
+    command.add_argument('--from', dest='date_from', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                         help="break the time down by period, starting on this day (default: first of the month)")
+    command.add_argument('--to', dest='date_to', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                         help="last day of the breakdown (default: today)")
+    command.add_argument('--by', choices=GRANULARITIES, help="period of the breakdown (default: day)")
+    command.set_defaults(func=cmd_report)
+
+    command = subparsers.add_parser('timeline', help="show what was worked on when, across all projects")
+    command.add_argument('day', nargs='?', type=date.fromisoformat, metavar='YYYY-MM-DD', help="default: today")
+    command.add_argument('--week', action='store_true', help="the whole week (Monday to Sunday) of the day")
+    command.add_argument('--from', dest='time_from', type=time.fromisoformat, metavar='HH:MM',
+                         help="start at this time of the (first) day")
+    command.add_argument('--to', dest='time_to', type=time.fromisoformat, metavar='HH:MM',
+                         help="end at this time of the (last) day")
+    command.set_defaults(func=cmd_timeline)
+
+    command = subparsers.add_parser('analytics', help="show session length percentiles, pauses and when work happens")
+    command.add_argument('--from', dest='date_from', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                         help="only sessions starting on or after this day")
+    command.add_argument('--to', dest='date_to', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                         help="only sessions starting on or before this day")
+    command.set_defaults(func=cmd_analytics)
+
+    command = subparsers.add_parser('aggregate', help="combine many people's timesheet files into one report")
+    command.add_argument('sources', nargs='+', metavar='SOURCE', help="timesheet file, directory of them, or glob")
+    command.add_argument('--csv', metavar='FILE', help="write per-person, per-project totals to a CSV file")
+    command.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    command.set_defaults(func=cmd_aggregate)
+
+    command = subparsers.add_parser('import', help="import finished sessions from CSV or JSONL files")
+    command.add_argument('files', nargs='+', metavar='FILE',
+                         help="CSV (e.g. an exported report) or .jsonl event log / session list")
+    command.add_argument('--dry-run', action='store_true', help="check the files without changing anything")
+    command.set_defaults(func=cmd_import)
+
+    command = subparsers.add_parser('undo', help="undo the last start, stop, pause, resume, rename, delete or clear")
+    command.set_defaults(func=cmd_undo)
+
+    command = subparsers.add_parser('redo', help="redo the last undone change")
+    command.set_defaults(func=cmd_redo)
+
+    command = subparsers.add_parser('sync', help="exchange changes with the timesheets on other machines")
+    command.add_argument('--server', metavar='URL',
+                         help="sync server, remembered for next time (default TIMESHEET_SYNC_SERVER or http://127.0.0.1:8766)")
+    command.set_defaults(func=cmd_sync)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except TransitionError as e:
+        print(f"{e.title}: {e.message}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
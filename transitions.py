@@ -0,0 +1,372 @@
+
+# Every change to the timesheet is described by a small record such as
+# {'op': 'pause', 'project': 'Website', 'time': 1700000000.0}. apply_record is
+# the only place that turns a record into a change of the data, so the same
+# record can be applied live, appended to a journal and replayed later.
+
+from archive import session_bounds
+from rollups import add_session, remove_session
+
+class TransitionError(Exception):
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+        self.message = message
+
+def new_session(start_time):
+    return {
+        'start_time': start_time,
+        'end_time': None,
+        'lap_time': 0,
+        'pauses': [],
+        'total_paused_time': 0
+    }
+
+def _get_project(data, project_name):
+    project = data['projects'].get(project_name)
+    if not project:
+        raise TransitionError("Project Not Found", f"Project '{project_name}' does not exist.")
+    return project
+
+def _start(data, record):
+    project_name = record['project']
+    if project_name in data['projects']:
+        raise TransitionError("Project Exists", f"Project '{project_name}' already exists.")
+    data['projects'][project_name] = {
+        'status': 'Running',
+        'sessions': [new_session(record['time'])],
+        'total_time': 0
+    }
+
+def _resume(data, record):
+    project_name = record['project']
+    project = _get_project(data, project_name)
+    if project['status'] != 'Stopped':
+        raise TransitionError("Cannot Resume Project", f"Project '{project_name}' is not stopped.")
+    project['status'] = 'Running'
+    project['sessions'].append(new_session(record['time']))
+
+def _stop(data, record):
+    project_name = record['project']
+    project = _get_project(data, project_name)
+    if project['status'] not in ['Running', 'Paused']:
+        raise TransitionError("Project Not Active", f"Project '{project_name}' is not currently running or paused.")
+
+    current_session = project['sessions'][-1]
+    if project['status'] == 'Paused':
+        # End the current pause
+        pause = current_session['pauses'][-1]
+        pause['pause_end'] = record['time']
+        current_session['total_paused_time'] += record['time'] - pause['pause_start']
+
+    current_session['end_time'] = record['time']
+    elapsed_time = (current_session['end_time'] - current_session['start_time']) - current_session.get('total_paused_time', 0)
+    current_session['lap_time'] = elapsed_time
+
+    project['total_time'] += elapsed_time
+    project['status'] = 'Stopped'
+
+    # Keep the per-day totals current once a report has built them
+    if 'rollups' in data:
+        add_session(data['rollups'].setdefault(project_name, {}), current_session)
+
+def _pause(data, record):
+    project_name = record['project']
+    project = data['projects'].get(project_name)
+    if not project or project['status'] != 'Running':
+        raise TransitionError("Cannot Pause", f"Project '{project_name}' is not running.")
+    project['sessions'][-1]['pauses'].append({'pause_start': record['time'], 'pause_end': None})
+    project['status'] = 'Paused'
+
+def _resume_paused(data, record):
+    project_name = record['project']
+    project = data['projects'].get(project_name)
+    if not project or project['status'] != 'Paused':
+        raise TransitionError("Cannot Resume", f"Project '{project_name}' is not paused.")
+    current_session = project['sessions'][-1]
+    pause = current_session['pauses'][-1]
+    pause['pause_end'] = record['time']
+    current_session['total_paused_time'] += record['time'] - pause['pause_start']
+    project['status'] = 'Running'
+
+def _delete(data, record):
+    _get_project(data, record['project'])
+    del data['projects'][record['project']]
+    if 'rollups' in data:
+        data['rollups'].pop(record['project'], None)
+
+def _rename(data, record):
+    old_project_name = record['project']
+    new_project_name = record['new_name']
+    _get_project(data, old_project_name)
+    if new_project_name in data['projects']:
+        raise TransitionError("Name Conflict", f"A project named '{new_project_name}' already exists.")
+    data['projects'][new_project_name] = data['projects'].pop(old_project_name)
+    if 'rollups' in data and old_project_name in data['rollups']:
+        data['rollups'][new_project_name] = data['rollups'].pop(old_project_name)
+
+def split_import(existing, sessions):
+    # Sorts closed sessions for one project into (accepted, duplicates,
+    # overlaps) against its existing sessions and each other. Both lists are
+    # in start order. A duplicate has the same start and end to the second,
+    # which is also how a session comes back from the CSV export.
+    seen = {(int(session['start_time']), int(session['end_time'] or 0)) for session in existing}
+    accepted, duplicates, overlaps = [], [], []
+    i = 0
+    last_end = float('-inf')
+    for session in sessions:
+        while i < len(existing) and existing[i]['start_time'] <= session['start_time']:
+            end_time = existing[i]['end_time']
+            last_end = max(last_end, float('inf') if end_time is None else end_time)
+            i += 1
+        key = (int(session['start_time']), int(session['end_time']))
+        if key in seen:
+            duplicates.append(session)
+        elif session['start_time'] < last_end or (i < len(existing) and existing[i]['start_time'] < session['end_time']):
+            overlaps.append(session)
+        else:
+            accepted.append(session)
+            seen.add(key)
+            last_end = session['end_time']
+    return accepted, duplicates, overlaps
+
+def _import(data, record):
+    # record['sessions'] is {project name: [closed session, ...]} in start
+    # order, already checked by the importer against the data it saw. If
+    # anything changed since, the whole import is refused.
+    for project_name, sessions in record['sessions'].items():
+        project = data['projects'].get(project_name)
+        _, duplicates, overlaps = split_import(project['sessions'] if project else [], sessions)
+        if duplicates or overlaps:
+            raise TransitionError("Import Conflict", f"Sessions of project '{project_name}' changed during the import; please import again.")
+
+    for project_name, sessions in record['sessions'].items():
+        project = data['projects'].setdefault(project_name, {'status': 'Stopped', 'sessions': [], 'total_time': 0})
+        # Both lists are sorted, so this is a linear merge. A running session
+        # stays last because anything starting after it would overlap it.
+        project['sessions'] = sorted(project['sessions'] + sessions, key=lambda session: session['start_time'])
+        project['total_time'] += sum(session['lap_time'] for session in sessions)
+        if 'rollups' in data:
+            project_rollups = data['rollups'].setdefault(project_name, {})
+            for session in sessions:
+                add_session(project_rollups, session)
+
+def _clear(data, record):
+    data['projects'] = {}
+    data['rollups'] = {}
+
+def copy_session(session):
+    # A plain dict of a session, whatever form it is held in. Records that
+    # carry sessions are applied to more than one copy of the data (the
+    # background writer, the journal replay), so they never hand out their own.
+    return {
+        'start_time': session['start_time'],
+        'end_time': session['end_time'],
+        'lap_time': session['lap_time'],
+        'pauses': [{'pause_start': pause['pause_start'], 'pause_end': pause.get('pause_end')}
+                   for pause in session.get('pauses', [])],
+        'total_paused_time': session.get('total_paused_time', 0)
+    }
+
+def _restore(data, record):
+    # Puts whole projects back, as the undo of a delete or a clear.
+    # record['projects'] = {name: {'status', 'total_time', 'sessions'}} with
+    # every session, archived ones included; record['rollups'] = {name:
+    # per-day totals} where the data had them.
+    for project_name in record['projects']:
+        if project_name in data['projects']:
+            raise TransitionError("Cannot Undo", f"A project named '{project_name}' exists again.")
+    for project_name, project in record['projects'].items():
+        sessions = [copy_session(session) for session in project['sessions']]
+        data['projects'][project_name] = {
+            'status': project['status'],
+            'sessions': sessions,
+            'total_time': project['total_time']
+        }
+        if 'rollups' in data:
+            project_rollups = record.get('rollups', {}).get(project_name)
+            if project_rollups is None:
+                project_rollups = {}
+                for session in sessions:
+                    if session['end_time'] is not None:
+                        add_session(project_rollups, session)
+            data['rollups'][project_name] = dict(project_rollups)
+
+def _revert(data, record):
+    # Takes one project back to before a start, resume, stop, pause or
+    # resume_paused: its sessions from record['keep'] on are replaced by
+    # record['sessions'], copies of what they were, and a project that
+    # didn't exist before (status None) goes. record['expect'] is the
+    # [status, session count] it was left with; anything else means it has
+    # changed since and the undo is refused.
+    project_name = record['project']
+    project = data['projects'].get(project_name)
+    if not project or [project['status'], len(project['sessions'])] != record['expect']:
+        raise TransitionError("Cannot Undo", f"Project '{project_name}' has changed since.")
+    sessions = project['sessions']
+    keep = record['keep']
+    tail = [copy_session(session) for session in record['sessions']]
+    if 'rollups' in data:
+        project_rollups = data['rollups'].setdefault(project_name, {})
+        for session in sessions[keep:]:
+            if session['end_time'] is not None:
+                remove_session(project_rollups, session)
+        for session in tail:
+            if session['end_time'] is not None:
+                add_session(project_rollups, session)
+    if record['status'] is None:
+        del data['projects'][project_name]
+        if 'rollups' in data:
+            data['rollups'].pop(project_name, None)
+        return
+    # A new sequence rather than changing the old one, which views and the
+    # timeline index may still be reading
+    if isinstance(sessions, list):
+        sessions = sessions[:keep] + tail
+    else:
+        sessions = sessions[:keep]
+        for session in tail:
+            sessions.append(session)
+    project['sessions'] = sessions
+    project['status'] = record['status']
+    project['total_time'] = record['total_time']
+
+def session_status(sessions):
+    # What a project is doing, going by its last session
+    if not sessions or sessions[-1]['end_time'] is not None:
+        return 'Stopped'
+    pauses = sessions[-1]['pauses']
+    return 'Paused' if pauses and pauses[-1]['pause_end'] is None else 'Running'
+
+def _merge(data, record):
+    # Sessions changed on other machines, as sync.py pulls them:
+    # record['changes'] = {name: [[start_time, session, or None for one that
+    # was deleted], ...]}. Only the project's sessions from the earliest
+    # change on are gone through. A project in record['whole'] is sent with
+    # every session it has, archived ones included, and is rebuilt from them.
+    whole = record.get('whole', [])
+    for project_name, changes in record['changes'].items():
+        project = data['projects'].get(project_name)
+        rebuild = project is None or project_name in whole
+        sessions = [] if project is None else project['sessions']
+        if rebuild:
+            keep, old_tail = 0, []
+        else:
+            keep = session_bounds(sessions, min(start_time for start_time, _ in changes))[0]
+            old_tail = [copy_session(sessions[idx]) for idx in range(keep, len(sessions))]
+        merged = {session['start_time']: session for session in old_tail}
+        for start_time, session in changes:
+            if session is None:
+                merged.pop(start_time, None)
+            else:
+                merged[start_time] = copy_session(session)
+        tail = [merged[start_time] for start_time in sorted(merged)]
+
+        if not keep and not tail and (rebuild or 'archived' not in project):
+            # Nothing of it is left on any machine
+            data['projects'].pop(project_name, None)
+            if 'rollups' in data:
+                data['rollups'].pop(project_name, None)
+            continue
+        if rebuild:
+            project = data['projects'][project_name] = {'status': 'Stopped', 'sessions': [], 'total_time': 0}
+        if 'rollups' in data:
+            project_rollups = data['rollups'].setdefault(project_name, {})
+            if rebuild:
+                project_rollups.clear()
+            for session in old_tail:
+                if session['end_time'] is not None:
+                    remove_session(project_rollups, session)
+            for session in tail:
+                if session['end_time'] is not None:
+                    add_session(project_rollups, session)
+        lap_times = sum(session['lap_time'] for session in tail)
+        if rebuild:
+            sessions = tail
+            project['total_time'] = lap_times
+        else:
+            project['total_time'] += lap_times - sum(session['lap_time'] for session in old_tail)
+            # A new sequence, as in _revert
+            if isinstance(sessions, list):
+                sessions = sessions[:keep] + tail
+            else:
+                sessions = sessions[:keep]
+                for session in tail:
+                    sessions.append(session)
+        project['sessions'] = sessions
+        project['status'] = session_status(sessions)
+
+APPLY = {
+    'start': _start,
+    'resume': _resume,
+    'stop': _stop,
+    'pause': _pause,
+    'resume_paused': _resume_paused,
+    'delete': _delete,
+    'rename': _rename,
+    'clear': _clear,
+    'import': _import,
+    'restore': _restore,
+    'revert': _revert,
+    'merge': _merge,
+}
+
+def apply_record(data, record):
+    # Validates the record against the current state before touching anything,
+    # so a rejected record leaves the data unchanged
+    APPLY[record['op']](data, record)
+
+def try_apply(data, record):
+    # apply_record for batches: returns the TransitionError instead of raising
+    try:
+        apply_record(data, record)
+    except TransitionError as e:
+        return e
+    return None
+
+# Status a project is left with by each session transition
+STATUS_AFTER = {
+    'start': 'Running',
+    'resume': 'Running',
+    'stop': 'Stopped',
+    'pause': 'Paused',
+    'resume_paused': 'Running',
+}
+
+def inverse_record(data, record, all_sessions):
+    # The record that undoes record, worked out from data as it is just
+    # before record is applied; None for a record that can't be undone.
+    # It carries only what record changes: one session for a transition,
+    # names for a rename, the removed projects for a delete or a clear.
+    # all_sessions(project name) returns every session of a project with
+    # the archived ones, which a restored project gets back in full because
+    # its archived months may be rewritten without it in the meantime.
+    op = record['op']
+    if op in STATUS_AFTER:
+        project_name = record['project']
+        project = data['projects'].get(project_name)
+        if project is None:
+            return {'op': 'revert', 'project': project_name, 'expect': ['Running', 1],
+                    'keep': 0, 'sessions': [], 'status': None, 'total_time': 0}
+        count = len(project['sessions'])
+        if op == 'resume' or not count:
+            keep, tail = count, []
+        else:
+            keep, tail = count - 1, [copy_session(project['sessions'][-1])]
+        return {'op': 'revert', 'project': project_name,
+                'expect': [STATUS_AFTER[op], count + 1 if op == 'resume' else count],
+                'keep': keep, 'sessions': tail, 'status': project['status'], 'total_time': project['total_time']}
+    if op in ('delete', 'clear'):
+        names = [record['project']] if op == 'delete' else list(data['projects'])
+        if any(project_name not in data['projects'] for project_name in names):
+            return None
+        rollups = data.get('rollups', {})
+        return {'op': 'restore',
+                'projects': {project_name: {'status': data['projects'][project_name]['status'],
+                                            'total_time': data['projects'][project_name]['total_time'],
+                                            'sessions': all_sessions(project_name)}
+                             for project_name in names},
+                'rollups': {project_name: rollups[project_name] for project_name in names if project_name in rollups}}
+    if op == 'rename':
+        return {'op': 'rename', 'project': record['new_name'], 'new_name': record['project']}
+    return None
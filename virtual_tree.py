@@ -0,0 +1,169 @@
+
+from tkinter import ttk
+from collections import OrderedDict
+
+# Rows are fetched and cached in blocks of this size
+BLOCK_SIZE = 100
+# Blocks kept in memory at once
+MAX_BLOCKS = 16
+# Rows loaded ahead of and behind the visible window
+PREFETCH_ROWS = BLOCK_SIZE
+
+class VirtualTreeview(ttk.Frame):
+    # A Treeview that only ever holds the rows that are on screen. The rows
+    # themselves come from fetch_rows(start, stop), which returns the values
+    # of rows start..stop-1; they are requested in blocks as the view
+    # scrolls, so opening a view of a million rows costs the same as ten.
+    def __init__(self, parent, columns, fetch_rows, row_count=0, height=20):
+        super().__init__(parent)
+        self.fetch_rows = fetch_rows
+        self.row_count = row_count
+        self.offset = 0
+        self.visible_rows = height
+        self.blocks = OrderedDict()  # {block index: [row values]}
+        self.items = []  # item ids of the on-screen rows, top to bottom
+        self.item_values = {}  # {item_id: values currently shown}
+        self.selected_row = None
+        self.prefetch_id = None
+
+        self.tree = ttk.Treeview(self, columns=columns, show='headings', selectmode='browse', height=height)
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.on_scrollbar)
+        self.scrollbar.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+
+        self.tree.bind('<<TreeviewSelect>>', self.on_select, add='+')
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1, 'units', 3))
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-1, 'units', 3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(1, 'units', 3))
+        self.tree.bind('<Up>', lambda event: self.move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self.move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self.scroll(-1, 'pages'))
+        self.tree.bind('<Next>', lambda event: self.scroll(1, 'pages'))
+
+        self.render()
+
+    def set_row_count(self, row_count, keep_position=False):
+        # The underlying rows changed: drop cached blocks and redraw
+        self.row_count = row_count
+        self.blocks.clear()
+        if not keep_position:
+            self.offset = 0
+            self.selected_row = None
+        self.render()
+
+    def refresh_rows(self):
+        # Re-read the rows on screen without throwing away the position
+        self.blocks.clear()
+        self.render()
+
+    def get_row(self, index):
+        block_index = index // BLOCK_SIZE
+        block = self.blocks.get(block_index)
+        if block is None:
+            start = block_index * BLOCK_SIZE
+            block = self.fetch_rows(start, min(start + BLOCK_SIZE, self.row_count))
+            self.blocks[block_index] = block
+            if len(self.blocks) > MAX_BLOCKS:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(block_index)
+        return block[index - block_index * BLOCK_SIZE]
+
+    def render(self):
+        self.offset = max(0, min(self.offset, self.row_count - self.visible_rows))
+        count = max(0, min(self.visible_rows, self.row_count - self.offset))
+
+        while len(self.items) < count:
+            self.items.append(self.tree.insert('', 'end', values=()))
+        while len(self.items) > count:
+            item_id = self.items.pop()
+            self.item_values.pop(item_id, None)
+            self.tree.delete(item_id)
+
+        for position, item_id in enumerate(self.items):
+            values = self.get_row(self.offset + position)
+            if self.item_values.get(item_id) != values:
+                self.tree.item(item_id, values=values)
+                self.item_values[item_id] = values
+
+        # Keep the selection on the same row, not the same on-screen slot
+        selected_item = self.item_for_row(self.selected_row)
+        if selected_item is None:
+            if self.tree.selection():
+                self.tree.selection_remove(self.tree.selection())
+        elif self.tree.selection() != (selected_item,):
+            self.tree.selection_set(selected_item)
+
+        if self.row_count:
+            self.scrollbar.set(self.offset / self.row_count, (self.offset + count) / self.row_count)
+        else:
+            self.scrollbar.set(0, 1)
+
+        if self.prefetch_id is None:
+            self.prefetch_id = self.after_idle(self.prefetch)
+
+    def prefetch(self):
+        # Load the blocks just outside the visible window while idle
+        self.prefetch_id = None
+        for index in [self.offset - PREFETCH_ROWS, self.offset + self.visible_rows + PREFETCH_ROWS]:
+            if 0 <= index < self.row_count and index // BLOCK_SIZE not in self.blocks:
+                self.get_row(index)
+
+    def item_for_row(self, row):
+        if row is None or not self.offset <= row < self.offset + len(self.items):
+            return None
+        return self.items[row - self.offset]
+
+    def row_values(self, row):
+        return self.get_row(row)
+
+    def scroll(self, number, what='units', step=1):
+        if what == 'pages':
+            step = max(1, self.visible_rows - 1)
+        self.offset += number * step
+        self.render()
+        return 'break'
+
+    def scroll_to(self, row):
+        if row < self.offset:
+            self.offset = row
+        elif row >= self.offset + self.visible_rows:
+            self.offset = row - self.visible_rows + 1
+        self.render()
+
+    def move_selection(self, step):
+        if not self.row_count:
+            return 'break'
+        if self.selected_row is None:
+            row = self.offset
+        else:
+            row = max(0, min(self.selected_row + step, self.row_count - 1))
+        self.selected_row = row
+        self.scroll_to(row)
+        self.event_generate('<<VirtualSelect>>')
+        return 'break'
+
+    def on_scrollbar(self, command, *args):
+        if command == 'moveto':
+            self.offset = int(float(args[0]) * self.row_count)
+            self.render()
+        elif command == 'scroll':
+            self.scroll(int(args[0]), args[1])
+
+    def on_select(self, event):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        row = self.offset + self.items.index(selection[0])
+        if row != self.selected_row:
+            self.selected_row = row
+            self.event_generate('<<VirtualSelect>>')
+
+    def on_configure(self, event):
+        # Show as many rows as fit in the widget
+        rowheight = ttk.Style().lookup('Treeview', 'rowheight') or 20
+        visible_rows = max(1, (event.height - 25) // int(rowheight))
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render()